@@ -0,0 +1,118 @@
+'''
+Benchmark of parse_date_from_string on the date tags of the newspapers of
+config.yaml
+
+usage: python benchmark_date_parser.py [--articles 500] [--rounds 3]
+
+The date tags are generated in the format returned by the date_xpath of each
+newspaper, for random published dates. One in ten tags of a newspaper is in
+one of its other formats, e.g. a date without time, to check that learning
+formats doesn't change the parsed dates. A round parses the tags of all
+articles, as done by the crawl sessions of a running crawler.
+'''
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from loguru import logger
+
+from libs.config import ConfigManager
+from libs.date_parser import DateParser
+
+# date tag of an article published at date, by newspaper of config.yaml
+TAG_FORMATS = {
+    'genk': lambda date: date.strftime('%Y-%m-%dT%H:%M:%S'),
+    'Tinhte': lambda date: date.strftime('%d/%m/%Y %H:%M'),
+    'Cafebiz': lambda date: date.strftime('%d/%m/%Y %I:%M %p'),
+    'Codeaholicguy': lambda date: date.strftime('%Y-%m-%dT%H:%M:%S+07:00'),
+    'vuilaptrinh': lambda date: date.strftime(
+        'https://vuilaptrinh.com/%Y-%m-%d-bai-viet-{}/'.format(date.microsecond)),
+    'topdev.vn': lambda date: date.strftime('%Y-%m-%dT%H:%M:%S+07:00'),
+    "Nam Vo 's Blog": lambda date: date.strftime('%Y-%m-%dT%H:%M:%S+07:00'),
+    'Viblo': lambda date: date.strftime('%Y-%m-%d %H:%M:%S'),
+    'Toidicodedao': lambda date: date.strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+}
+
+# other date tags found on the pages of newspapers of TAG_FORMATS
+OTHER_TAG_FORMATS = {
+    'Tinhte': [lambda date: date.strftime('Thứ hai, %d/%m/%Y'),
+               lambda date: date.strftime('%H:%M %d/%m/%Y')],
+    'Cafebiz': [lambda date: date.strftime('%d/%m/%Y'),
+                lambda date: date.strftime('%H:%M, %d/%m/%Y')],
+    'Viblo': [lambda date: date.strftime('%Y-%m-%d')],
+    'genk': [lambda date: date.strftime('%d/%m/%Y %H:%M')],
+}
+
+
+def make_corpus(webconfigs, articles, seed=0):
+    '''
+    output
+    ------
+    list of (date tag, webconfig) of articles of all newspapers, interleaved
+    '''
+    rand = random.Random(seed)
+    start = datetime(2019, 1, 1)
+    corpus = []
+    for webconfig in webconfigs:
+        tag_format = TAG_FORMATS.get(webconfig.get_webname())
+        if tag_format is None:
+            continue
+        other_tag_formats = OTHER_TAG_FORMATS.get(webconfig.get_webname(), [])
+        for _ in range(articles):
+            date = start + timedelta(
+                seconds=rand.randrange(3 * 365 * 24 * 3600),
+                microseconds=rand.randrange(1000000))
+            if other_tag_formats and rand.random() < 0.1:
+                corpus.append((rand.choice(other_tag_formats)(date), webconfig))
+            else:
+                corpus.append((tag_format(date), webconfig))
+    rand.shuffle(corpus)
+    return corpus
+
+
+def run(parser, corpus, rounds):
+    results = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        results = [
+            parser.parse(tagstring, webconfig) for tagstring, webconfig in corpus]
+    return time.perf_counter() - start, results
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    argparser.add_argument('--config', default='./libs/config/config.yaml')
+    argparser.add_argument('--articles', type=int, default=500,
+                           help='articles by newspaper')
+    argparser.add_argument('--rounds', type=int, default=3)
+    args = argparser.parse_args()
+    # warnings of unparsable dates are not part of the benchmark
+    logger.remove()
+
+    config_manager = ConfigManager(args.config)
+    config_manager.load_data()
+    corpus = make_corpus(config_manager.get_newspaper_list(), args.articles)
+    print("{} date tags of {} newspapers, {} rounds".format(
+        len(corpus), len({webconfig.get_webname() for _, webconfig in corpus}),
+        args.rounds))
+
+    parsers = [
+        ('formats in order', DateParser(learn=False, cache_size=0)),
+        ('learned format', DateParser(cache_size=0)),
+        ('learned format, memoized', DateParser()),
+    ]
+    baseline = None
+    for name, parser in parsers:
+        elapsed, results = run(parser, corpus, args.rounds)
+        if baseline is None:
+            baseline = (elapsed, results)
+        elif results != baseline[1]:
+            raise ValueError('{} parsed different dates'.format(name))
+        print("{:<26} {:8.3f}s {:10.1f} tags/s  x{:.2f}".format(
+            name, elapsed, len(corpus) * args.rounds / elapsed, baseline[0] / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,20 @@
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
 from selenium.webdriver.firefox.options import Options
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
 import random
+import re
 import os
-from time import sleep
+import threading
 from loguru import logger
 
 
+# last step of an xpath selecting attributes or texts rather than elements
+NON_ELEMENT_STEP = re.compile(r'/(@[\w:-]+|text\(\))$')
+
+
 def get_independent_os_path(path_list):
     path = ""
     for item in path_list:
@@ -148,7 +157,7 @@ class BrowserCrawler:
         try:
             self._driver.get(url)
             if prevent_auto_redirect:
-                sleep(3)
+                self.wait_until_ready(wait)
                 print('reload url to prevent auto redirect')
                 self._driver.get(url)
             return True
@@ -158,6 +167,24 @@ class BrowserCrawler:
             self._has_error = True
             return False
 
+    def wait_until_ready(self, wait, xpath=''):
+        '''
+        function: wait until the page is loaded and, if xpath is set, until it has
+        an element matching xpath
+        output: False if the page is not ready after wait seconds
+        '''
+        try:
+            WebDriverWait(self._driver, wait).until(
+                lambda driver:
+                    driver.execute_script('return document.readyState') == 'complete')
+            if xpath:
+                WebDriverWait(self._driver, wait).until(
+                    expected_conditions.presence_of_element_located((By.XPATH, xpath)))
+            return True
+        except TimeoutException:
+            logger.info("Page is not ready after {} seconds", wait)
+            return False
+
     def get_title(self):
         # Function: return page title
         return self._driver.title
@@ -180,3 +207,123 @@ class BrowserCrawler:
 
         self._driver.quit()
         self._quited = True
+
+
+def get_wait_xpath(url, webconfig):
+    '''
+    function: get xpath of an element the browser waits for before reading url
+    output: browser_wait_xpath of webconfig if set, else the topics xpaths on the
+    crawl url and the content xpaths on detail pages, as one union
+    '''
+    wait_xpath = webconfig.get_browser_wait_xpath()
+    if wait_xpath:
+        return wait_xpath
+
+    if url.rstrip('/') == webconfig.get_crawl_url().rstrip('/'):
+        xpaths = webconfig.get_topics_xpath()
+    elif webconfig.get_detail_content():
+        xpaths = webconfig.get_content_xpath()
+    else:
+        return ''
+    if isinstance(xpaths, str):
+        xpaths = [xpaths]
+    # only elements can be waited for, not attributes or texts
+    xpaths = [xpath for xpath in xpaths if xpath and not NON_ELEMENT_STEP.search(xpath)]
+    return ' | '.join(dict.fromkeys(xpaths))
+
+
+class BrowserPool:
+    '''
+    pool of Firefox browsers shared by the newspapers that use a browser
+
+    algorithm
+    ---------
+    the pool holds size slots. Threads loading a page wait for a free slot, and
+    take the one whose browser already has the settings of their newspaper, else
+    one without browser, else any other. The browser of a slot is created on first
+    use, created again if a newspaper needs other settings, and recycled after
+    max_pages_per_browser pages, to bound the memory used by long running browsers.
+    '''
+
+    def __init__(self, size=2, max_pages_per_browser=50):
+        self.size = size
+        self._max_pages_per_browser = max_pages_per_browser
+        # [browser, settings of the browser, number of pages loaded]
+        self._free_slots = [[None, None, 0] for _ in range(size)]
+        self._condition = threading.Condition()
+
+    def get_page_html(self, url, webconfig):
+        '''
+        function: load url in a browser of the pool
+        output: page html, None if the page can't be loaded
+        '''
+        settings = (
+            webconfig.get_display_browser(),
+            webconfig.get_browser_fast_load(),
+            webconfig.get_browser_profile())
+        slot = self._take_slot(settings)
+        try:
+            browser, browser_settings, count = slot
+            if browser is not None and (
+                    browser_settings != settings or
+                    count >= self._max_pages_per_browser):
+                logger.info("Recycle browser after {} pages", count)
+                self._quit_browser(browser)
+                browser = None
+            if browser is None:
+                display_browser, fast_load, profile_name = settings
+                browser = BrowserCrawler(
+                    display_browser=display_browser,
+                    fast_load=fast_load,
+                    profile_name=profile_name)
+                count = 0
+            slot[:] = [browser, settings, count + 1]
+
+            logger.info("load page: {}", url)
+            timeout = webconfig.get_browser_timeout()
+            if not browser.load_page(url, webconfig.get_prevent_auto_redirect(), timeout):
+                return None
+            browser.wait_until_ready(timeout, get_wait_xpath(url, webconfig))
+            return browser.get_page_html()
+        except Exception as ex:
+            logger.exception(ex)
+            logger.error("Can't load {} in browser", url)
+            if slot[0] is not None:
+                self._quit_browser(slot[0])
+            slot[:] = [None, None, 0]
+            return None
+        finally:
+            self._put_slot(slot)
+
+    def _take_slot(self, settings):
+        with self._condition:
+            self._condition.wait_for(lambda: self._free_slots)
+            slot = next(
+                (slot for slot in self._free_slots
+                    if slot[0] is not None and slot[1] == settings),
+                None)
+            if slot is None:
+                slot = next(
+                    (slot for slot in self._free_slots if slot[0] is None),
+                    self._free_slots[0])
+            self._free_slots.remove(slot)
+            return slot
+
+    def _put_slot(self, slot):
+        with self._condition:
+            self._free_slots.append(slot)
+            self._condition.notify()
+
+    def quit(self):
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._free_slots) == self.size)
+            for slot in self._free_slots:
+                if slot[0] is not None:
+                    self._quit_browser(slot[0])
+                slot[:] = [None, None, 0]
+
+    def _quit_browser(self, browser):
+        try:
+            browser.quit()
+        except Exception as ex:
+            logger.exception(ex)
@@ -189,6 +189,12 @@ class WebConfig:
     def get_browser_profile(self):
         return self.get_config('browser_profile', None)
 
+    def get_browser_wait_xpath(self):
+        '''
+        function: get xpath of an element the browser waits for before reading a page
+        '''
+        return self.get_config('browser_wait_xpath', '')
+
     def get_contain_filter(self):
         return self.get_config("contain", "")
 
@@ -402,6 +408,34 @@ class ConfigManager:
         # wait n second before continuing to crawl to avoid blocked
         return int(self._config['waiting_time_between_each_crawl'])
 
+    def get_maximum_concurrent_newspapers(self):
+        # number of newspapers crawled at the same time
+        return int(self.get_config('maximum_concurrent_newspapers', 8))
+
+    def get_maximum_connections_per_domain(self):
+        # number of requests sent to a website at the same time
+        return int(self.get_config('maximum_connections_per_domain', 2))
+
+    def get_browser_pool_size(self):
+        # number of browsers shared by the newspapers that use a browser
+        return int(self.get_config('browser_pool_size', 2))
+
+    def get_maximum_pages_per_browser(self):
+        # number of pages after which a browser is recycled
+        return int(self.get_config('maximum_pages_per_browser', 50))
+
+    def get_seen_urls_path(self):
+        # SQLite database of the urls of stored articles
+        return self.get_config('seen_urls_path', 'seen_urls.db')
+
+    def get_postgres_batch_size(self):
+        # number of articles inserted in Postgres at once
+        return int(self.get_config('postgres_batch_size', 200))
+
+    def get_postgres_flush_interval(self):
+        # seconds a crawled article waits at most before being inserted in Postgres
+        return int(self.get_config('postgres_flush_interval', 30))
+
     def get_crawling_interval(self):
         return int(self._config['crawling_interval'])
 
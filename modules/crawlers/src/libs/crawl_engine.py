@@ -0,0 +1,165 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import aiohttp
+from loguru import logger
+
+HEADERS = {
+    'user-agent': 'mozilla/5.0 (x11; linux x86_64)\
+        applewebkit/537.11 (khtml, like gecko) chrome/23.0.1271.64 safari/537.11',
+    'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'accept-charset': 'utf-8;q=0.7,*;q=0.3',
+    'accept-language': 'en-us,en;q=0.8'}
+
+# seconds before a request is given up
+REQUEST_TIMEOUT = 30
+# seconds an idle connection is kept open for the next request to its host
+KEEPALIVE_TIMEOUT = 60
+
+
+class DomainThrottle:
+    '''
+    politeness limits of a domain: at most max_connections requests at a time,
+    started at least delay + random() * jitter seconds apart
+    '''
+
+    def __init__(self, max_connections, delay, jitter):
+        self._semaphore = asyncio.Semaphore(max_connections)
+        self._lock = asyncio.Lock()
+        self._delay = delay
+        self._jitter = jitter
+        self._next_start = 0.0
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        try:
+            async with self._lock:
+                wait = self._next_start - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self._next_start = time.monotonic() + self._delay +\
+                    random.random() * self._jitter
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, *args):
+        self._semaphore.release()
+
+
+class AsyncFetcher:
+    '''
+    fetch pages through one pool of keep-alive connections, shared by all
+    newspapers, with the politeness limits of DomainThrottle on each domain
+    '''
+
+    def __init__(
+            self, max_connections=64, max_connections_per_domain=2,
+            delay=3, jitter=3):
+        self._max_connections = max_connections
+        self._max_connections_per_domain = max_connections_per_domain
+        self._delay = delay
+        self._jitter = jitter
+        self._throttles = dict()
+        self._session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self._max_connections,
+            limit_per_host=self._max_connections_per_domain,
+            keepalive_timeout=KEEPALIVE_TIMEOUT)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers=HEADERS,
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+        return self
+
+    async def __aexit__(self, *args):
+        await self._session.close()
+
+    def get_throttle(self, url):
+        domain = urlsplit(url).netloc.lower()
+        if domain not in self._throttles:
+            self._throttles[domain] = DomainThrottle(
+                self._max_connections_per_domain, self._delay, self._jitter)
+        return self._throttles[domain]
+
+    async def fetch(self, url):
+        '''
+        output
+        ------
+        page source, None if can't read url
+        '''
+        async with self.get_throttle(url):
+            try:
+                async with self._session.get(url) as response:
+                    if response.status != 200:
+                        logger.error("Can't open {}: status {}", url, response.status)
+                        return None
+                    body = await response.read()
+                    return body.decode(response.charset or 'utf-8', errors='replace')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+                logger.error("Can't open {}: {!r}", url, ex)
+                return None
+
+
+class CrawlEngine:
+    '''
+    crawl newspapers concurrently
+
+    algorithm
+    ---------
+    the event loop runs all http requests through AsyncFetcher. Each newspaper is
+    parsed by ArticleManager in a worker thread, whose requests are submitted to
+    the event loop. Newspapers that use a browser load their pages in the browsers
+    of a BrowserPool, so as many of them run at a time as there are browsers.
+    '''
+
+    def __init__(self, data_manager, config_manager):
+        self._data_manager = data_manager
+        self._config_manager = config_manager
+
+    def run(self, webconfigs, browser):
+        asyncio.run(self._run(webconfigs, browser))
+
+    async def _run(self, webconfigs, browser):
+        loop = asyncio.get_running_loop()
+        config_manager = self._config_manager
+        http_executor = ThreadPoolExecutor(
+            max_workers=config_manager.get_maximum_concurrent_newspapers())
+        browser_executor = ThreadPoolExecutor(
+            max_workers=config_manager.get_browser_pool_size())
+
+        fetcher = AsyncFetcher(
+            max_connections_per_domain=config_manager
+            .get_maximum_connections_per_domain(),
+            delay=config_manager.get_waiting_time_between_crawl())
+        async with fetcher:
+            def fetch_url(url):
+                # called from worker threads, blocks until the page is fetched
+                return asyncio.run_coroutine_threadsafe(
+                    fetcher.fetch(url), loop).result()
+
+            tasks = []
+            for webconfig in webconfigs:
+                executor = browser_executor if webconfig.get_use_browser()\
+                    else http_executor
+                tasks.append(loop.run_in_executor(
+                    executor, self._crawl_newspaper, webconfig, browser, fetch_url))
+            await asyncio.gather(*tasks)
+
+        http_executor.shutdown()
+        browser_executor.shutdown()
+
+    def _crawl_newspaper(self, webconfig, browser, fetch_url):
+        logger.info("Crawling newspaper {}", webconfig.get_webname())
+        try:
+            self._data_manager.add_articles_from_newspaper(
+                webconfig, browser, fetch_url=fetch_url)
+        except Exception as ex:
+            logger.exception(ex)
+            logger.error("Can't crawl {}", webconfig.get_webname())
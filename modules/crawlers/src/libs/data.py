@@ -204,8 +204,23 @@ class ArticleManager:
 
     def __init__(self, config_manager):
         self._config_manager = config_manager
+        self._seen_urls = None
+        self._article_writer = None
         self._id_iterator = 0
 
+    def set_seen_urls(self, seen_urls):
+        '''
+        :param seen_urls: SeenUrls of the articles stored by previous runs,\
+            which are skipped before visiting them
+        '''
+        self._seen_urls = seen_urls
+
+    def set_article_writer(self, article_writer):
+        '''
+        :param article_writer: ArticleWriter storing new articles as they are crawled
+        '''
+        self._article_writer = article_writer
+
     def update_last_run(self):
         self._last_run = get_utc_now_date()
 
@@ -279,7 +294,8 @@ class ArticleManager:
 
     def get_topic_of_an_url(
             self, url, webconfig,
-            detail_page_html_tree=None, browser=None, extract_xpath=''):
+            detail_page_html_tree=None, browser=None, extract_xpath='',
+            fetch_url=None):
         '''
         function
         --------
@@ -297,7 +313,7 @@ class ArticleManager:
 
         if detail_page_html_tree is None:
             # try:
-            html = read_url_source(url, webconfig, browser)
+            html = read_url_source(url, webconfig, browser, fetch_url)
             if html is None:
                 return None
 
@@ -325,7 +341,8 @@ class ArticleManager:
 
     def get_time_of_an_url(
             self, url, webconfig,
-            detail_page_html_tree, browser=None, index=0, date_xpath=""):
+            detail_page_html_tree, browser=None, index=0, date_xpath="",
+            fetch_url=None):
         '''
         function
         --------
@@ -341,7 +358,7 @@ class ArticleManager:
 
         if detail_page_html_tree is None:
             try:
-                html = read_url_source(url, webconfig, browser)
+                html = read_url_source(url, webconfig, browser, fetch_url)
                 if html is None:
                     return None
                 else:
@@ -410,8 +427,8 @@ class ArticleManager:
                     (my_newspaper.strip() == article.get_newspaper().strip()):
                 return True
 
-        for key in self._new_article:
-            article = self._new_article[key]
+        # articles are added concurrently by the threads of CrawlEngine
+        for article in list(self._new_article.values()):
             first_topic = article.get_topic().strip()
             second_topic = topic.strip()
             if first_topic[-4:] == 'icon':
@@ -429,7 +446,8 @@ class ArticleManager:
         return False
 
     def investigate_if_link_is_valid_article(
-            self, link, webconfig, home_html_tree, browser, xpath_index, topic_index):
+            self, link, webconfig, home_html_tree, browser, xpath_index, topic_index,
+            fetch_url=None):
         '''
         function
         --------
@@ -449,6 +467,7 @@ class ArticleManager:
             in situation that topic and\
                 date lies in them same\
                     page like Facebook Page)
+        - fetch_url: function fetching pages, see read_url_source
         return:
         (topic, publish_date, sapo, content, feature_image_url) or\
             None if link is not an article
@@ -502,7 +521,8 @@ class ArticleManager:
                     webconfig,
                     detail_page_html_tree=detail_page_html_tree,
                     browser=browser,
-                    extract_xpath=extract_xpath)
+                    extract_xpath=extract_xpath,
+                    fetch_url=fetch_url)
             has_visit = True
             if result is not None:
                 if result is not False:
@@ -545,7 +565,8 @@ class ArticleManager:
                     detail_page_html_tree=detail_page_html_tree,
                     browser=browser,
                     index=topic_index,
-                    date_xpath=date_xpath)
+                    date_xpath=date_xpath,
+                    fetch_url=fetch_url)
 
                 has_visit = True
             else:
@@ -555,7 +576,8 @@ class ArticleManager:
                     detail_page_html_tree=home_html_tree,
                     browser=browser,
                     index=topic_index,
-                    date_xpath=date_xpath)
+                    date_xpath=date_xpath,
+                    fetch_url=fetch_url)
 
         if result is not None:  # found an article
             if result is not False:
@@ -913,17 +935,23 @@ class ArticleManager:
             return (None, has_visit)
 
     def is_in_database(self, href):
-        return href in self._data
+        if href in self._data:
+            return True
+        return self._seen_urls is not None and href in self._seen_urls
 
     def add_article(self, new_article):
         self._new_article[new_article.get_id()] = new_article
+        if self._article_writer is not None:
+            self._article_writer.add(new_article)
 
-    def add_articles_from_newspaper(self, webconfig, browser):
+    def add_articles_from_newspaper(self, webconfig, browser, fetch_url=None):
         '''
         function: crawl articles from a specific website
         input:
             - webconfig: config of this newspaper
             - browser: browser that is used to crawl this newspaper
+            - fetch_url: function fetching pages, which then waits between\
+                requests itself, see read_url_source
         '''
         # cdn_manager = CDNManager(self._config_manager)
         # get web config properites
@@ -944,7 +972,7 @@ class ArticleManager:
         a = True
         while a is True:
             count_visit += 1
-            html = read_url_source(crawl_url, webconfig, browser)
+            html = read_url_source(crawl_url, webconfig, browser, fetch_url)
 
             if html is not None:
                 logger.info("Getting data, please wait...")
@@ -979,7 +1007,8 @@ class ArticleManager:
                                         html_tree,
                                         browser,
                                         xpath_index,
-                                        topic_index)
+                                        topic_index,
+                                        fetch_url)
                                 if has_visit_page:
                                     count_visit += 1
 
@@ -1034,7 +1063,9 @@ class ArticleManager:
                                             logger.info("Crawled articles: %s" %
                                                         str(count_lay))
 
-                                        if has_visit_page:
+                                        throttled = fetch_url is not None and\
+                                            not webconfig.get_use_browser()
+                                        if has_visit_page and not throttled:
                                             # wait for n second before continue crawl
                                             waiting_time =\
                                                 self._config_manager\
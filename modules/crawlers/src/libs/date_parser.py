@@ -0,0 +1,158 @@
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from loguru import logger
+
+# (regular expression, strptime pattern) of the date formats of newspapers,
+# tried in order
+DATE_FORMATS = [
+    (r"(\d{1,2}:\d{1,2}.*\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})", '%H:%M, %d/%m/%Y'),
+    (r"(\d{1,2}:\d{1,2}:\d{1,2} \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
+     '%H:%M:%S %d/%m/%Y'),
+    (r"(\d{1,2}:\d{1,2} \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})", '%H:%M %d/%m/%Y'),
+    (r"(\d{1,2}:\d{1,2} \- \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
+     '%H:%M - %d/%m/%Y'),
+    (r"(\d{2,4}[\/\-\.]\d{1,2}[\/\-\.]\d{1,2}T\d{1,2}:\d{1,2})", '%Y-%m-%dT%H:%M'),
+    (r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \d{1,2}:\d{1,2} [AP]M)",
+     '%d/%m/%Y %I:%M %p'),
+    (r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \| \d{1,2}:\d{1,2})",
+     '%d/%m/%Y | %H:%M'),
+    (r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \d{1,2}:\d{1,2})", '%d/%m/%Y %H:%M'),
+    (r"(\d{1,2}:\d{1,2} ngày \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
+     '%H:%M ngày %d-%m-%Y'),
+    (r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}\, \d{1,2}:\d{1,2})",
+     '%d/%m/%Y, %H:%M'),
+    (r"(\d{1,2}:\d{1,2}\, \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
+     '%H:%M, %d/%m/%Y'),
+    (r"(\d{1,2}:\d{1,2}' \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})", "%H:%M' %d/%m/%Y"),
+    (r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \d{1,2}:\d{1,2}:\d{1,2} (A|P)M)",
+     "%m/%d/%Y %I:%M:%S %p"),
+    (r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \- \d{1,2}:\d{1,2})",
+     "%d/%m/%Y - %H:%M"),
+    (r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \- \d{1,2}:\d{1,2} [AP]M)",
+     "%d-%m-%Y - %I:%M %p"),
+    (r"(\d{1,2}:\d{1,2} \| \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
+     "%H:%M | %d/%m/%Y"),
+    (r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})", "%d/%m/%Y"),
+    (r"(\d{2,4}[\/\-\.]\d{1,2}[\/\-\.]\d{1,2} \d{1,2}:\d{1,2})", "%Y-%m-%d %H:%M"),
+    (r"(\d{2,4}[\/\-\.]\d{1,2}[\/\-\.]\d{1,2})", "%Y-%m-%d"),
+    (r"(ngày \d{1,2} tháng \d{1,2} \, \d{2,4})", "ngày %d tháng %m , %Y"),
+    (r"(NGÀY \d{1,2} THÁNG \d{1,2}, \d{2,4} \| \d{1,2}:\d{1,2})",
+     "NGÀY %d THÁNG %m, %Y | %H:%M"),
+    (r"(Ngày \d{1,2} Tháng \d{1,2}, \d{2,4} \| \d{1,2}:\d{1,2})",
+     "Ngày %d Tháng %m, %Y | %H:%M"),
+    (r"(Ngày \d{1,2} tháng \d{1,2} năm \d{2,4})", "Ngày %d tháng %m năm %Y"),
+    (r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \d{1,2}:\d{1,2})", "%d-%m-%Y %H:%M"),
+]
+
+# the regular expressions of DATE_FORMATS match digits with \d only, so whether they
+# match a tag string doesn't change when its digits are replaced
+DIGIT = re.compile(r'\d', flags=re.UNICODE)
+
+# returned by DateParser.parse when a date is found but can't be parsed
+UNPARSABLE = 'unparsable'
+
+
+class DateParser:
+    '''
+    parse published dates with precompiled DATE_FORMATS
+
+    algorithm
+    ---------
+    formats are tried in order, but the format that parsed the last date of a
+    newspaper is tried first for the next dates of this newspaper. Its result
+    is only kept if none of the formats before it matches the tag string, so
+    that a date is always parsed with the same format as when trying formats
+    in order. The first matching format is memoized by tag string with digits
+    replaced, e.g. '00:00 00/00/0000'. Results are memoized by tag string,
+    because the same tags are found on many pages. A parser can be shared by
+    the threads of CrawlEngine.
+    '''
+
+    def __init__(self, date_formats=DATE_FORMATS, cache_size=10000, learn=True):
+        self._formats = [
+            (re.compile(date_re, flags=re.UNICODE), date_pattern)
+            for date_re, date_pattern in date_formats]
+        self._cache_size = cache_size
+        self._learn = learn
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._learned_index = dict()  # webname: index of the last parsed format
+        self._first_match = dict()  # tag string shape: index of first matching format
+
+    def parse(self, tagstring, webconfig):
+        '''
+        output
+        ------
+        naive datetime in the timezone of webconfig, UNPARSABLE if a date is
+        found but can't be parsed, False if no date is found
+        '''
+        tagstring = str(tagstring)
+        webname = webconfig.get_webname()
+        first_index = self._learned_index.get(webname)
+
+        with self._lock:
+            cached = self._cache.get(tagstring)
+            if cached is not None:
+                self._cache.move_to_end(tagstring)
+        if cached is not None:
+            index, result = cached
+        else:
+            index, result = self._parse(tagstring, first_index)
+            if self._cache_size > 0:
+                with self._lock:
+                    self._cache[tagstring] = (index, result)
+                    if len(self._cache) > self._cache_size:
+                        self._cache.popitem(last=False)
+
+        if self._learn and index is not None:
+            self._learned_index[webname] = index
+        return result
+
+    def _parse(self, tagstring, first_index):
+        if first_index is not None:
+            index, result = self._parse_with(tagstring, [first_index])
+            if index is not None and self._first_match_index(tagstring) == index:
+                return (index, result)
+
+        return self._parse_with(tagstring, range(len(self._formats)))
+
+    def _first_match_index(self, tagstring):
+        shape = DIGIT.sub('0', tagstring)
+        index = self._first_match.get(shape)
+        if index is None:
+            index = next(
+                (i for i, (date_filter, _) in enumerate(self._formats)
+                 if date_filter.search(shape)),
+                len(self._formats))
+            with self._lock:
+                if len(self._first_match) >= max(self._cache_size, 1000):
+                    self._first_match.clear()
+                self._first_match[shape] = index
+        return index
+
+    def _parse_with(self, tagstring, indexes):
+        parsable = False
+        for i in indexes:
+            date_filter, date_pattern = self._formats[i]
+            searchobj = date_filter.search(tagstring)
+            if not searchobj:
+                continue
+
+            parsable = True
+            searchstr = searchobj.group(1)
+            if i == 0:
+                firstcom = searchstr.find(',')
+                secondcom = searchstr.find(',', firstcom + 1)
+                searchstr = searchstr[:firstcom] + searchstr[secondcom:]
+
+            try:
+                return (i, datetime.strptime(searchstr, date_pattern))
+            except ValueError:
+                logger.debug(
+                    "Warning: published date {} is not in {} pattern",
+                    searchobj.group(1), date_pattern)
+
+        return (None, UNPARSABLE if parsable else False)
@@ -1,7 +1,10 @@
+from datetime import date
 from loguru import logger
 from libs.data import ArticleManager
 from libs.config import ConfigManager
-from libs.browser_crawler import BrowserWrapper
+from libs.browser_crawler import BrowserPool
+from libs.crawl_engine import CrawlEngine
+from libs.frontier import SeenUrls
 from libs.postgresql_client import PostgresClient
 
 
@@ -17,27 +20,48 @@ class Docbao_Crawler():
 
         self._data_manager =\
             ArticleManager(self._config_manager)  # article database object
+        self._seen_urls = None
 
     def load_data_from_file(self):
         # Load data from file
         self._config_manager.load_data(crawl_newspaper=self._crawl_newspaper)
         self._config_manager.print_crawl_list()
 
+        # urls of articles stored by previous runs
+        self._seen_urls = SeenUrls(self._config_manager.get_seen_urls_path())
+        self._data_manager.set_seen_urls(self._seen_urls)
+
     def run_crawler(self):
         logger.info("Start crawling...")
         crawl_queue = self._config_manager.get_newspaper_list()
         data_manager = self._data_manager
 
-        browser = BrowserWrapper()
+        article_writer = None
+        if self._export_to_postgres:
+            try:
+                postgres = PostgresClient()
+                # articles stored before the urls were recorded, or by other hosts
+                if self._seen_urls is not None:
+                    self._load_seen_urls(postgres)
+
+                # articles are inserted in batches while crawling
+                article_writer = postgres.create_writer(
+                    batch_size=self._config_manager.get_postgres_batch_size(),
+                    flush_interval=self._config_manager.get_postgres_flush_interval(),
+                    on_written=self._mark_seen)
+                data_manager.set_article_writer(article_writer)
+            except Exception as ex:
+                logger.exception(ex)
+
+        browser = BrowserPool(
+            size=self._config_manager.get_browser_pool_size(),
+            max_pages_per_browser=self._config_manager.get_maximum_pages_per_browser())
         crawled_articles = []
 
         try:
-            for webconfig in crawl_queue:
-
-                crawl_type = webconfig.get_crawl_type()
-                if crawl_type == "newspaper":
-                    logger.info("Crawling newspaper {}", webconfig.get_webname())
-                    data_manager.add_articles_from_newspaper(webconfig, browser)
+            newspapers = [webconfig for webconfig in crawl_queue
+                          if webconfig.get_crawl_type() == "newspaper"]
+            CrawlEngine(data_manager, self._config_manager).run(newspapers, browser)
 
             if len(data_manager._new_article.items()) > 0:
                 for article_id, article in data_manager._new_article.items():
@@ -66,13 +90,43 @@ class Docbao_Crawler():
                     rb_articles.append(article)
                     logger.info("{}: {}", article.get_newspaper(), article.get_topic())
 
-        if self._export_to_postgres:
+        if article_writer is not None:
             try:
-                # push to Postgres
-                postgres = PostgresClient()
-                for article in rb_articles:
-                    postgres.push_article(article)
+                # push remaining articles to Postgres
+                article_writer.close()
+                logger.info(
+                    "Inserted {} articles in Postgres, {} already stored, {} failed",
+                    *article_writer.counts)
             except Exception as ex:
                 logger.exception(ex)
 
         logger.info("FINISH ADD TO POSTGRE DATABASE...")
+
+    def _load_seen_urls(self, postgres):
+        '''
+        function: add the urls of articles stored in Postgres to the seen urls.\
+            All urls are loaded by the first run, next runs only load the urls of\
+            articles created since the newest article of the previous load
+        '''
+        loaded_date = self._seen_urls.get_state('postgres_created_date')
+        since = date.fromisoformat(loaded_date) if loaded_date else None
+        # read first, so that articles created while loading are loaded again
+        newest_date = postgres.get_newest_created_date()
+
+        count = 0
+        for hrefs in postgres.get_hrefs(since=since):
+            self._seen_urls.add_many(hrefs)
+            count += len(hrefs)
+        if newest_date is not None:
+            self._seen_urls.set_state('postgres_created_date', newest_date.isoformat())
+        logger.info("Loaded {} urls of articles stored in Postgres since {}",
+                    count, since or "the first article")
+
+    def _mark_seen(self, articles):
+        if self._seen_urls is None:
+            return
+        hrefs = dict()
+        for article in articles:
+            hrefs.setdefault(article.get_newspaper(), []).append(article.get_href())
+        for newspaper, newspaper_hrefs in hrefs.items():
+            self._seen_urls.add_many(newspaper_hrefs, newspaper)
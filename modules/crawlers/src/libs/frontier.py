@@ -0,0 +1,123 @@
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+
+from loguru import logger
+
+
+class BloomFilter:
+    '''
+    set of strings in a fixed size bit array, which can answer that a string
+    is in the set when it is not, with a probability of about error_rate
+    '''
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self._size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hash_count = max(1, round(self._size / capacity * math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'),\
+            int.from_bytes(digest[8:], 'little')
+        return [(first + i * second) % self._size for i in range(self._hash_count)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value))
+
+
+class SeenUrls:
+    '''
+    persistent set of the urls of stored articles, kept in a SQLite database
+
+    algorithm
+    ---------
+    a Bloom filter of all urls is built at startup, so that most new urls are
+    known to be unseen without a query. The filter is rebuilt with twice its
+    capacity when it is full. Other urls are looked up in the database.
+    '''
+
+    def __init__(self, path, capacity=100000):
+        self._path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS seen_url ('
+            'url TEXT PRIMARY KEY, newspaper TEXT, seen_at REAL)')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value TEXT)')
+        self._connection.commit()
+        self._lock = threading.Lock()
+        self._build_filter(capacity)
+
+    def _build_filter(self, capacity):
+        count = self._connection.execute('SELECT COUNT(*) FROM seen_url').fetchone()[0]
+        while capacity < count * 2:
+            capacity *= 2
+        self._filter = BloomFilter(capacity)
+        for (url,) in self._connection.execute('SELECT url FROM seen_url'):
+            self._filter.add(url)
+        logger.info("Loaded {} seen urls from {}", count, self._path)
+
+    def __contains__(self, url):
+        with self._lock:
+            if url not in self._filter:
+                return False
+            return self._connection.execute(
+                'SELECT 1 FROM seen_url WHERE url = ?', (url,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COUNT(*) FROM seen_url').fetchone()[0]
+
+    def add(self, url, newspaper=''):
+        self.add_many([url], newspaper)
+
+    def add_many(self, urls, newspaper=''):
+        '''
+        function: mark urls of articles of newspaper as seen
+        '''
+        with self._lock:
+            seen_at = time.time()
+            with self._connection:
+                self._connection.executemany(
+                    'INSERT OR IGNORE INTO seen_url VALUES (?, ?, ?)',
+                    ((url, newspaper, seen_at) for url in urls))
+            for url in urls:
+                if url not in self._filter:
+                    self._filter.add(url)
+            if self._filter.count > self._filter.capacity:
+                self._build_filter(self._filter.capacity * 2)
+
+    def get_state(self, name):
+        '''
+        output: value stored with set_state, None if there is none
+        '''
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT value FROM state WHERE name = ?', (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_state(self, name, value):
+        '''
+        function: store a value along with the urls, e.g. how far the urls were\
+            loaded from another database
+        '''
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO state VALUES (?, ?)', (name, value))
+
+    def close(self):
+        self._connection.close()
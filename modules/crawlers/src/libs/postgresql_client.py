@@ -7,8 +7,13 @@
 
 import random
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from collections import namedtuple
+from loguru import logger
+from sqlalchemy import create_engine, func, text
 from sqlalchemy import Column, String, Date
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from libs.data import Article
@@ -21,6 +26,10 @@ POSTGRES_PORT = os.environ['DOCBAO_POSTGRES_PORT']
 
 sqlalchemy_base = declarative_base()
 
+# result of inserting a batch of articles: number of inserted articles, number of
+# articles whose href was already stored, and list of articles that failed
+BatchResult = namedtuple('BatchResult', ['inserted', 'duplicates', 'failed'])
+
 
 class Postgres_Article(sqlalchemy_base):
     __tablename__ = POSTGRES_DB
@@ -42,32 +51,90 @@ class PostgresClient():
             f'@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}'
         db = create_engine(db_string)
         Session = sessionmaker(db)
+        self._engine = db
         self._session = Session()
         sqlalchemy_base.metadata.create_all(db)
+        self._conflict_target = self._create_href_index()
+
+    def _create_href_index(self):
+        '''
+        function: make href unique, so that inserting a stored article does nothing
+        output: columns of the conflicts of inserts, None for any unique column
+        '''
+        table = Postgres_Article.__tablename__
+        try:
+            with self._engine.begin() as connection:
+                connection.execute(text(
+                    f'CREATE UNIQUE INDEX IF NOT EXISTS "{table}_href_key" '
+                    f'ON "{table}" (href)'))
+            return ['href']
+        except Exception as ex:
+            logger.exception(ex)
+            logger.error("Can't make href unique, stored hrefs might be duplicated")
+            return None
 
     def push_article(self, article):
-        feature_image = article.get_feature_image()
-        feature_image_url = ''
-
-        if feature_image:
-            if feature_image[0] != '':
-                feature_image_url = feature_image[0]
-
-        new_article = Postgres_Article(
-            article_id=article.get_id(),
-            topic=article.get_topic(),
-            href=article.get_href(),
-            publish_date=article.get_date(),
-            newspaper=article.get_newspaper(),
-            created_date=article.get_creation_date(),
-            language=article.get_language(),
-            sapo=article.get_sapo(),
-            content=article.get_full_content(),
-            feature_image=feature_image_url
-        )
-
-        self._session.add(new_article)
-        self._session.commit()
+        return self.insert_articles([article])
+
+    def insert_articles(self, articles):
+        '''
+        function: insert articles with one multi-row INSERT ... ON CONFLICT (href)\
+            DO NOTHING. If it fails, articles are inserted one by one, so that\
+            one bad article doesn't drop the others
+        output: BatchResult
+        '''
+        if not articles:
+            return BatchResult(0, 0, [])
+        try:
+            inserted = self._insert_rows([_to_row(article) for article in articles])
+            return BatchResult(inserted, len(articles) - inserted, [])
+        except Exception as ex:
+            logger.exception(ex)
+            if len(articles) == 1:
+                return BatchResult(0, 0, articles)
+
+        results = [self.insert_articles([article]) for article in articles]
+        return BatchResult(
+            sum(result.inserted for result in results),
+            sum(result.duplicates for result in results),
+            [article for result in results for article in result.failed])
+
+    def _insert_rows(self, rows):
+        statement = insert(Postgres_Article.__table__).values(rows)\
+            .on_conflict_do_nothing(index_elements=self._conflict_target)
+        with self._engine.begin() as connection:
+            return connection.execute(statement).rowcount
+
+    def create_writer(self, batch_size=200, flush_interval=30, on_written=None):
+        return ArticleWriter(self, batch_size, flush_interval, on_written)
+
+    def get_newest_created_date(self):
+        '''
+        output: created_date of the newest stored article, None if there is none
+        '''
+        return self._session.query(func.max(Postgres_Article.created_date)).scalar()
+
+    def get_hrefs(self, since=None, batch_size=10000):
+        '''
+        input
+        -----
+        since: if given, only hrefs of articles created on or after this date
+
+        output: generator of lists of up to batch_size hrefs of stored articles
+        '''
+        batch = []
+        query = self._session.query(Postgres_Article.href)
+        if since is not None:
+            query = query.filter(Postgres_Article.created_date >= since)
+        query = query.yield_per(batch_size)
+        for (href,) in query:
+            if href:
+                batch.append(href)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
     def get_sample_articles(self):
         for article in self._session.query(Postgres_Article):
@@ -85,6 +152,103 @@ class PostgresClient():
             print()
 
 
+class ArticleWriter:
+    '''
+    buffer articles and insert them in batches with PostgresClient.insert_articles
+
+    algorithm
+    ---------
+    a batch is inserted when batch_size articles are buffered, or when the oldest
+    buffered article has waited flush_interval seconds, which a background thread
+    checks every second
+    '''
+
+    def __init__(self, client, batch_size=200, flush_interval=30, on_written=None):
+        '''
+        :param on_written: function called with the articles of each batch that\
+            are stored, inserted or already stored
+        '''
+        self._client = client
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._on_written = on_written
+
+        self._buffer = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        # number of inserted, already stored and failed articles
+        self.counts = [0, 0, 0]
+        threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def add(self, article):
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append(article)
+            full = len(self._buffer) >= self._batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                articles, self._buffer = self._buffer, []
+            if not articles:
+                return BatchResult(0, 0, [])
+
+            result = self._client.insert_articles(articles)
+            counts = (result.inserted, result.duplicates, len(result.failed))
+            self.counts = [total + count for total, count in zip(self.counts, counts)]
+            logger.info(
+                "Inserted {} articles in Postgres, {} already stored, {} failed",
+                *counts)
+
+            if self._on_written is not None:
+                failed = set(id(article) for article in result.failed)
+                self._on_written(
+                    [article for article in articles if id(article) not in failed])
+            return result
+
+    def close(self):
+        self._closed.set()
+        return self.flush()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(1):
+            with self._lock:
+                expired = self._buffer and\
+                    time.monotonic() - self._oldest >= self._flush_interval
+            if expired:
+                try:
+                    self.flush()
+                except Exception as ex:
+                    logger.exception(ex)
+
+
+def _to_row(article):
+    feature_image = article.get_feature_image()
+    feature_image_url = ''
+
+    if feature_image:
+        if feature_image[0] != '':
+            feature_image_url = feature_image[0]
+
+    return dict(
+        article_id=article.get_id(),
+        topic=article.get_topic(),
+        href=article.get_href(),
+        publish_date=article.get_date(),
+        newspaper=article.get_newspaper(),
+        created_date=article.get_creation_date(),
+        language=article.get_language(),
+        sapo=article.get_sapo(),
+        content=article.get_full_content(),
+        feature_image=feature_image_url
+    )
+
+
 # UNIT TEST
 if __name__ == '__main__':
     print("Testing Postgres_client module")
@@ -3,8 +3,8 @@ import re
 import codecs
 from datetime import datetime
 import os
-from libs.browser_crawler import BrowserCrawler
-import time
+from libs.browser_crawler import BrowserCrawler, BrowserPool
+from libs.date_parser import DateParser, UNPARSABLE
 import pytz
 from selenium import webdriver
 from lxml import etree
@@ -13,6 +13,7 @@ import unicodedata
 import requests
 from loguru import logger
 _firefox_browser = None
+_date_parser = DateParser()
 
 
 def remove_accents(s):
@@ -61,98 +62,14 @@ def get_date_string(
 
 def parse_date_from_string(tagstring, webconfig):
     # Try to parse date from tagstring, using all re & pattern provided
+    result = _date_parser.parse(tagstring, webconfig)
 
-    date_res = [
-        r"(\d{1,2}:\d{1,2}.*\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
-        r"(\d{1,2}:\d{1,2}:\d{1,2} \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
-        r"(\d{1,2}:\d{1,2} \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
-        r"(\d{1,2}:\d{1,2} \- \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
-        r"(\d{2,4}[\/\-\.]\d{1,2}[\/\-\.]\d{1,2}T\d{1,2}:\d{1,2})",
-        r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \d{1,2}:\d{1,2} [AP]M)",
-        r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \| \d{1,2}:\d{1,2})",
-        r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \d{1,2}:\d{1,2})",
-        r"(\d{1,2}:\d{1,2} ngày \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
-        r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}\, \d{1,2}:\d{1,2})",
-        r"(\d{1,2}:\d{1,2}\, \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
-        r"(\d{1,2}:\d{1,2}' \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
-        r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \d{1,2}:\d{1,2}:\d{1,2} (A|P)M)",
-        r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \- \d{1,2}:\d{1,2})",
-        r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \- \d{1,2}:\d{1,2} [AP]M)",
-        r"(\d{1,2}:\d{1,2} \| \d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
-        r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})",
-        r"(\d{2,4}[\/\-\.]\d{1,2}[\/\-\.]\d{1,2} \d{1,2}:\d{1,2})",
-        r"(\d{2,4}[\/\-\.]\d{1,2}[\/\-\.]\d{1,2})",
-        r"(ngày \d{1,2} tháng \d{1,2} \, \d{2,4})",
-        r"(NGÀY \d{1,2} THÁNG \d{1,2}, \d{2,4} \| \d{1,2}:\d{1,2})",
-        r"(Ngày \d{1,2} Tháng \d{1,2}, \d{2,4} \| \d{1,2}:\d{1,2})",
-        r"(Ngày \d{1,2} tháng \d{1,2} năm \d{2,4})",
-        r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4} \d{1,2}:\d{1,2})"]
-
-    date_patterns = [
-        '%H:%M, %d/%m/%Y',
-        '%H:%M:%S %d/%m/%Y',
-        '%H:%M %d/%m/%Y',
-        '%H:%M - %d/%m/%Y',
-        '%Y-%m-%dT%H:%M',
-        '%d/%m/%Y %I:%M %p',
-        '%d/%m/%Y | %H:%M',
-        '%d/%m/%Y %H:%M',
-        '%H:%M ngày %d-%m-%Y',
-        '%d/%m/%Y, %H:%M',
-        '%H:%M, %d/%m/%Y',
-        "%H:%M' %d/%m/%Y",
-        "%m/%d/%Y %I:%M:%S %p",
-        "%d/%m/%Y - %H:%M",
-        "%d-%m-%Y - %I:%M %p",
-        "%H:%M | %d/%m/%Y",
-        "%d/%m/%Y",
-        "%Y-%m-%d %H:%M",
-        "%Y-%m-%d",
-        "ngày %d tháng %m , %Y",
-        "NGÀY %d THÁNG %m, %Y | %H:%M",
-        "Ngày %d Tháng %m, %Y | %H:%M",
-        "Ngày %d tháng %m năm %Y",
-        "%d-%m-%Y %H:%M"]
-
-    count = len(date_res)
-
-    parsable = False
-
-    timezone = webconfig.get_timezone()
-
-    for i in range(0, count):
-        date_re = date_res[i]
-        date_pattern = date_patterns[i]
-
-        flags = re.UNICODE
-        filter = re.compile(date_re, flags=flags)
-
-        searchobj = filter.search(str(tagstring))
-
-        if searchobj:
-            parsable = True
-            searchstr = searchobj.group(1)
-            if i == 0:
-                firstcom = searchstr.find(',')
-                secondcom = searchstr.find(',', firstcom + 1)
-                searchstr = searchstr[:firstcom] + searchstr[secondcom:]
-
-            try:
-                result = datetime.strptime(
-                    searchstr, date_pattern)
-                result = timezone.localize(result).astimezone(pytz.utc)
-                return result
-            except Exception as ex:
-                logger.exception(ex)
-                logger.error(
-                    "Warning: published date {} is not in {} pattern",
-                    searchobj.group(1), date_pattern)
-        else:
-            pass
-
-    if parsable:
+    if result == UNPARSABLE:
         logger.info("Date found but can't parse exactly. Use current time instead")
         return get_utc_now_date()
+    elif result:
+        timezone = webconfig.get_timezone()
+        return timezone.localize(result).astimezone(pytz.utc)
     else:
         return False
 
@@ -244,11 +161,16 @@ def open_binary_file_to_read(filename):
         return None
 
 
-def read_url_source(url, webconfig, _firefox_browser=None):
+def read_url_source(url, webconfig, _firefox_browser=None, fetch_url=None):
     '''
     function: use browser to get url pagesource
     --------
 
+    input:
+    ------
+    _firefox_browser: BrowserWrapper of the browser to use, or BrowserPool
+    fetch_url: function fetching url pagesource, used instead of requests if set
+
     output:
     -------
     None if can't read url
@@ -275,7 +197,10 @@ def read_url_source(url, webconfig, _firefox_browser=None):
     # while a:
     try:
         html_source = None
-        if use_browser is False:
+        if use_browser is False and fetch_url is not None:
+            html_source = fetch_url(url)
+            result = html_source is not None
+        elif use_browser is False:
             try:
                 response = requests.get(url, headers=hdr, timeout=30)
             except Exception as ex:
@@ -286,6 +211,10 @@ def read_url_source(url, webconfig, _firefox_browser=None):
                 html_source = response.content.decode('utf-8')
             else:
                 html_source = response.text
+        elif isinstance(_firefox_browser, BrowserPool):
+            logger.info("use browser to open {}", url)
+            html_source = _firefox_browser.get_page_html(url, webconfig)
+            result = html_source is not None
         else:
             logger.info("use browser to open %{}", url)
             if _firefox_browser.get_browser() is not None:
@@ -305,7 +234,8 @@ def read_url_source(url, webconfig, _firefox_browser=None):
             logger.info("browser load page result {}", str(result))
             if result is True:
                 try:
-                    time.sleep(3)
+                    browser.wait_until_ready(
+                        timeout, webconfig.get_browser_wait_xpath())
                     html_source = browser.get_page_html()
                 except Exception as ex:
                     logger.exception(ex)
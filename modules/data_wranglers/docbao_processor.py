@@ -16,12 +16,15 @@ def main():
     #               LOOP ALL ARTICLES & CLEAN CONTENTS
     #                       BASED ON ViPreProcessor
     # -----------------------------------------------------------
-    for article in articles:
+    # Contents are segmented in batches by the VnCoreNLP servers
+    cleaned_documents = processor.clean_many(
+        [{"text": str(article["content"])} for article in articles]
+    )
+    for article, cleaned_document in zip(articles, cleaned_documents):
         # insert document record
         document_id = str(uuid4())
         topdup_article_id = str(article["article_id"])
-        content = str(article["content"])
-        doc = datalayer.cleantext(str(processor.clean({"text": content})["text"]))
+        doc = datalayer.cleantext(str(cleaned_document["text"]))
 
         sqlcmd = (
             "INSERT INTO document(id,text,index,datasource,topdup_article_id) "
@@ -0,0 +1,336 @@
+import os
+import pickle
+import re
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from data_wranglers.utils import get_logger
+
+logger = get_logger()
+
+MODEL_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "models", "wordsegmenter"
+)
+# Bumped when the format of the cached structures changes
+CACHE_VERSION = 1
+
+# Fields of the context of a syllable, in the order of the RDR rules
+FIELDS = (
+    "prevWord2",
+    "prevTag2",
+    "prevWord1",
+    "prevTag1",
+    "word",
+    "tag",
+    "nextWord1",
+    "nextTag1",
+    "nextWord2",
+    "nextTag2",
+)
+# Fields by which rules are indexed, the most selective first
+WORD_FIELDS = tuple(
+    FIELDS.index(field)
+    for field in ("word", "prevWord1", "nextWord1", "prevWord2", "nextWord2")
+)
+# Values of the fields of a missing neighbour
+NO_WORD, NO_TAG = "<W>", "<T>"
+# Longest dictionary word considered by the initial segmentation, in syllables
+MAX_WORD_SYLLABLES = 4
+
+# Old style tone marks, rewritten as in the vocabulary and rules
+NORMALIZER = {
+    "òa": "oà",
+    "óa": "oá",
+    "ỏa": "oả",
+    "õa": "oã",
+    "ọa": "oạ",
+    "òe": "oè",
+    "óe": "oé",
+    "ỏe": "oẻ",
+    "õe": "oẽ",
+    "ọe": "oẹ",
+    "ùy": "uỳ",
+    "úy": "uý",
+    "ủy": "uỷ",
+    "ũy": "uỹ",
+    "ụy": "uỵ",
+}
+NORMALIZER_PATTERN = re.compile("|".join(NORMALIZER))
+# Numbers keep their separators, other punctuation marks are tokens of their own
+TOKEN_PATTERN = re.compile(r"\d+(?:[.,]\d+)+|\w+|[^\w\s]", re.UNICODE)
+SENTENCE_END = {".", "?", "!"}
+
+# A rule: conditions as (field, value) pairs, and conclusion
+Rule = Tuple[Tuple[Tuple[int, str], ...], str]
+
+
+class RuleChain:
+    """Sibling rules of the RDR tree, of which the first satisfied one fires.
+
+    Rules are indexed by the value of their first word condition, so that only the
+    rules which can be satisfied by a syllable are checked.
+    """
+
+    def __init__(self, node_ids: List[int], rules: List[Rule]):
+        self.node_ids = node_ids
+        self.index: Dict[Tuple[int, str], List[int]] = dict()
+        self.unindexed: List[int] = []
+        for position, node_id in enumerate(node_ids):
+            conditions = dict(rules[node_id][0])
+            field = next((f for f in WORD_FIELDS if f in conditions), None)
+            if field is None:
+                self.unindexed.append(position)
+            else:
+                self.index.setdefault((field, conditions[field]), []).append(position)
+        self.fields = sorted({field for field, _ in self.index})
+
+    def candidates(self, context: Tuple[str, ...]) -> List[int]:
+        """Node ids of the rules which may be satisfied by `context`, in order"""
+        positions = list(self.unindexed)
+        for field in self.fields:
+            positions += self.index.get((field, context[field]), ())
+        return [self.node_ids[position] for position in sorted(positions)]
+
+
+class RDRSegmenter:
+    """In-process Vietnamese word segmenter, a Python port of the RDRsegmenter
+    used by VnCoreNLP, from the same `wordsegmenter.rdr` rules and `vi-vocab`
+    dictionary.
+
+    Syllables are first tagged B (begins a word) or I (inside a word) by longest
+    matching against the dictionary, then the tags are corrected by the rules.
+    The dictionary is held as a table of its word prefixes, which is a flattened
+    trie, and the rules as indexed `RuleChain`s. Both are pickled to `cache_path`
+    after the first load.
+
+    Texts are expected lowercased, as done by `normalize_text`: the name lists of
+    VnCoreNLP, which group capitalized syllables, are not part of its models.
+    """
+
+    _instance = None
+
+    def __init__(
+        self,
+        prefixes: Dict[str, bool],
+        rules: List[Rule],
+        chains: List[Optional[RuleChain]],
+    ):
+        """
+        Attributes:
+            prefixes (Dict[str, bool]): Prefixes of the dictionary words, mapped to
+                whether they are words themselves.
+            rules (List[Rule]): Rules of the RDR tree, the root first.
+            chains (List[RuleChain]): Exception rules of each rule, if any.
+        """
+        self.prefixes = prefixes
+        self.rules = rules
+        self.chains = chains
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls.load()
+        return cls._instance
+
+    @classmethod
+    def load(cls, model_dir: str = MODEL_DIR, cache_path: Optional[str] = None):
+        """Loads the segmenter from its cache if it is up to date, otherwise from
+        the models in `model_dir`, and caches it.
+
+        Args:
+            model_dir (str, optional): Directory of `wordsegmenter.rdr` and
+                `vi-vocab`. Defaults to the models of VnCoreNLP.
+            cache_path (str, optional): Path of the cache file. Defaults to
+                `wordsegmenter.pkl` in `model_dir`.
+        """
+        rules_path = os.path.join(model_dir, "wordsegmenter.rdr")
+        vocab_path = os.path.join(model_dir, "vi-vocab")
+        cache_path = cache_path or os.path.join(model_dir, "wordsegmenter.pkl")
+        signature = (CACHE_VERSION,) + tuple(
+            (os.path.getsize(path), os.path.getmtime(path))
+            for path in (rules_path, vocab_path)
+        )
+
+        try:
+            with open(cache_path, "rb") as f:
+                cached_signature, prefixes, rules, chains = pickle.load(f)
+            if cached_signature == signature:
+                return cls(prefixes, rules, chains)
+        except (OSError, pickle.UnpicklingError, ValueError, EOFError):
+            pass
+
+        prefixes = _build_prefixes(_read_vocabulary(vocab_path))
+        rules, chains = _read_rules(rules_path)
+        try:
+            with open(cache_path + ".tmp", "wb") as f:
+                pickle.dump((signature, prefixes, rules, chains), f, protocol=4)
+            os.replace(cache_path + ".tmp", cache_path)
+        except OSError as e:
+            logger.warning(f"Word segmenter could not be cached: {e}")
+        return cls(prefixes, rules, chains)
+
+    def tokenize(self, text: str) -> List[List[str]]:
+        """Segments `text` into words, like `VnCoreNLP.tokenize`.
+
+        Returns:
+            List[List[str]]: Words of each sentence, syllables of a word are joined
+                by underscores.
+        """
+        text = NORMALIZER_PATTERN.sub(lambda m: NORMALIZER[m.group(0)], text)
+        tokens = TOKEN_PATTERN.findall(text)
+
+        sentences = []
+        start = 0
+        for i, token in enumerate(tokens):
+            if token in SENTENCE_END and (
+                i + 1 == len(tokens) or tokens[i + 1] not in SENTENCE_END
+            ):
+                sentences.append(self._segment_sentence(tokens[start : i + 1]))
+                start = i + 1
+        if start < len(tokens):
+            sentences.append(self._segment_sentence(tokens[start:]))
+        return sentences
+
+    def segment_many(self, texts: List[str]) -> List[List[str]]:
+        """Segments `texts` into words, like `VnCoreNLPPool.segment_many`"""
+        return [
+            [word for sentence in self.tokenize(text) for word in sentence]
+            for text in texts
+        ]
+
+    def _segment_sentence(self, tokens: List[str]) -> List[str]:
+        words = [token.lower() for token in tokens]
+        tags = self._initial_tags(tokens, words)
+        n = len(tokens)
+
+        segmented: List[str] = []
+        for i in range(n):
+            context = (
+                words[i - 2] if i > 1 else NO_WORD,
+                tags[i - 2] if i > 1 else NO_TAG,
+                words[i - 1] if i > 0 else NO_WORD,
+                tags[i - 1] if i > 0 else NO_TAG,
+                words[i],
+                tags[i],
+                words[i + 1] if i < n - 1 else NO_WORD,
+                tags[i + 1] if i < n - 1 else NO_TAG,
+                words[i + 2] if i < n - 2 else NO_WORD,
+                tags[i + 2] if i < n - 2 else NO_TAG,
+            )
+            # The tag of the dictionary is kept if only the root rule fires
+            node_id = self._fired_rule(context)
+            tag = self.rules[node_id][1] if node_id else tags[i]
+            if tag == "I" and segmented:
+                segmented[-1] += "_" + tokens[i]
+            else:
+                segmented.append(tokens[i])
+        return segmented
+
+    def _initial_tags(self, tokens: List[str], words: List[str]) -> List[str]:
+        """Tags syllables by longest matching against the dictionary"""
+        n = len(tokens)
+        tags: List[str] = []
+        i = 0
+        while i < n:
+            tags.append("B")
+            if not tokens[i].isalpha() or (
+                tokens[i][0].islower() and i + 1 < n and tokens[i + 1][0].isupper()
+            ):
+                i += 1
+                continue
+
+            length, candidate = 1, words[i]
+            for j in range(i + 1, min(i + MAX_WORD_SYLLABLES, n)):
+                candidate += " " + words[j]
+                is_word = self.prefixes.get(candidate)
+                if is_word is None:
+                    break
+                if is_word:
+                    length = j - i + 1
+            tags.extend(["I"] * (length - 1))
+            i += length
+        return tags
+
+    def _fired_rule(self, context: Tuple[str, ...]) -> int:
+        """Returns the id of the last satisfied rule on the path through the tree"""
+        fired = 0
+        chain = self.chains[0]
+        while chain is not None:
+            for node_id in chain.candidates(context):
+                if all(context[f] == value for f, value in self.rules[node_id][0]):
+                    fired = node_id
+                    break
+            else:
+                break
+            chain = self.chains[fired]
+        return fired
+
+
+def _read_vocabulary(path: str) -> List[str]:
+    """Reads the words of `vi-vocab`, a serialized `java.util.HashSet` of strings"""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    # The elements follow the capacity, load factor and size of the set
+    position = data.index(b"xpw") + 4
+    _, _, size = struct.unpack(">ifi", data[position : position + 12])
+    position += 12
+
+    words = []
+    for _ in range(size):
+        if data[position] != 0x74:
+            raise ValueError(f"Unexpected element in {path} at {position}")
+        (length,) = struct.unpack(">H", data[position + 1 : position + 3])
+        words.append(data[position + 3 : position + 3 + length].decode("utf-8"))
+        position += 3 + length
+    return words
+
+
+def _build_prefixes(words: List[str]) -> Dict[str, bool]:
+    prefixes: Dict[str, bool] = dict()
+    for word in words:
+        syllables = word.split()
+        if not 1 < len(syllables) <= MAX_WORD_SYLLABLES:
+            continue
+        for length in range(2, len(syllables)):
+            prefixes.setdefault(" ".join(syllables[:length]), False)
+        prefixes[word] = True
+    return prefixes
+
+
+def _read_rules(path: str) -> Tuple[List[Rule], List[Optional[RuleChain]]]:
+    """Reads the RDR tree of `wordsegmenter.rdr`, whose depth is the indentation"""
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+
+    # The first line is the root rule, which is always satisfied
+    rules: List[Rule] = [((), _read_value(lines[0].split(" : ")[1]))]
+    children: List[List[int]] = [[]]
+    # Id of the last rule read at each depth
+    last_at_depth = [0]
+    for line in lines[1:]:
+        depth = len(line) - len(line.lstrip("\t"))
+        line = line.strip()
+        if not line or "cc:" in line:
+            continue
+        condition, conclusion = line.split(" : ")
+        conditions = tuple(
+            (FIELDS.index(part[len("object.") : part.index(" ")]), _read_value(part))
+            for part in condition.split(" and ")
+        )
+
+        node_id = len(rules)
+        rules.append((conditions, _read_value(conclusion)))
+        children.append([])
+        children[last_at_depth[depth - 1]].append(node_id)
+        last_at_depth[depth:] = [node_id]
+
+    chains = [RuleChain(ids, rules) if ids else None for ids in children]
+    return rules, chains
+
+
+def _read_value(expression: str) -> str:
+    """Returns the quoted value of `object.field == "value"`"""
+    if '""' in expression:
+        return NO_WORD if "Word" in expression else NO_TAG
+    return expression[expression.index('"') + 1 : -1]
@@ -16,11 +16,14 @@ def main():
         "SELECT id,text_original FROM document where datasource = 'post_dataset'"
     )
     sqls = []
-    for article in articles:
+    # Contents are segmented in batches by the VnCoreNLP servers
+    cleaned_documents = processor.clean_many(
+        [{"text": str(article["text_original"])} for article in articles]
+    )
+    for article, cleaned_document in zip(articles, cleaned_documents):
         # insert document record
         documentid = str(article["id"])
-        content = str(article["text_original"])
-        doc = datalayer.cleantext(str(processor.clean({"text": content})["text"]))
+        doc = datalayer.cleantext(str(cleaned_document["text"]))
 
         sqlcmd = (
             "UPDATE document "
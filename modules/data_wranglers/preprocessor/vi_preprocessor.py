@@ -5,7 +5,8 @@ from copy import deepcopy
 from typing import Any, Dict, List, Optional
 
 import nltk
-from data_wranglers.plugins.vncorenlp import VnCoreNLPSingleton
+from data_wranglers.plugins.vncorenlp import VnCoreNLPPool, VnCoreNLPSingleton
+from data_wranglers.plugins.vncorenlp.rdrsegmenter import RDRSegmenter
 from more_itertools.more import windowed
 
 from .base import BasePreProcessor
@@ -22,11 +23,30 @@ class ViPreProcessor(BasePreProcessor):
         split_length: Optional[int] = 1000,
         split_overlap: Optional[int] = None,
         split_respect_sentence_boundary: Optional[bool] = True,
+        word_segmenter: Optional[str] = "vncorenlp",
     ):
         """
         :param use_fixed_stopwords: remove stopwords that appears in pre-defined files
+        :param word_segmenter: "vncorenlp" to segment words on VnCoreNLP servers, or
+            "rdr" to segment them in process with `RDRSegmenter`, which is also used
+            if VnCoreNLP cannot be started
         """
-        self.rdrsegmenter = VnCoreNLPSingleton.get_instance()
+        if word_segmenter not in ("vncorenlp", "rdr"):
+            raise ValueError(f"Unknown word segmenter: {word_segmenter}")
+
+        self.rdrsegmenter: Any = None
+        self.vncorenlp_pool: Optional[VnCoreNLPPool] = None
+        if word_segmenter == "vncorenlp":
+            try:
+                self.rdrsegmenter = VnCoreNLPSingleton.get_instance()
+                # Started now rather than on first use, so that processes forked
+                # afterwards share its servers instead of starting their own
+                self.vncorenlp_pool = VnCoreNLPPool.get_instance()
+            except Exception as e:
+                logger.warning(f"VnCoreNLP unavailable, segmenting in process: {e}")
+                self.rdrsegmenter = None
+        if self.rdrsegmenter is None:
+            self.rdrsegmenter = RDRSegmenter.get_instance()
 
         self.use_fixed_stopwords = use_fixed_stopwords
         self.split_by = split_by
@@ -51,6 +71,30 @@ class ViPreProcessor(BasePreProcessor):
         document["text"] = text
         return document
 
+    def clean_many(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Perform document cleaning on many documents at once, segmenting their
+        words in batches on the VnCoreNLP servers of `VnCoreNLPPool`, if used.
+        Same as calling `clean` on each document.
+        """
+        texts = self.segment_many([normalize_text(doc["text"]) for doc in documents])
+        for document, text in zip(documents, texts):
+            document["text"] = _clean_vncore_result(text)
+        return documents
+
+    def segment_many(self, texts: List[str]) -> List[str]:
+        """Segment the words of many texts at once, see `_word_segment`"""
+        if isinstance(self.rdrsegmenter, RDRSegmenter):
+            segmenter = self.rdrsegmenter
+        else:
+            segmenter = self.vncorenlp_pool
+
+        results = []
+        for words in segmenter.segment_many(texts):
+            if self.use_fixed_stopwords:
+                words = [w for w in words if w not in self.stopwords]
+            results.append(" ".join(words))
+        return results
+
     def split(self, document: Dict[str, Any]) -> List[Dict[str, Any]]:
         if not self.split_by:
             return [document]
@@ -142,7 +186,7 @@ class ViPreProcessor(BasePreProcessor):
         return documents
 
     def _word_segment(self, text: str) -> str:
-        """Use VnCoreNLP-based tokenizer for word segmentation"""
+        """Use VnCoreNLP-based tokenizer, or its port, for word segmentation"""
         sentences = self.rdrsegmenter.tokenize(text)
 
         tokenized_sents = []
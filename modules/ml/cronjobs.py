@@ -2,14 +2,14 @@ import os
 import uuid
 from datetime import datetime, timedelta
 
-import pandas as pd
 import schedule
-from sqlalchemy.exc import ProgrammingError
 from tqdm.auto import tqdm
 
+from modules.ml.document_store.embedding_store import EmbeddingStore
 from modules.ml.document_store.faiss import FAISSDocumentStore
+from modules.ml.document_store.sync import DocumentSync
 from modules.ml.retriever.retriever import Retriever
-from modules.ml.utils import get_logger, meta_parser
+from modules.ml.utils import get_logger
 from modules.ml.vectorizer.tf_idf import TfidfDocVectorizer
 
 LOCAL_DB_URI = os.getenv("LOCAL_DB_URI", "sqlite:///local.db")
@@ -21,66 +21,73 @@ RTRV_DIM = 1024
 HARD_SIM_THRESHOLD = 0.8
 CAND_PATH = os.getenv("CAND_PATH", "vectorizer_cand.bin")
 RTRV_PATH = os.getenv("RTRV_PATH", "vectorizer_rtrv.bin")
+# Vectorizers exported for ml_api in a format loaded without unpickling
+CAND_EXPORT_PATH = os.getenv("CAND_EXPORT_PATH", "vectorizer_cand")
+RTRV_EXPORT_PATH = os.getenv("RTRV_EXPORT_PATH", "vectorizer_rtrv")
 INDEX = "document"
 LOCAL_IDX_PATH = os.getenv("LOCAL_IDX_PATH", "faiss_index_local.bin")
 REMOTE_IDX_PATH = os.getenv("REMOTE_IDX_PATH", "faiss_index_remote.bin")
+RTRV_EMB_PATH = os.getenv("RTRV_EMB_PATH", "embeddings_rtrv")
+SYNC_STATE_PATH = os.getenv("SYNC_STATE_PATH", "sync_state.json")
+# Keep remote metadata in the wide `document_meta` table too, see `migrate_meta`
+WIDE_META = os.getenv("WIDE_META", "false").lower() == "true"
 
 
 logger = get_logger()
 
 
-def get_connection(uri: str, vector_dim: int):
+def get_connection(
+    uri: str, vector_dim: int, index_path: str = None, wide_meta: bool = False
+):
     try:
-        conn = FAISSDocumentStore(sql_url=uri, vector_dim=vector_dim)
+        if index_path and os.path.exists(index_path):
+            # Reuse the saved FAISS index, so it can be updated incrementally
+            conn = FAISSDocumentStore.load(faiss_file_path=index_path, sql_url=uri)
+            conn.wide_meta = wide_meta
+            return conn
+        conn = FAISSDocumentStore(
+            sql_url=uri, vector_dim=vector_dim, wide_meta=wide_meta
+        )
         return conn
     except Exception as e:
         logger.error(e)
         return None
 
 
-def chunks(lst, n):
-    """Yield successive n-sized chunks from list
-    """
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
-
-
-def update_local_db(local_doc_store, remote_doc_store):
+def update_local_db(local_doc_store, remote_doc_store, rtrv_embedding_store=None):
     """This method runs in serial as follow:
 
-    - Compares list of `document_id` between local and
-    remote database
+    - Finds documents updated in remote database since the last run
+    (see `DocumentSync`) which are not in local database yet
     - Fetches and writes new documents into local database
     - Updates embeddings and vector ids on small FAISS index
     - Runs batch retriever to pre-calculate the similarity scores
-    and updates metadata on remote database
+    and writes them to `similarity_edge` on remote database
     """
 
     if not local_doc_store or not remote_doc_store:
         logger.warning("DB connection not initialized, try to re-connect...")
-        local_doc_store = get_connection(LOCAL_DB_URI, CAND_DIM)
-        remote_doc_store = get_connection(POSTGRES_URI, CAND_DIM)
+        local_doc_store = get_connection(LOCAL_DB_URI, CAND_DIM, LOCAL_IDX_PATH)
+        remote_doc_store = get_connection(POSTGRES_URI, CAND_DIM, wide_meta=WIDE_META)
         if not local_doc_store or not remote_doc_store:
             logger.error("DB initialization failed, quit local_update...")
             return
 
     remote_reindex = not os.path.exists(REMOTE_IDX_PATH)
     now = datetime.now()
-    if remote_reindex:
-        new_ids = remote_doc_store.get_document_ids(
-            from_time=now - timedelta(days=365), index=INDEX
-        )
-    else:
-        new_ids = remote_doc_store.get_document_ids(
-            from_time=now - timedelta(days=1), index=INDEX
-        )
-
-    local_ids = local_doc_store.get_document_ids(index=INDEX)
-
-    # Filter existing ids in local out of recent updated ids from remote db
-    new_ids = sorted([_id for _id in new_ids if _id not in local_ids])
+    document_sync = DocumentSync(
+        source=remote_doc_store,
+        target=local_doc_store,
+        state_path=SYNC_STATE_PATH,
+        index=INDEX,
+    )
+    # Without a high-water mark, recent ids are fully reconciled with local db
+    new_ids = document_sync.get_new_ids(
+        from_time=now - timedelta(days=365 if remote_reindex else 1)
+    )
 
     if not new_ids:
+        document_sync.commit()
         logger.info(f"No new updates in local db")
         return
 
@@ -88,54 +95,63 @@ def update_local_db(local_doc_store, remote_doc_store):
     logger.info(f"Retrieved {len(docs)} docs")
 
     local_doc_store.write_documents(docs)
+    document_sync.commit()
     logger.info(f"Stored {len(docs)} docs to local db")
 
     local_retriever = Retriever(
         document_store=local_doc_store,
-        candidate_vectorizer=TfidfDocVectorizer(CAND_DIM),
-        retriever_vectorizer=TfidfDocVectorizer(RTRV_DIM),
+        candidate_vectorizer=TfidfDocVectorizer(CAND_DIM, sparse=True),
+        retriever_vectorizer=TfidfDocVectorizer(RTRV_DIM, sparse=True),
+        embedding_store=rtrv_embedding_store,
     )
     remote_retriever = Retriever(
         document_store=remote_doc_store,
-        candidate_vectorizer=TfidfDocVectorizer(CAND_DIM),
-        retriever_vectorizer=TfidfDocVectorizer(RTRV_DIM),
+        candidate_vectorizer=TfidfDocVectorizer(CAND_DIM, sparse=True),
+        retriever_vectorizer=TfidfDocVectorizer(RTRV_DIM, sparse=True),
     )
 
-    if not os.path.exists(CAND_PATH) or not os.path.exists(RTRV_PATH):
+    vectorizers_retrained = not os.path.exists(CAND_PATH) or not os.path.exists(
+        RTRV_PATH
+    )
+    if vectorizers_retrained:
         remote_retriever.train_candidate_vectorizer(retrain=True, save_path=CAND_PATH)
         remote_retriever.train_retriever_vectorizer(retrain=True, save_path=RTRV_PATH)
         logger.info("Vectorizers retrained")
 
     local_retriever.train_candidate_vectorizer(retrain=False, save_path=CAND_PATH)
     local_retriever.train_retriever_vectorizer(retrain=False, save_path=RTRV_PATH)
+    # Vectorizers saved before sparse output was introduced are loaded as dense
+    local_retriever.candidate_vectorizer.sparse = True
+    local_retriever.retriever_vectorizer.sparse = True
     logger.info("Vectorizers loaded")
 
+    if vectorizers_retrained or not os.path.isdir(CAND_EXPORT_PATH):
+        local_retriever.candidate_vectorizer.save_arrays(CAND_EXPORT_PATH)
+    if vectorizers_retrained or not os.path.isdir(RTRV_EXPORT_PATH):
+        local_retriever.retriever_vectorizer.save_arrays(RTRV_EXPORT_PATH)
+
+    # Only new documents need embeddings unless the candidate vectorizer changed
     local_retriever.update_embeddings(
-        retrain=True, save_path=LOCAL_IDX_PATH, sql_url=LOCAL_DB_URI
+        retrain=True,
+        save_path=LOCAL_IDX_PATH,
+        sql_url=LOCAL_DB_URI,
+        update_existing_embeddings=vectorizers_retrained,
     )
     logger.info("Embeddings updated")
 
     results = local_retriever.batch_retrieve(docs)
 
-    # Split payloads to chunks to reduce pressure on the database
-    results_chunks = list(chunks(results, 1000))
-
-    for i in tqdm(range(len(results_chunks)), desc="Updating meta.....  "):
-        id_meta = list()
-        for r in results_chunks[i]:
-            rank = "_".join(list(r.keys())[-1].split("_")[-2:])
-            sim_score = r.get(f"sim_score_{rank}", 0)
-            if sim_score > HARD_SIM_THRESHOLD:
-                sim_data = {
-                    "document_id": r["document_id"],
-                    f"sim_score_{rank}": sim_score,
-                    f"similar_to_{rank}": r[f"sim_document_id_{rank}"],
-                }
-                id_meta.append(sim_data)
-
-        if id_meta:
-            remote_doc_store.update_documents_meta(id_meta=id_meta)
-    logger.info("Similarity scores updated into metadata")
+    edges = list()
+    for r in results:
+        rank = "_".join(list(r.keys())[-1].split("_")[-2:])
+        sim_score = r.get(f"sim_score_{rank}", 0)
+        if sim_score > HARD_SIM_THRESHOLD:
+            edges.append((r["document_id"], r[f"sim_document_id_{rank}"], sim_score))
+
+    remote_doc_store.write_similarity_edges(
+        edges, model_version=local_retriever.retriever_vectorizer.version
+    )
+    logger.info(f"{len(edges)} similarity scores updated")
 
     consolidate_sim_docs(remote_doc_store)
 
@@ -146,11 +162,13 @@ def update_remote_db(remote_doc_store):
 
     remote_retriever = Retriever(
         document_store=remote_doc_store,
-        candidate_vectorizer=TfidfDocVectorizer(CAND_DIM),
-        retriever_vectorizer=TfidfDocVectorizer(RTRV_DIM),
+        candidate_vectorizer=TfidfDocVectorizer(CAND_DIM, sparse=True),
+        retriever_vectorizer=TfidfDocVectorizer(RTRV_DIM, sparse=True),
     )
     remote_retriever.train_candidate_vectorizer(retrain=False, save_path=CAND_PATH)
-    remote_retriever.update_embeddings(retrain=True)
+    remote_retriever.candidate_vectorizer.sparse = True
+    # Published for the `/similar` endpoint of ml_api, which reloads it on change
+    remote_retriever.update_embeddings(retrain=True, save_path=REMOTE_IDX_PATH)
     logger.info("Remote embeddings and vector ids updated")
 
 
@@ -158,92 +176,41 @@ def consolidate_sim_docs(remote_doc_store):
     """This method gathers the similar document pairs and writes to `similar_docs` table
     """
 
-    docs = remote_doc_store.get_similar_documents_by_threshold(
+    pairs = remote_doc_store.get_similar_document_pairs(
         threshold=HARD_SIM_THRESHOLD, from_time=datetime.now() - timedelta(days=7)
     )
 
-    if not docs:
-        logger.info(f"No new similar docs")
-        return
+    data = dict()
+    for pair in tqdm(pairs, desc="Consolidating.....  "):
+        missing_keys = [key for key, value in pair.items() if value is None]
+        if missing_keys:
+            logger.error(f"Missing keys {missing_keys}: pair = {pair}")
+            continue
 
-    data = list()
-    for doc in tqdm(docs, desc="Consolidating.....  "):
-        try:
-            data.append(
-                [
-                    doc[0]["document_id"],
-                    doc[1]["document_id"],
-                    meta_parser("domain", doc[0]),
-                    meta_parser("domain", doc[1]),
-                    meta_parser("url", doc[0]),
-                    meta_parser("url", doc[1]),
-                    meta_parser("publish_date", doc[0]),
-                    meta_parser("publish_date", doc[1]),
-                    meta_parser("title", doc[0]),
-                    meta_parser("title", doc[1]),
-                    doc[0]["sim_score"],
-                    str(
-                        uuid.uuid5(
-                            uuid.NAMESPACE_DNS,
-                            doc[0]["document_id"] + doc[1]["document_id"],
-                        )
-                    ),
-                ]
+        sim_id = str(
+            uuid.uuid5(
+                uuid.NAMESPACE_DNS, pair["document_id_A"] + pair["document_id_B"]
             )
-        except ValueError as e:
-            logger.error(f"{str(e)}: doc = {doc}")
-
-    df = pd.DataFrame(
-        data,
-        columns=[
-            "document_id_A",
-            "document_id_B",
-            "domain_A",
-            "domain_B",
-            "url_A",
-            "url_B",
-            "publish_date_A",
-            "publish_date_B",
-            "title_A",
-            "title_B",
-            "sim_score",
-            "sim_id",
-        ],
-    )
+        )
+        # Pairs are sorted by descending score, keep the highest one
+        data.setdefault(sim_id, dict(pair, sim_id=sim_id))
 
-    try:
-        existing_sim_id = pd.read_sql(
-            sql="SELECT DISTINCT sim_id FROM similar_docs", con=remote_doc_store.engine
-        )["sim_id"].values.tolist()
-    except ProgrammingError:
-        existing_sim_id = list()
-    df = df[~df.sim_id.isin(existing_sim_id)]
-
-    if df.empty:
+    if not data:
         logger.info(f"No new similar docs")
         return
-    else:
-        logger.info(f"Retrieved {len(df)} similar docs")
-
-    df.to_sql(
-        name="similar_docs",
-        schema="public",
-        con=remote_doc_store.engine,
-        if_exists="append",
-        index=False,
-    )
-    try:
-        with remote_doc_store.engine.connect() as con:
-            con.execute('ALTER TABLE similar_docs ADD PRIMARY KEY ("sim_id")')
-    except ProgrammingError:
-        pass
+
+    n_inserted = remote_doc_store.write_similar_document_pairs(list(data.values()))
+    logger.info(f"Stored {n_inserted} new similar docs")
 
 
 if __name__ == "__main__":
-    local_doc_store = get_connection(LOCAL_DB_URI, CAND_DIM)
-    remote_doc_store = get_connection(POSTGRES_URI, CAND_DIM)
+    local_doc_store = get_connection(LOCAL_DB_URI, CAND_DIM, LOCAL_IDX_PATH)
+    remote_doc_store = get_connection(POSTGRES_URI, CAND_DIM, wide_meta=WIDE_META)
+    rtrv_embedding_store = EmbeddingStore(RTRV_EMB_PATH, RTRV_DIM)
 
-    schedule.every().minute.do(update_local_db, local_doc_store, remote_doc_store)
+    schedule.every().minute.do(
+        update_local_db, local_doc_store, remote_doc_store, rtrv_embedding_store
+    )
     schedule.every().day.at("00:00").do(update_remote_db, remote_doc_store)
     while True:
         schedule.run_pending()
@@ -0,0 +1,176 @@
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+from scipy.sparse import issparse
+
+from modules.ml.utils import get_logger
+
+logger = get_logger()
+
+
+class EmbeddingStore:
+    """Persistent, append-only store of document embeddings backed by memory-mapped
+    files on disk. Embeddings are keyed by document id and scoped to a version of
+    the vectorizer that produced them, so they can be reused across runs as long as
+    the vectorizer does not change.
+
+    Each version is kept in two files inside `path`:
+        - `<version>.f32`: raw float32 rows of shape (n, vector_dim)
+        - `<version>.ids`: document id of each row, one per line
+    """
+
+    def __init__(self, path: Union[str, Path], vector_dim: int):
+        """
+        Attributes:
+            path (Union[str, Path]): Directory to store the embedding files in.
+            vector_dim (int): Dimension of the stored embeddings.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.vector_dim = vector_dim
+        self.version: Optional[str] = None
+
+        self._id_rows: Dict[str, int] = {}
+        self._embeddings: Optional[np.memmap] = None
+
+    def __contains__(self, document_id: str) -> bool:
+        return document_id in self._id_rows
+
+    def __len__(self) -> int:
+        return len(self._id_rows)
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Memory-mapped matrix of all stored embeddings, indexed by `get_rows`"""
+        if self._embeddings is None:
+            return np.zeros((0, self.vector_dim), dtype=np.float32)
+        return self._embeddings
+
+    def use_version(self, version: str):
+        """Opens the embeddings of given vectorizer version.
+        Embeddings of any other version are invalidated and removed from disk.
+
+        Args:
+            version (str): Version of the vectorizer, see `DocVectorizerBase.version`.
+        """
+        if version == self.version:
+            return
+
+        for file_path in self.path.iterdir():
+            if file_path.suffix in (".f32", ".ids") and file_path.stem != version:
+                logger.info(f"Removing outdated embeddings {file_path}")
+                file_path.unlink()
+
+        self.version = version
+        self._load()
+
+    def invalidate(self):
+        """Removes all stored embeddings of the current version"""
+        if self.version is None:
+            return
+        for file_path in (self._data_path, self._ids_path):
+            if file_path.exists():
+                file_path.unlink()
+        self._load()
+
+    def get_rows(self, document_ids: Iterable[str]) -> np.ndarray:
+        """Returns rows of `embeddings` of given documents, -1 for unknown documents"""
+        return np.array(
+            [self._id_rows.get(document_id, -1) for document_id in document_ids],
+            dtype=np.int64,
+        )
+
+    def get_missing_ids(self, document_ids: Iterable[str]) -> List[str]:
+        """Returns ids of given documents which have no stored embedding"""
+        return [
+            document_id
+            for document_id in dict.fromkeys(document_ids)
+            if document_id not in self._id_rows
+        ]
+
+    def write_embeddings(self, document_ids: List[str], embeddings):
+        """Appends embeddings of documents to the store.
+        Documents which already have an embedding are skipped.
+
+        Args:
+            document_ids (List[str]): Ids of documents.
+            embeddings (np.ndarray or scipy.sparse matrix): Embeddings of documents,
+                in the same order as `document_ids`.
+        """
+        if self.version is None:
+            raise ValueError(
+                "No vectorizer version selected. Try to call use_version first."
+            )
+
+        new_rows = [
+            i
+            for i, document_id in enumerate(document_ids)
+            if document_id not in self._id_rows
+        ]
+        if not new_rows:
+            return
+
+        embeddings = embeddings[new_rows]
+        if issparse(embeddings):
+            embeddings = embeddings.toarray()
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        new_ids = [document_ids[i] for i in new_rows]
+
+        # Rows are written before ids, a partially written batch is dropped on load
+        with open(self._data_path, "ab") as f:
+            f.write(embeddings.tobytes())
+        with open(self._ids_path, "a") as f:
+            f.write("".join(f"{document_id}\n" for document_id in new_ids))
+
+        n_rows = len(self._id_rows)
+        for row, document_id in enumerate(new_ids, start=n_rows):
+            self._id_rows[document_id] = row
+        self._open_memmap(n_rows + len(new_ids))
+
+    @property
+    def _data_path(self) -> Path:
+        return self.path / f"{self.version}.f32"
+
+    @property
+    def _ids_path(self) -> Path:
+        return self.path / f"{self.version}.ids"
+
+    def _load(self):
+        """(Re)opens the files of the current version"""
+        document_ids: List[str] = []
+        if self._ids_path.exists():
+            with open(self._ids_path, "r") as f:
+                document_ids = f.read().splitlines()
+
+        row_size = self.vector_dim * np.dtype(np.float32).itemsize
+        data_size = (
+            os.path.getsize(self._data_path) if self._data_path.exists() else 0
+        )
+        n_rows = min(data_size // row_size, len(document_ids))
+
+        # Drop leftovers of a write that was interrupted half way
+        if data_size != n_rows * row_size:
+            os.truncate(self._data_path, n_rows * row_size)
+        if len(document_ids) != n_rows:
+            document_ids = document_ids[:n_rows]
+            with open(self._ids_path, "w") as f:
+                f.write("".join(f"{document_id}\n" for document_id in document_ids))
+
+        self._id_rows = {
+            document_id: row for row, document_id in enumerate(document_ids)
+        }
+        self._open_memmap(n_rows)
+
+    def _open_memmap(self, n_rows: int):
+        self._embeddings = (
+            np.memmap(
+                self._data_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(n_rows, self.vector_dim),
+            )
+            if n_rows > 0
+            else None
+        )
@@ -1,9 +1,12 @@
 import logging
+import os
+import time
 from pathlib import Path
 from sys import platform
 from typing import Dict, List, Optional, Union
 
 import numpy as np
+from scipy.sparse import issparse
 from scipy.special import expit
 from tqdm import tqdm
 
@@ -43,6 +46,7 @@ class FAISSDocumentStore(SQLDocumentStore):
         update_existing_documents: bool = False,
         index: str = "document",
         similarity: str = "dot_product",
+        wide_meta: bool = False,
         **kwargs,
     ):
         """
@@ -89,6 +93,8 @@ class FAISSDocumentStore(SQLDocumentStore):
                 more performant with DPR embeddings.
                 'cosine' is recommended if you are using a Sentence BERT model.
                 Defaults to "dot_product".
+            wide_meta (bool, optional): Whether to maintain and use the wide metadata
+                table, see `SQLDocumentStore`. Defaults to False.
 
         Raises:
             ValueError: FAISSDocumentStore currently only supports dot_product similarity.
@@ -124,6 +130,7 @@ class FAISSDocumentStore(SQLDocumentStore):
             url=sql_url,
             update_existing_documents=update_existing_documents,
             index=index,
+            wide_meta=wide_meta,
         )
 
     def _create_new_index(
@@ -212,17 +219,40 @@ class FAISSDocumentStore(SQLDocumentStore):
         return {self.index: "embedding"}
 
     def update_embeddings(
-        self, vectorizer: DocVectorizerBase, index: Optional[str] = None
+        self,
+        vectorizer: DocVectorizerBase,
+        index: Optional[str] = None,
+        update_existing_embeddings: bool = True,
+        checkpoint_path: Optional[Union[str, Path]] = None,
+        checkpoint_interval: float = 300,
     ):
         """Updates the embeddings in the the document store using the encoding model
         specified in the retriever. This can be useful if want to add or change
         the embeddings for your documents (e.g. after changing the retriever config).
 
+        Documents are streamed from SQL in pages of `index_buffer_size`, each page
+        is vectorized and added to the FAISS index. Documents keep their vector_id:
+        documents which have one are embedded at that position, missing positions
+        are padded with zero vectors, and new documents get vector_ids after them,
+        written back page by page. An index published earlier therefore stays
+        consistent with the vector_ids in SQL while it is being rebuilt.
+
         Args:
             vectorizer (DocVectorizerBase): Vectorizer for generating
                 embeddings existing docs.
             index (str, optional): (SQL) index name for storing the docs and metadata.
                 Defaults to None.
+            update_existing_embeddings (bool, optional): Whether to rebuild the whole
+                FAISS index. If set to False, only documents beyond the current index
+                are embedded and appended to it, which requires the index to have
+                been built with the same vectorizer. Defaults to True.
+            checkpoint_path (Union[str, Path], optional): If given, the FAISS index is
+                saved there every `checkpoint_interval` seconds and when the update
+                is interrupted. It must not be the path of the published index. An
+                interrupted run is resumed from it by calling this method again with
+                `update_existing_embeddings=False`. Defaults to None.
+            checkpoint_interval (float, optional): Seconds between checkpoints.
+                Defaults to 300.
 
         Raises:
             ValueError: self.faiss_index not initialized.
@@ -233,51 +263,134 @@ class FAISSDocumentStore(SQLDocumentStore):
                 "Couldn't find a FAISS index. Try to init the FAISSDocumentStore() again ..."
             )
 
-        # Faiss does not support update in existing index data so clear all existing data in it
-        self.faiss_index.reset()
-        self.reset_vector_ids(index=index)
-
         index = index or self.index
-        documents = self.get_all_documents(index=index)
 
-        if len(documents) == 0:
+        if update_existing_embeddings:
+            # Faiss does not support update in existing index data so clear all existing data in it
+            self.faiss_index.reset()
+            # Marks the rebuild as started, for it to be resumed if interrupted
+            if checkpoint_path:
+                self.save(checkpoint_path)
+        elif checkpoint_path and os.path.isfile(checkpoint_path):
+            self._resume_from_checkpoint(checkpoint_path)
+
+        ntotal = self.faiss_index.ntotal
+        n_documents = (
+            self.get_document_count(index=index)
+            - self.get_embedded_document_count(index=index)
+            + self.get_embedded_document_count(index=index, from_vector_id=ntotal)
+        )
+        if n_documents == 0:
             logger.warning(
                 "Calling DocumentStore.update_embeddings() on an empty index"
+                if update_existing_embeddings
+                else "No new documents to embed"
             )
             return
 
-        # To clear out the FAISS index contents and frees all memory immediately that is in use by the index
-        # self.faiss_index.reset()
+        logger.info(f"Updating embeddings for {n_documents} docs...")
+        checkpointed_at = time.time()
+        try:
+            with tqdm(total=n_documents) as progress_bar:
+                # Documents which already have a vector_id, in the order of their ids
+                for documents in self.get_document_pages(
+                    index=index,
+                    page_size=self.index_buffer_size,
+                    from_vector_id=ntotal,
+                ):
+                    self._add_embeddings(vectorizer, documents)
+                    progress_bar.update(len(documents))
+                    checkpointed_at = self._checkpoint(
+                        checkpoint_path, checkpoint_interval, checkpointed_at
+                    )
 
-        logger.info(f"Updating embeddings for {len(documents)} docs...")
-        embeddings = vectorizer.transform_document_objects(documents)  # type: ignore
-        assert len(documents) == len(embeddings)
-        for i, doc in enumerate(documents):
-            doc.embedding = embeddings[i]
+                # New documents, numbered contiguously after the existing vectors
+                for documents in self.get_document_pages(
+                    index=index,
+                    page_size=self.index_buffer_size,
+                    only_documents_without_embedding=True,
+                ):
+                    vector_id = self.faiss_index.ntotal
+                    for doc in documents:
+                        doc.vector_id = str(vector_id)
+                        vector_id += 1
+                    self._add_embeddings(vectorizer, documents)
+                    # Committed after the vectors are added, so that a checkpoint
+                    # never lacks the vectors of committed vector_ids
+                    self.update_vector_ids(
+                        {doc.id: doc.vector_id for doc in documents}, index=index
+                    )
+                    progress_bar.update(len(documents))
+                    checkpointed_at = self._checkpoint(
+                        checkpoint_path, checkpoint_interval, checkpointed_at
+                    )
+        except BaseException:
+            if checkpoint_path:
+                self.save(checkpoint_path)
+            raise
+
+    def _add_embeddings(self, vectorizer: DocVectorizerBase, documents: List[Document]):
+        """Adds the embeddings of `documents` at the positions of their vector_ids,
+        which must not be lower than `faiss_index.ntotal`. Skipped positions are
+        padded with zero vectors, which do not match any document in SQL.
+        """
+        embeddings = _to_float32_array(
+            vectorizer.transform_document_objects(documents)  # type: ignore
+        )
+        assert len(documents) == embeddings.shape[0]
 
-        logger.info("Indexing embeddings and updating vectors_ids...")
-        for i in tqdm(range(0, len(documents), self.index_buffer_size)):
-            vector_id_map = {}
-            vector_id = self.faiss_index.ntotal
-            embeddings = [
-                doc.embedding for doc in documents[i : i + self.index_buffer_size]
-            ]
-            embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        vector_ids = np.array([int(doc.vector_id) for doc in documents])
+        ntotal = self.faiss_index.ntotal
+        n_vectors = vector_ids[-1] + 1 - ntotal
+        if n_vectors == len(documents):
             self.faiss_index.add(embeddings)
+            return
 
-            for doc in tqdm(documents[i : i + self.index_buffer_size]):
-                vector_id_map[doc.id] = vector_id
-                vector_id += 1
-            self.update_vector_ids(vector_id_map, index=index)
-            print("update")
+        vectors = np.zeros((n_vectors, embeddings.shape[1]), dtype=np.float32)
+        vectors[vector_ids - ntotal] = embeddings
+        self.faiss_index.add(vectors)
+
+    def _checkpoint(
+        self,
+        checkpoint_path: Optional[Union[str, Path]],
+        checkpoint_interval: float,
+        checkpointed_at: float,
+    ) -> float:
+        """Saves a checkpoint if `checkpoint_interval` seconds passed since the last
+        one, and returns the time of the last checkpoint
+        """
+        if checkpoint_path and time.time() - checkpointed_at >= checkpoint_interval:
+            self.save(checkpoint_path)
+            return time.time()
+        return checkpointed_at
+
+    def _resume_from_checkpoint(self, checkpoint_path: Union[str, Path]):
+        faiss_index = faiss.read_index(str(checkpoint_path))
+        if faiss_index.d != self.faiss_index.d:
+            logger.warning(
+                f"Checkpoint {checkpoint_path} has {faiss_index.d} dimensions"
+                f" instead of {self.faiss_index.d}, ignoring it"
+            )
+            return
+        if faiss_index.ntotal > self.faiss_index.ntotal:
+            logger.info(f"Resuming from checkpoint with {faiss_index.ntotal} vectors")
+            self.faiss_index = faiss_index
 
     def is_synchronized(self) -> bool:
-        """Checks if all documents in document store is indexed
+        """Checks if all documents in document store is indexed, i.e. every document
+        has a vector_id within the FAISS index. The index may have more vectors than
+        documents, as positions of deleted documents are kept.
         """
-        return self.faiss_index.ntotal == self.get_document_count()
+        return self.get_embedded_document_count() == self.get_document_count() and (
+            self.get_embedded_document_count(from_vector_id=self.faiss_index.ntotal)
+            == 0
+        )
 
     def get_all_documents(
-        self, index: Optional[str] = None, return_embedding: Optional[bool] = False
+        self,
+        index: Optional[str] = None,
+        return_embedding: Optional[bool] = False,
+        only_documents_without_embedding: bool = False,
     ) -> List[Document]:
         """Gets documents from the document store.
 
@@ -286,11 +399,16 @@ class FAISSDocumentStore(SQLDocumentStore):
                 Defaults to self.index.
             return_embedding (bool, optional): Whether to return the document embeddings.
                 Defaults to False.
+            only_documents_without_embedding (bool, optional): Return only documents
+                which have no vector_id yet. Defaults to False.
 
         Returns:
             List[Document]
         """
-        documents = super(FAISSDocumentStore, self).get_all_documents(index=index)
+        documents = super(FAISSDocumentStore, self).get_all_documents(
+            index=index,
+            only_documents_without_embedding=only_documents_without_embedding,
+        )
         if return_embedding is None:
             return_embedding = self.return_embedding
         if return_embedding:
@@ -378,8 +496,20 @@ class FAISSDocumentStore(SQLDocumentStore):
                 "No index exists. Use 'update_embeddings()` to create an index."
             )
 
-        query_emb = np.ascontiguousarray(query_emb, dtype="float32")
-        return self.faiss_index.search(query_emb, top_k)
+        if not issparse(query_emb):
+            return self.faiss_index.search(_to_float32_array(query_emb), top_k)
+
+        # Densify sparse queries chunk by chunk to bound memory
+        results = [
+            self.faiss_index.search(
+                _to_float32_array(query_emb[i : i + self.index_buffer_size]), top_k
+            )
+            for i in range(0, query_emb.shape[0], self.index_buffer_size)
+        ]
+        return (
+            np.concatenate([scores for scores, _ in results]),
+            np.concatenate([vector_ids for _, vector_ids in results]),
+        )
 
     def query_docs_by_embedding(
         self,
@@ -449,11 +579,15 @@ class FAISSDocumentStore(SQLDocumentStore):
 
     def save(self, file_path: Union[str, Path]):
         """Saves FAISS Index to the specified file.
+        The index is written to a temporary file first and then moved in place,
+        so readers never see a partially written index.
 
         Args:
             file_path(Union[str, Path]): Path to save to.
         """
-        faiss.write_index(self.faiss_index, str(file_path))
+        tmp_file_path = f"{file_path}.tmp"
+        faiss.write_index(self.faiss_index, tmp_file_path)
+        os.replace(tmp_file_path, str(file_path))
 
     @classmethod
     def load(
@@ -481,3 +615,10 @@ class FAISSDocumentStore(SQLDocumentStore):
             index_buffer_size=index_buffer_size,
             vector_dim=faiss_index.d,
         )
+
+
+def _to_float32_array(embeddings) -> np.ndarray:
+    """Converts dense or scipy sparse embeddings to the C-contiguous float32 array FAISS expects"""
+    if issparse(embeddings):
+        embeddings = embeddings.toarray()
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
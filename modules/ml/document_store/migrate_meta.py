@@ -0,0 +1,41 @@
+"""Copies the metadata of the `meta` (entity-attribute-value) table into the wide
+`document_meta` table.
+
+Usage:
+    python -m modules.ml.document_store.migrate_meta --sql-url <url> [--index document]
+
+The migration can be re-run at any time, rows of `document_meta` are rebuilt from `meta`.
+"""
+import argparse
+
+from modules.ml.document_store.sql import SQLDocumentStore
+from modules.ml.utils import get_logger
+
+logger = get_logger()
+
+
+def migrate_meta(sql_url: str, index: str = "document", batch_size: int = 1000):
+    """Builds `document_meta` rows of all documents in `index` from `meta`.
+
+    Args:
+        sql_url (str): URL of the SQL database.
+        index (str, optional): Index of the documents. Defaults to "document".
+        batch_size (int, optional): Number of documents migrated per transaction.
+            Defaults to 1000.
+    """
+    document_store = SQLDocumentStore(
+        url=sql_url, index=index, batch_size=batch_size, wide_meta=True
+    )
+    logger.info(f"Migrating metadata of {document_store.get_document_count()} docs...")
+    document_store.refresh_wide_meta(index=index)
+    logger.info("Metadata migrated")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sql-url", required=True, help="URL of the SQL database")
+    parser.add_argument("--index", default="document", help="Index of the documents")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    migrate_meta(args.sql_url, index=args.index, batch_size=args.batch_size)
@@ -1,14 +1,37 @@
+import csv
+import io
 import itertools
 import logging
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
 from uuid import uuid4
 
 import pandas as pd
-from sqlalchemy import Column, DateTime, ForeignKey, String, Text, create_engine, func
+from sqlalchemy import (
+    JSON,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    bindparam,
+    cast,
+    create_engine,
+    exists,
+    func,
+    inspect,
+    select,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
-from sqlalchemy.sql import case, null
+from sqlalchemy.orm import relationship, scoped_session, sessionmaker
+from sqlalchemy.sql import and_, case, null, or_
 from tqdm.auto import tqdm
 
 from modules.ml.constants import META_MAPPING
@@ -23,6 +46,9 @@ Base = declarative_base()  # type: Any
 
 WHITELIST = ["genk", "cafebiz"]
 
+# Number of rows sent per COPY statement when bulk updating vector ids
+COPY_BUFFER_SIZE = 100000
+
 
 class ORMBase(Base):
     __abstract__ = True
@@ -58,6 +84,75 @@ class MetaORM(ORMBase):
     documents = relationship(DocumentORM, backref="Meta")
 
 
+class DocumentMetaORM(Base):
+    """Wide layout of the metadata, one row per document.
+    Hot metadata (see META_MAPPING) is kept in typed columns,
+    all metadata is kept in the `meta` JSON(B) column.
+    Rows are derived from `meta`, see `SQLDocumentStore.refresh_wide_meta`.
+    """
+
+    __tablename__ = "document_meta"
+
+    document_id = Column(
+        String(100),
+        ForeignKey("document.id", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    )
+    index = Column(String(100), nullable=False)
+    domain = Column(String(1000), index=True)
+    url = Column(Text)
+    title = Column(Text)
+    publish_date = Column(String(100), index=True)
+    meta = Column(JSON().with_variant(postgresql.JSONB(), "postgresql"))
+    updated = Column(DateTime, index=True)
+
+    __table_args__ = (
+        Index("ix_document_meta_meta", meta, postgresql_using="gin"),
+    )
+
+
+class SimilarityEdgeORM(Base):
+    """Similarity score between two documents, computed by a given model version.
+    Edges are undirected and stored with `doc_a` < `doc_b`.
+    """
+
+    __tablename__ = "similarity_edge"
+
+    doc_a = Column(
+        String(100),
+        ForeignKey("document.id", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    )
+    doc_b = Column(
+        String(100),
+        ForeignKey("document.id", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+    model_version = Column(String(100), primary_key=True, default="")
+    score = Column(Float, nullable=False)
+    computed_at = Column(DateTime, nullable=False, index=True)
+
+
+# Created by the web app, columns are quoted in mixed case
+SimilarDocsTable = Table(
+    "similar_docs",
+    MetaData(),
+    Column("sim_id", Text, primary_key=True),
+    Column("sim_score", Text),
+    Column("title_A", Text),
+    Column("title_B", Text),
+    Column("publish_date_A", Text),
+    Column("publish_date_B", Text),
+    Column("url_A", Text),
+    Column("url_B", Text),
+    Column("domain_A", Text),
+    Column("domain_B", Text),
+    Column("document_id_A", Text),
+    Column("document_id_B", Text),
+)
+
+
 class SQLDocumentStore(BaseDocumentStore):
     def __init__(
         self,
@@ -66,6 +161,7 @@ class SQLDocumentStore(BaseDocumentStore):
         label_index: str = "label",
         update_existing_documents: bool = False,
         batch_size: int = 1000,
+        wide_meta: bool = False,
     ):
         """An SQL backed DocumentStore. Currently supports SQLite, PostgreSQL and MySQL backends.
 
@@ -90,18 +186,27 @@ class SQLDocumentStore(BaseDocumentStore):
                 Tune this value based on host machine main memory.
                 For SQLite versions prior to v3.32.0 keep this value less than 1000.
                 More info refer: https://www.sqlite.org/limits.html. Defaults to 1000.
+            wide_meta (bool, optional): Whether to maintain the wide metadata table
+                `document_meta` along with `meta` and use it for meta filters and
+                similar pairs. Existing metadata can be copied into it with
+                `refresh_wide_meta` (see `migrate_meta`). Documents written without
+                the store, e.g. by the crawler pipeline, get their rows when they are
+                paired, and are filtered on `meta` until then. Defaults to False.
         """
         engine = create_engine(url)
         self.engine = engine
         ORMBase.metadata.create_all(engine)
-        Session = sessionmaker(bind=engine)
-        self.session = Session()
+        # Each thread gets its own session, so the store can serve concurrent readers
+        self.session = scoped_session(sessionmaker(bind=engine))
         self.index = index
         self.label_index = label_index
         self.update_existing_documents = update_existing_documents
         if getattr(self, "similarity", None) is None:
             self.similarity = None
         self.batch_size = batch_size
+        self.wide_meta = wide_meta
+        # Whether `sim_id` is unique in `similar_docs`, checked on the first write
+        self._sim_id_unique: Optional[bool] = None
 
     def get_document_by_id(
         self, id: str, index: Optional[str] = None
@@ -145,123 +250,264 @@ class SQLDocumentStore(BaseDocumentStore):
             for row in query.all():
                 documents.append(self._convert_sql_row_to_document(row))
 
-        sorted_documents = sorted(
-            documents, key=lambda doc: vector_ids.index(doc.vector_id)
-        )
+        positions = {vector_id: i for i, vector_id in enumerate(vector_ids)}
+        sorted_documents = sorted(documents, key=lambda doc: positions[doc.vector_id])
         return sorted_documents
 
-    def get_similar_documents_by_threshold(
+    def get_document_ids_by_vector_ids(
+        self, vector_ids: List[str], index: Optional[str] = None
+    ) -> Dict[str, str]:
+        """Fetches ids of documents by specifying a list of text vector id strings,
+        without loading their text or metadata.
+
+        Returns:
+            Dict[str, str]: Mapping of vector_id -> document_id
+        """
+        index = index or self.index
+
+        vector_id_map = {}
+        for i in range(0, len(vector_ids), self.batch_size):
+            query = self.session.query(DocumentORM.id, DocumentORM.vector_id).filter(
+                DocumentORM.vector_id.in_(vector_ids[i : i + self.batch_size]),
+                DocumentORM.index == index,
+            )
+            for row in query.all():
+                vector_id_map[row.vector_id] = row.id
+
+        return vector_id_map
+
+    def write_similarity_edges(
+        self, edges: List[Tuple[str, str, float]], model_version: Optional[str] = None
+    ):
+        """Upserts similarity scores between documents into `similarity_edge`.
+        Edges are undirected, A-->B and B-->A are stored as the same edge.
+
+        Args:
+            edges (List[Tuple[str, str, float]]): (document_id, document_id, score).
+            model_version (str, optional): Version of the model computing the scores.
+                Defaults to None.
+        """
+        computed_at = datetime.now()
+        rows: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for doc_a, doc_b, score in edges:
+            if doc_a > doc_b:
+                doc_a, doc_b = doc_b, doc_a
+            row = rows.get((doc_a, doc_b))
+            if row is None or score > row["score"]:
+                rows[(doc_a, doc_b)] = {
+                    "doc_a": doc_a,
+                    "doc_b": doc_b,
+                    "score": float(score),
+                    "model_version": model_version or "",
+                    "computed_at": computed_at,
+                }
+
+        table = SimilarityEdgeORM.__table__
+        dialect = self.engine.dialect.name
+        with self.engine.begin() as conn:
+            for chunk in self.chunked_iterable(rows.values(), size=self.batch_size):
+                if dialect == "postgresql":
+                    stmt = postgresql.insert(table)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=["doc_a", "doc_b", "model_version"],
+                        set_={
+                            "score": stmt.excluded.score,
+                            "computed_at": stmt.excluded.computed_at,
+                        },
+                    )
+                elif dialect == "sqlite":
+                    stmt = table.insert().prefix_with("OR REPLACE")
+                else:
+                    for row in chunk:
+                        conn.execute(
+                            table.delete()
+                            .where(table.c.doc_a == row["doc_a"])
+                            .where(table.c.doc_b == row["doc_b"])
+                            .where(table.c.model_version == row["model_version"])
+                        )
+                    stmt = table.insert()
+                conn.execute(stmt, list(chunk))
+
+    def get_similar_document_pairs(
         self,
         threshold: float = 0.50,
         from_time: datetime = None,
         to_time: datetime = None,
-    ) -> List[Document]:
-        """Fetches documents by specifying a threshold to filter the similarity scores in meta data"""
+    ) -> List[Dict[str, Any]]:
+        """Fetches pairs of similar documents from `similarity_edge` whose score
+        exceeds `threshold`, together with their pivoted metadata (see META_MAPPING),
+        in a single query.
 
-        # Update `updated` column with last update timestamp per `document_id`
-        with self.engine.connect() as conn:
-            conn.execute(
-                """
-        UPDATE meta AS m1
-        SET updated = m2.last_updated
-        FROM (
-            SELECT document_id
-                ,MAX(updated) last_updated
-            FROM meta
-            GROUP BY document_id
-            HAVING COUNT(DISTINCT updated) > 1
-            ) AS m2
-        WHERE m1.document_id = m2.document_id"""
-            )
+        Args:
+            threshold (float, optional): Minimum similarity score. Defaults to 0.50.
+            from_time (datetime, optional): Only consider scores computed after it.
+                Defaults to None.
+            to_time (datetime, optional): Only consider scores computed until it.
+                Defaults to None.
 
-        if not from_time and not to_time:  # get all
-            meta = self.session.query(MetaORM)
+        Returns:
+            List[Dict[str, Any]]: One row per pair, keyed by the columns of
+                `similar_docs` except `sim_id`. `document_id_A` < `document_id_B`.
+        """
+
+        from_time = from_time or datetime(1970, 1, 1)
+        to_time = to_time or datetime.now()
+
+        edge_filters = [
+            SimilarityEdgeORM.score > threshold,
+            SimilarityEdgeORM.computed_at > from_time,
+            SimilarityEdgeORM.computed_at <= to_time,
+        ]
+
+        edge_ids = self.session.query(SimilarityEdgeORM.doc_a).filter(*edge_filters)
+        edge_ids = edge_ids.union(
+            self.session.query(SimilarityEdgeORM.doc_b).filter(*edge_filters)
+        )
+        if self.wide_meta:
+            # Documents inserted without the store have no wide row yet
+            missing_ids = [
+                row.id
+                for row in self.session.query(DocumentORM.id).filter(
+                    DocumentORM.id.in_(edge_ids),
+                    ~exists().where(DocumentMetaORM.document_id == DocumentORM.id),
+                )
+            ]
+            if missing_ids:
+                self.refresh_wide_meta(missing_ids)
+            pair_meta = DocumentMetaORM.__table__
         else:
-            if not from_time:
-                from_time = datetime(1970, 1, 1)
-            if not to_time:
-                to_time = datetime.now()
-            meta = self.session.query(MetaORM).filter(
-                MetaORM.updated > from_time, MetaORM.updated <= to_time
+            pair_meta = (
+                self.session.query(
+                    MetaORM.document_id,
+                    *[
+                        _pivot_meta_column(names).label(key)
+                        for key, names in META_MAPPING.items()
+                    ],
+                )
+                .filter(
+                    MetaORM.name.in_(sum(META_MAPPING.values(), [])),
+                    MetaORM.document_id.in_(edge_ids),
+                )
+                .group_by(MetaORM.document_id)
+                .subquery()
             )
 
-        meta_df = pd.read_sql(
-            sql=f"""
-        SELECT DISTINCT m1.document_id_a
-            ,m2.document_id_b
-            ,m1.sim_score
-        FROM (
-            SELECT DISTINCT document_id AS document_id_a
-                ,value AS sim_score
-                ,updated
-                ,RIGHT(name, 2) AS rank
-            FROM meta
-            WHERE name LIKE 'sim_score%%'
-                AND cast(value AS DECIMAL) > {threshold}
-            ) AS m1
-        INNER JOIN (
-            SELECT DISTINCT document_id AS document_id_a
-                ,value AS document_id_b
-                ,RIGHT(name, 2) AS rank
-            FROM meta
-            WHERE name LIKE 'similar_to%%'
-            ) AS m2 ON m1.document_id_a = m2.document_id_a
-            AND m1.rank = m2.rank
-        INNER JOIN (
-            SELECT DISTINCT document_id
-                ,lower(value) AS "domain"
-            FROM meta
-            WHERE LOWER("name") IN ({", ".join(["'{}'".format(x) for x in META_MAPPING["domain"]])})
-            ) AS m3 ON m1.document_id_a = m3.document_id
-        INNER JOIN (
-            SELECT DISTINCT document_id
-                ,LOWER(value) AS "domain"
-            FROM meta
-            WHERE LOWER("name") IN ({", ".join(["'{}'".format(x) for x in META_MAPPING["domain"]])})
-            ) AS m4 ON m2.document_id_b = m4.document_id
-        --filter rules defined by PO
-        WHERE (m3.domain NOT IN ({", ".join(["'{}'".format(x) for x in WHITELIST])})
-            OR m4.domain NOT IN ({", ".join(["'{}'".format(x) for x in WHITELIST])}))
-        AND m3.domain != m4.domain
-        AND m1.updated > '{from_time.strftime("%Y-%m-%d %H:%M:%S")}'""",
-            con=self.engine,
+        meta_a = pair_meta.alias()
+        meta_b = pair_meta.alias()
+        domain_a = func.lower(meta_a.c.domain)
+        domain_b = func.lower(meta_b.c.domain)
+        query = (
+            self.session.query(
+                SimilarityEdgeORM.doc_a.label("document_id_A"),
+                SimilarityEdgeORM.doc_b.label("document_id_B"),
+                *[
+                    meta.c[key].label(f"{key}_{side}")
+                    for key in META_MAPPING
+                    for meta, side in ((meta_a, "A"), (meta_b, "B"))
+                ],
+                SimilarityEdgeORM.score,
+            )
+            .join(meta_a, meta_a.c.document_id == SimilarityEdgeORM.doc_a)
+            .join(meta_b, meta_b.c.document_id == SimilarityEdgeORM.doc_b)
+            .filter(
+                *edge_filters,
+                # filter rules defined by PO
+                or_(domain_a.notin_(WHITELIST), domain_b.notin_(WHITELIST)),
+                domain_a != domain_b,
+            )
+            .order_by(SimilarityEdgeORM.score.desc())
         )
 
-        documents = list()
-        document_id_AB = list()
-        for _, row in meta_df.iterrows():
-            document_id_AB.append(
-                sorted([row["document_id_a"], row["document_id_b"]])
-                + [row["sim_score"]]
-            )
-        # Remove duplicate A-->B and B-->A are identical
-        document_id_AB_set = set(tuple(x) for x in document_id_AB)
-        document_id_AB = [list(x) for x in document_id_AB_set]
+        pairs: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for row in query.all():
+            # Scores of several model versions may exist, keep the highest one
+            pair = row._asdict()
+            key = (pair["document_id_A"], pair["document_id_B"])
+            if key not in pairs:
+                pair["sim_score"] = str(pair.pop("score"))
+                pairs[key] = pair
+
+        return list(pairs.values())
 
-        for document_id in tqdm(document_id_AB):
-            meta_A = dict()
-            meta_B = dict()
+    def write_similar_document_pairs(self, pairs: List[Dict[str, Any]]) -> int:
+        """Inserts pairs of similar documents into `similar_docs`, pairs whose
+        `sim_id` already exists are skipped (ON CONFLICT DO NOTHING).
 
-            meta_A.update({"document_id": document_id[0]})
-            meta_B.update({"document_id": document_id[1]})
-            for row in meta.filter(MetaORM.document_id == document_id[0]).all():
-                if "sim" not in row.name:
-                    meta_A.update({row.name: row.value})
-            for row in meta.filter(MetaORM.document_id == document_id[1]).all():
-                if "sim" not in row.name:
-                    meta_B.update({row.name: row.value})
-            meta_A.update({"sim_score": document_id[2]})
-            meta_B.update({"sim_score": document_id[2]})
+        Args:
+            pairs (List[Dict[str, Any]]): Rows keyed by the columns of `similar_docs`.
+
+        Returns:
+            int: Number of inserted rows
+        """
+        table = SimilarDocsTable
+        table.create(self.engine, checkfirst=True)
+        if self._sim_id_unique is None:
+            # Tables holding duplicates stay so, they are not checked on each write
+            self._sim_id_unique = self._make_sim_id_unique()
+        unique = self._sim_id_unique
+        dialect = self.engine.dialect.name
+
+        n_inserted = 0
+        with self.engine.begin() as conn:
+            for chunk in self.chunked_iterable(pairs, size=self.batch_size):
+                chunk = list(chunk)
+                if unique and dialect == "postgresql":
+                    stmt = postgresql.insert(table).on_conflict_do_nothing(
+                        index_elements=["sim_id"]
+                    )
+                elif unique and dialect == "sqlite":
+                    stmt = table.insert().prefix_with("OR IGNORE")
+                else:
+                    existing = {
+                        sim_id
+                        for sim_id, in conn.execute(
+                            select([table.c.sim_id]).where(
+                                table.c.sim_id.in_([row["sim_id"] for row in chunk])
+                            )
+                        )
+                    }
+                    rows = {}
+                    for row in chunk:
+                        if row["sim_id"] not in existing:
+                            rows.setdefault(row["sim_id"], row)
+                    chunk = list(rows.values())
+                    stmt = table.insert()
+                if chunk:
+                    n_inserted += conn.execute(stmt.values(chunk)).rowcount
+        return n_inserted
+
+    def _make_sim_id_unique(self) -> bool:
+        """Makes `sim_id` unique in `similar_docs`, whose tables created by older
+        versions lack the primary key used for conflicts.
 
-            documents.append((meta_A, meta_B))
+        Returns:
+            bool: Whether `sim_id` is unique. It is not if the table already holds
+                duplicated ids, then existing ids are looked up before inserts.
+        """
+        inspector = inspect(self.engine)
+        if inspector.get_pk_constraint("similar_docs")["constrained_columns"] or any(
+            index["unique"] and index["column_names"] == ["sim_id"]
+            for index in inspector.get_indexes("similar_docs")
+        ):
+            return True
 
-        return documents
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS similar_docs_sim_id_key "
+                    'ON similar_docs ("sim_id")'
+                )
+            return True
+        except DBAPIError as e:
+            logger.warning(f"sim_id of similar_docs could not be made unique: {e}")
+            return False
 
     def get_all_documents(
         self,
         index: Optional[str] = None,
         filters: Optional[Dict[str, List[str]]] = None,
         return_embedding: Optional[bool] = None,
+        only_documents_without_embedding: bool = False,
     ) -> List[Document]:
         """Gets all documents from the DocumentStore.
 
@@ -272,9 +518,12 @@ class SQLDocumentStore(BaseDocumentStore):
             filters (Dict[str, List[str]], optional): Optional filters to narrow down
                 the documents to return.
                 Example: {"name": ["some", "more"], "category": ["only_one"]}.
-                Defaults to None.
+                With `wide_meta`, the keys of META_MAPPING (e.g. "domain") filter on
+                the columns of `document_meta`. Defaults to None.
             return_embedding (bool, optional): Whether to return the document embeddings.
                 Defaults to None.
+            only_documents_without_embedding (bool, optional): Return only documents
+                which have no vector_id yet. Defaults to False.
 
         Returns:
             List[Document]
@@ -287,6 +536,10 @@ class SQLDocumentStore(BaseDocumentStore):
             DocumentORM.id, DocumentORM.text, DocumentORM.vector_id
         ).filter_by(index=index)
 
+        if only_documents_without_embedding:
+            documents_query = documents_query.filter(DocumentORM.vector_id.is_(None))
+
+        documents_query, filters = self._filter_wide_meta(documents_query, filters)
         if filters:
             documents_query = documents_query.join(MetaORM)
             for key, values in filters.items():
@@ -322,6 +575,111 @@ class SQLDocumentStore(BaseDocumentStore):
 
         return list(documents_map.values())
 
+    def refresh_wide_meta(
+        self, document_ids: Optional[List[str]] = None, index: Optional[str] = None
+    ):
+        """Rebuilds rows of the wide metadata table `document_meta` from `meta`.
+
+        Args:
+            document_ids (List[str], optional): Documents to refresh.
+                Defaults to None, refreshing all documents of `index`.
+            index (str, optional): Index of the documents when refreshing all of them.
+                Defaults to None.
+        """
+        if document_ids is None:
+            document_ids = self.get_document_ids(index=index or self.index)
+
+        for chunk in tqdm(
+            list(self.chunked_iterable(document_ids, size=self.batch_size)),
+            disable=len(document_ids) <= self.batch_size,
+            desc="Refreshing wide meta",
+        ):
+            rows = {
+                row.id: {"document_id": row.id, "index": row.index, "meta": {}}
+                for row in self.session.query(DocumentORM.id, DocumentORM.index).filter(
+                    DocumentORM.id.in_(chunk)
+                )
+            }
+            meta_query = self.session.query(
+                MetaORM.document_id, MetaORM.name, MetaORM.value
+            ).filter(MetaORM.document_id.in_(chunk))
+            for row in meta_query.all():
+                rows[row.document_id]["meta"][row.name] = row.value
+
+            updated = datetime.now()
+            for row in rows.values():
+                row.update(_pivot_meta(row["meta"]), updated=updated)
+
+            self.session.query(DocumentMetaORM).filter(
+                DocumentMetaORM.document_id.in_(chunk)
+            ).delete(synchronize_session=False)
+            self.session.bulk_insert_mappings(DocumentMetaORM, list(rows.values()))
+            try:
+                self.session.commit()
+            except Exception as ex:
+                logger.error(f"Transaction rollback: {ex.__cause__}")
+                self.session.rollback()
+                raise ex
+
+    def get_document_pages(
+        self,
+        index: Optional[str] = None,
+        page_size: int = 10000,
+        only_documents_without_embedding: bool = False,
+        from_vector_id: Optional[int] = None,
+    ) -> Iterator[List[Document]]:
+        """Iterates over documents page by page, ordered by id.
+        Pages are fetched with keyset pagination, so each page is read only when
+        it is requested and documents may be updated between pages.
+        Documents are returned without meta.
+
+        Args:
+            index (str, optional): Name of the index to get the documents from.
+                Defaults to self.index.
+            page_size (int, optional): Number of documents per page. Defaults to 10000.
+            only_documents_without_embedding (bool, optional): Return only documents
+                which have no vector_id yet. Defaults to False.
+            from_vector_id (int, optional): Return only documents whose vector_id is
+                greater than or equal to it, ordered by vector_id instead of id.
+                Defaults to None.
+
+        Yields:
+            List[Document]
+        """
+        index = index or self.index
+        if from_vector_id is None:
+            key = DocumentORM.id
+        else:
+            key = cast(DocumentORM.vector_id, Integer)
+        last_key = None
+        while True:
+            documents_query = self.session.query(
+                DocumentORM.id, DocumentORM.text, DocumentORM.vector_id
+            ).filter_by(index=index)
+            if only_documents_without_embedding:
+                documents_query = documents_query.filter(
+                    DocumentORM.vector_id.is_(None)
+                )
+            if from_vector_id is not None:
+                documents_query = documents_query.filter(
+                    DocumentORM.vector_id.isnot(None), key >= from_vector_id
+                )
+            if last_key is not None:
+                documents_query = documents_query.filter(key > last_key)
+
+            rows = documents_query.order_by(key).limit(page_size).all()
+            if not rows:
+                return
+
+            if from_vector_id is None:
+                last_key = rows[-1].id
+            else:
+                last_key = int(rows[-1].vector_id)
+            yield [
+                Document(id=row.id, text=row.text, vector_id=row.vector_id)
+                for row in rows
+            ]
+
     def write_documents(
         self, documents: Union[List[dict], List[Document]], index: Optional[str] = None
     ):
@@ -387,6 +745,11 @@ class SQLDocumentStore(BaseDocumentStore):
                 self.session.rollback()
                 raise ex
 
+            if self.wide_meta:
+                self.refresh_wide_meta(
+                    [doc.id for doc in document_objects[i : i + self.batch_size]]
+                )
+
     def reset_vector_ids(self, index: Optional[str] = None):
         """Sets vector IDs for all documents as None
         """
@@ -396,10 +759,38 @@ class SQLDocumentStore(BaseDocumentStore):
         )
         self.session.commit()
 
+    def reset_vector_ids_from(self, vector_id: int, index: Optional[str] = None):
+        """Sets vector IDs as None for all documents whose vector ID is greater than
+        or equal to given `vector_id`
+        """
+        index = index or self.index
+        self.session.query(DocumentORM).filter(
+            DocumentORM.index == index,
+            DocumentORM.vector_id.isnot(None),
+            cast(DocumentORM.vector_id, Integer) >= vector_id,
+        ).update({DocumentORM.vector_id: null()}, synchronize_session=False)
+        self.session.commit()
+
+    def get_embedded_document_count(
+        self, index: Optional[str] = None, from_vector_id: Optional[int] = None
+    ) -> int:
+        """Returns the number of documents which have a vector ID, greater than or
+        equal to `from_vector_id` if given
+        """
+        index = index or self.index
+        query = self.session.query(DocumentORM).filter(
+            DocumentORM.index == index, DocumentORM.vector_id.isnot(None)
+        )
+        if from_vector_id is not None:
+            query = query.filter(cast(DocumentORM.vector_id, Integer) >= from_vector_id)
+        return query.count()
+
     def update_vector_ids(
         self, vector_id_map: Dict[str, str], index: Optional[str] = None
     ):
         """Updates vector_ids for given document_ids.
+        On PostgreSQL the pairs are copied into a temporary table and applied with
+        a single UPDATE ... FROM join, other backends use one executemany UPDATE.
 
         Args:
             vector_id_map (Dict[str, str]): dict containing mapping of document_id -> vector_id.
@@ -409,20 +800,60 @@ class SQLDocumentStore(BaseDocumentStore):
         Raises:
             Exception: raised when session can not commit.
         """
+        if not vector_id_map:
+            return
+
         index = index or self.index
-        for chunk_map in self.chunked_dict(vector_id_map, size=self.batch_size):
-            self.session.query(DocumentORM).filter(
-                DocumentORM.id.in_(chunk_map), DocumentORM.index == index
-            ).update(
-                {DocumentORM.vector_id: case(chunk_map, value=DocumentORM.id)},
-                synchronize_session=False,
+        try:
+            if self.engine.dialect.name == "postgresql":
+                self._copy_vector_ids(vector_id_map, index=index)
+            else:
+                table = DocumentORM.__table__
+                self.session.execute(
+                    table.update()
+                    .where(table.c.id == bindparam("_id"))
+                    .where(table.c.index == index)
+                    .values(vector_id=bindparam("_vector_id")),
+                    [
+                        {"_id": id, "_vector_id": str(vector_id)}
+                        for id, vector_id in vector_id_map.items()
+                    ],
+                )
+            self.session.commit()
+        except Exception as ex:
+            logger.error(f"Transaction rollback: {ex.__cause__}")
+            self.session.rollback()
+            raise ex
+
+    def _copy_vector_ids(self, vector_id_map: Dict[str, str], index: str):
+        """Streams (id, vector_id) pairs into a temporary table with COPY and applies
+        them to `document` in one statement. Runs in the transaction of the session.
+        """
+        cursor = self.session.connection().connection.cursor()
+        try:
+            cursor.execute(
+                "CREATE TEMP TABLE tmp_vector_id "
+                "(id VARCHAR(100) PRIMARY KEY, vector_id VARCHAR(100)) "
+                "ON COMMIT DROP"
             )
-            try:
-                self.session.commit()
-            except Exception as ex:
-                logger.error(f"Transaction rollback: {ex.__cause__}")
-                self.session.rollback()
-                raise ex
+            for chunk_map in self.chunked_dict(vector_id_map, size=COPY_BUFFER_SIZE):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(
+                    (id, str(vector_id)) for id, vector_id in chunk_map.items()
+                )
+                buffer.seek(0)
+                cursor.copy_expert(
+                    "COPY tmp_vector_id (id, vector_id) FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+            cursor.execute(
+                "UPDATE document SET vector_id = tmp_vector_id.vector_id "
+                "FROM tmp_vector_id "
+                'WHERE document.id = tmp_vector_id.id AND document."index" = %s',
+                (index,),
+            )
+        finally:
+            cursor.close()
 
     def update_document_meta(self, id: str, meta: Dict[str, str]):
         """Updates the metadata dictionary of a document by specifying its string id
@@ -443,6 +874,9 @@ class SQLDocumentStore(BaseDocumentStore):
             self.session.add(m)
         self.session.commit()
 
+        if self.wide_meta:
+            self.refresh_wide_meta([id])
+
     def update_documents_meta(self, id_meta: List[Dict[str, str]]):
         """Updates the metadata dictionary of multiple documents
         """
@@ -501,6 +935,9 @@ class SQLDocumentStore(BaseDocumentStore):
             )
         self.engine.execute(MetaORM.__table__.insert().values(insert))
 
+        if self.wide_meta:
+            self.refresh_wide_meta(document_ids)
+
     def get_document_count(
         self,
         filters: Optional[Dict[str, List[str]]] = None,
@@ -511,6 +948,7 @@ class SQLDocumentStore(BaseDocumentStore):
         index = index or self.index
         query = self.session.query(DocumentORM).filter_by(index=index)
 
+        query, filters = self._filter_wide_meta(query, filters)
         if filters:
             query = query.join(MetaORM)
             for key, values in filters.items():
@@ -519,6 +957,39 @@ class SQLDocumentStore(BaseDocumentStore):
         count = query.count()
         return count
 
+    def _filter_wide_meta(
+        self, query, filters: Optional[Dict[str, List[str]]]
+    ) -> Tuple[Any, Optional[Dict[str, List[str]]]]:
+        """Applies filters on columns of `document_meta` to a query on DocumentORM.
+        Documents which have no row in `document_meta` are filtered on `meta`.
+
+        Returns:
+            tuple: The filtered query and the remaining filters for `meta`
+        """
+        if not self.wide_meta or not filters:
+            return query, filters
+
+        wide_filters = {k: v for k, v in filters.items() if k in META_MAPPING}
+        if wide_filters:
+            query = query.outerjoin(
+                DocumentMetaORM, DocumentMetaORM.document_id == DocumentORM.id
+            )
+            for key, values in wide_filters.items():
+                meta_ids = self.session.query(MetaORM.document_id).filter(
+                    MetaORM.name.in_(META_MAPPING[key]), MetaORM.value.in_(values)
+                )
+                query = query.filter(
+                    or_(
+                        getattr(DocumentMetaORM, key).in_(values),
+                        and_(
+                            DocumentMetaORM.document_id.is_(None),
+                            DocumentORM.id.in_(meta_ids),
+                        ),
+                    )
+                )
+
+        return query, {k: v for k, v in filters.items() if k not in META_MAPPING}
+
     def get_document_ids(
         self,
         from_time: datetime = None,
@@ -551,6 +1022,41 @@ class SQLDocumentStore(BaseDocumentStore):
             )
         return [row.id for row in query.all()]
 
+    def get_updated_document_ids(
+        self, from_time: datetime, index: Optional[str] = None
+    ) -> List[Tuple[str, datetime]]:
+        """Returns ids of documents updated at or after `from_time`, with their
+        `updated` timestamps, ordered by timestamp.
+
+        Args:
+            from_time (datetime): Lower bound (inclusive) of `updated`.
+            index (str, optional): Specify an index name if needed. Defaults to None.
+
+        Returns:
+            List[Tuple[str, datetime]]: (id, updated) pairs
+        """
+        index = index or self.index
+        query = (
+            self.session.query(DocumentORM.id, DocumentORM.updated)
+            .filter(DocumentORM.updated >= from_time, DocumentORM.index == index)
+            .order_by(DocumentORM.updated, DocumentORM.id)
+        )
+        return [(row.id, row.updated) for row in query.all()]
+
+    def get_existing_document_ids(
+        self, ids: List[str], index: Optional[str] = None
+    ) -> Set[str]:
+        """Returns the subset of given document ids which exist in the DocumentStore"""
+        index = index or self.index
+        existing_ids = set()
+        for i in range(0, len(ids), self.batch_size):
+            query = self.session.query(DocumentORM.id).filter(
+                DocumentORM.id.in_(ids[i : i + self.batch_size]),
+                DocumentORM.index == index,
+            )
+            existing_ids.update(row.id for row in query.all())
+        return existing_ids
+
     def _convert_sql_row_to_document(self, row) -> Document:
         document = Document(
             id=row.id, text=row.text, meta={meta.name: meta.value for meta in row.meta}
@@ -595,6 +1101,9 @@ class SQLDocumentStore(BaseDocumentStore):
                 "Delete by filters is not implemented for SQLDocumentStore."
             )
         index = index or self.index
+        self.session.query(DocumentMetaORM).filter_by(index=index).delete(
+            synchronize_session=False
+        )
         documents = self.session.query(DocumentORM).filter_by(index=index)
         documents.delete(synchronize_session=False)
 
@@ -621,3 +1130,26 @@ class SQLDocumentStore(BaseDocumentStore):
         it = iter(dictionary)
         for i in range(0, len(dictionary), size):
             yield {k: dictionary[k] for k in itertools.islice(it, size)}
+
+
+def _pivot_meta_column(names: List[str]):
+    """SQL expression selecting the value of the last of `names` present in `meta`,
+    same as `meta_parser`. To be used in a query grouped by document_id.
+    """
+    values = [
+        func.max(case([(MetaORM.name == name, MetaORM.value)]))
+        for name in reversed(names)
+    ]
+    return func.coalesce(*values) if len(values) > 1 else values[0]
+
+
+def _pivot_meta(meta: Dict[str, str]) -> Dict[str, Any]:
+    """Extracts the typed columns of `DocumentMetaORM` from a metadata dictionary"""
+    row: Dict[str, Any] = {}
+    # Later names in META_MAPPING take precedence, same as `meta_parser`
+    for key, names in META_MAPPING.items():
+        row[key] = None
+        for name in names:
+            if name in meta:
+                row[key] = meta[name]
+    return row
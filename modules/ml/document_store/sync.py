@@ -0,0 +1,103 @@
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Union
+
+from modules.ml.document_store.sql import SQLDocumentStore
+from modules.ml.utils import get_logger
+
+logger = get_logger()
+
+
+class DocumentSync:
+    """Finds documents of a source DocumentStore which are missing in a target
+    DocumentStore.
+
+    A high-water mark of the source `updated` timestamps is persisted in a JSON file,
+    so each run only fetches rows updated since the previous one. Without a mark,
+    a full reconciliation diffs the source ids against all target ids.
+    """
+
+    def __init__(
+        self,
+        source: SQLDocumentStore,
+        target: SQLDocumentStore,
+        state_path: Union[str, Path],
+        index: Optional[str] = None,
+    ):
+        """
+        Attributes:
+            source (SQLDocumentStore): DocumentStore to fetch new documents from.
+            target (SQLDocumentStore): DocumentStore the documents are written to.
+            state_path (Union[str, Path]): JSON file to persist the high-water mark in.
+            index (str, optional): Index name of the documents. Defaults to None.
+        """
+        self.source = source
+        self.target = target
+        self.state_path = Path(state_path)
+        self.index = index or target.index
+
+        self.high_water_mark = self._load_high_water_mark()
+        self._pending_high_water_mark: Optional[datetime] = None
+
+    def get_new_ids(
+        self, from_time: datetime, full_reconciliation: bool = False
+    ) -> List[str]:
+        """Returns sorted ids of source documents which are not in the target yet.
+        Call `commit` once they are written to the target.
+
+        Args:
+            from_time (datetime): Oldest `updated` timestamp to consider when there is
+                no high-water mark yet, or for a full reconciliation.
+            full_reconciliation (bool, optional): Ignore the high-water mark and diff
+                against all ids of the target. Defaults to False.
+
+        Returns:
+            List[str]: Ids of new documents
+        """
+        if full_reconciliation or self.high_water_mark is None:
+            rows = self.source.get_updated_document_ids(from_time, index=self.index)
+            target_ids = set(self.target.get_document_ids(index=self.index))
+            new_ids = [id for id, _ in rows if id not in target_ids]
+            logger.info(f"Full reconciliation of {len(rows)} ids since {from_time}")
+        else:
+            # Rows updated at the mark itself are fetched again, as more rows with
+            # the same timestamp may have been committed after the previous run
+            rows = self.source.get_updated_document_ids(
+                self.high_water_mark, index=self.index
+            )
+            existing_ids = self.target.get_existing_document_ids(
+                [id for id, _ in rows], index=self.index
+            )
+            new_ids = [id for id, _ in rows if id not in existing_ids]
+
+        if rows:
+            self._pending_high_water_mark = max(
+                rows[-1][1], self.high_water_mark or rows[-1][1]
+            )
+
+        return sorted(set(new_ids))
+
+    def commit(self):
+        """Persists the high-water mark of the last `get_new_ids` call"""
+        if self._pending_high_water_mark is None:
+            return
+
+        self.high_water_mark = self._pending_high_water_mark
+        self._pending_high_water_mark = None
+
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"high_water_mark": self.high_water_mark.isoformat()}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _load_high_water_mark(self) -> Optional[datetime]:
+        if not self.state_path.exists():
+            return None
+        try:
+            with open(self.state_path, "r") as f:
+                return datetime.fromisoformat(json.load(f)["high_water_mark"])
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Invalid sync state {self.state_path}, ignoring it: {e}")
+            return None
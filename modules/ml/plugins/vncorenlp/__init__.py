@@ -1,7 +1,23 @@
 import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import List
 
 from vncorenlp import VnCoreNLP
 
+# Word put between the texts of a batch, to split the segmented batch again
+BATCH_SEPARATOR = "vncorenlpbatchseparator"
+
+
+def _create_instance() -> VnCoreNLP:
+    cur_dir = os.path.dirname(os.path.abspath(__file__))
+    return VnCoreNLP(
+        os.path.join(cur_dir, "VnCoreNLP-1.1.1.jar"),
+        annotators="wseg",
+        max_heap_size="-Xmx500m",
+    )
+
 
 class VnCoreNLPSingleton:
     _instance = None
@@ -9,10 +25,119 @@ class VnCoreNLPSingleton:
     @classmethod
     def get_instance(cls):
         if cls._instance is None:
-            cur_dir = os.path.dirname(os.path.abspath(__file__))
-            cls._instance = VnCoreNLP(
-                os.path.join(cur_dir, "VnCoreNLP-1.1.1.jar"),
-                annotators="wseg",
-                max_heap_size="-Xmx500m",
-            )
+            cls._instance = _create_instance()
         return cls._instance
+
+
+class VnCoreNLPPool:
+    """Word segmentation on several VnCoreNLP servers in parallel.
+
+    Texts are segmented in batches of up to `max_batch_chars` characters, one
+    request per batch, by one thread per server. At most `max_pending` batches
+    are queued, `segment_many` blocks until the queue has room.
+
+    Processes forked after the pool is created share its servers, so create it
+    before forking workers (see `ViPreProcessor`) to start each server only once.
+    """
+
+    _instance = None
+
+    def __init__(
+        self,
+        n_workers: int = 1,
+        max_batch_chars: int = 20000,
+        max_pending: int = 64,
+    ):
+        """
+        Attributes:
+            n_workers (int, optional): Number of VnCoreNLP servers, the first one
+                is the shared `VnCoreNLPSingleton` instance. Defaults to 1.
+            max_batch_chars (int, optional): Maximum number of characters segmented
+                per request. Defaults to 20000.
+            max_pending (int, optional): Maximum number of queued batches.
+                Defaults to 64.
+        """
+        self.max_batch_chars = max_batch_chars
+        self.max_pending = max_pending
+
+        self.instances = [VnCoreNLPSingleton.get_instance()]
+        self.instances += [_create_instance() for _ in range(n_workers - 1)]
+        self._start()
+
+    def _start(self):
+        """Starts one thread per server. Threads do not survive a fork, so they are
+        started again in forked processes, which share the servers.
+        """
+        self._pid = os.getpid()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=self.max_pending)
+        for instance in self.instances:
+            threading.Thread(target=self._work, args=(instance,), daemon=True).start()
+
+    @classmethod
+    def get_instance(cls):
+        """Returns the shared pool, sized by the `VNCORENLP_WORKERS` variable"""
+        if cls._instance is None:
+            cls._instance = cls(n_workers=int(os.getenv("VNCORENLP_WORKERS", 1)))
+        return cls._instance
+
+    def segment_many(self, texts: List[str]) -> List[List[str]]:
+        """Segments `texts` into words, words of a text are joined by underscores.
+
+        Args:
+            texts (List[str]): Texts to segment.
+
+        Returns:
+            List[List[str]]: Words of each text, across its sentences.
+        """
+        if self._pid != os.getpid():
+            self._start()
+
+        futures = [self._submit(batch) for batch in self._batches(texts)]
+        return [words for future in futures for words in future.result()]
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        batches: List[List[str]] = []
+        n_chars = 0
+        for text in texts:
+            if not batches or n_chars + len(text) > self.max_batch_chars:
+                batches.append([])
+                n_chars = 0
+            batches[-1].append(text)
+            n_chars += len(text)
+        return batches
+
+    def _submit(self, batch: List[str]) -> Future:
+        future: Future = Future()
+        self._queue.put((batch, future))
+        return future
+
+    def _work(self, instance: VnCoreNLP):
+        while True:
+            batch, future = self._queue.get()
+            try:
+                future.set_result(_segment_batch(instance, batch))
+            except Exception as e:
+                future.set_exception(e)
+
+
+def _segment_batch(instance: VnCoreNLP, batch: List[str]) -> List[List[str]]:
+    """Segments the texts of `batch` in a single request if possible"""
+    if len(batch) > 1:
+        words = _tokenize(instance, f"\n{BATCH_SEPARATOR}\n".join(batch))
+        results: List[List[str]] = [[]]
+        for word in words:
+            if word == BATCH_SEPARATOR:
+                results.append([])
+            else:
+                results[-1].append(word)
+        # The separator may have been merged with adjacent words
+        if len(results) == len(batch):
+            return results
+
+    return [_tokenize(instance, text) for text in batch]
+
+
+def _tokenize(instance: VnCoreNLP, text: str) -> List[str]:
+    if not text.strip():
+        return []
+    return [word for sentence in instance.tokenize(text) for word in sentence]
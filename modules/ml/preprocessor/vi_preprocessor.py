@@ -7,7 +7,8 @@ from typing import Any, Dict, List, Optional
 import nltk
 from more_itertools.more import windowed
 
-from modules.ml.plugins.vncorenlp import VnCoreNLPSingleton
+from modules.ml.plugins.vncorenlp import VnCoreNLPPool, VnCoreNLPSingleton
+from modules.ml.plugins.vncorenlp.rdrsegmenter import RDRSegmenter
 
 from .base import BasePreProcessor
 from .cleaning import normalize_text
@@ -23,6 +24,7 @@ class ViPreProcessor(BasePreProcessor):
         split_overlap: Optional[int] = None,
         split_respect_sentence_boundary: Optional[bool] = True,
         use_fixed_stopwords: Optional[bool] = False,
+        word_segmenter: Optional[str] = "vncorenlp",
     ):
         """
         Attributes:
@@ -44,9 +46,32 @@ class ViPreProcessor(BasePreProcessor):
                 the number of words will be <= split_length.. Defaults to True.
             use_fixed_stopwords (bool, optional): remove stopwords that appears in pre-defined files.
                 Defaults to False.
+            word_segmenter (str, optional): "vncorenlp" to segment words on VnCoreNLP
+                servers, or "rdr" to segment them in process with `RDRSegmenter`,
+                which is also used if VnCoreNLP cannot be started.
+                Defaults to "vncorenlp".
         """
-        nltk.download("punkt")
-        self.rdrsegmenter = VnCoreNLPSingleton.get_instance()
+        if word_segmenter not in ("vncorenlp", "rdr"):
+            raise ValueError(f"Unknown word segmenter: {word_segmenter}")
+
+        # Punkt is bundled in the docker images, it is only downloaded if missing
+        try:
+            nltk.data.find("tokenizers/punkt")
+        except LookupError:
+            nltk.download("punkt")
+        self.rdrsegmenter: Any = None
+        self.vncorenlp_pool: Optional[VnCoreNLPPool] = None
+        if word_segmenter == "vncorenlp":
+            try:
+                self.rdrsegmenter = VnCoreNLPSingleton.get_instance()
+                # Started now rather than on first use, so that processes forked
+                # afterwards share its servers instead of starting their own
+                self.vncorenlp_pool = VnCoreNLPPool.get_instance()
+            except Exception as e:
+                logger.warning(f"VnCoreNLP unavailable, segmenting in process: {e}")
+                self.rdrsegmenter = None
+        if self.rdrsegmenter is None:
+            self.rdrsegmenter = RDRSegmenter.get_instance()
 
         self.use_fixed_stopwords = use_fixed_stopwords
         self.split_by = split_by
@@ -71,6 +96,30 @@ class ViPreProcessor(BasePreProcessor):
         document["text"] = text
         return document
 
+    def clean_many(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Performs document cleaning on many documents at once, segmenting their
+        words in batches on the VnCoreNLP servers of `VnCoreNLPPool`, if used.
+        Same as calling `clean` on each document.
+        """
+        texts = self.segment_many([normalize_text(doc["text"]) for doc in documents])
+        for document, text in zip(documents, texts):
+            document["text"] = _clean_vncore_result(text)
+        return documents
+
+    def segment_many(self, texts: List[str]) -> List[str]:
+        """Segments the words of many texts at once, see `_word_segment`"""
+        if isinstance(self.rdrsegmenter, RDRSegmenter):
+            segmenter = self.rdrsegmenter
+        else:
+            segmenter = self.vncorenlp_pool
+
+        results = []
+        for words in segmenter.segment_many(texts):
+            if self.use_fixed_stopwords:
+                words = [w for w in words if w not in self.stopwords]
+            results.append(" ".join(words))
+        return results
+
     def split(self, document: Dict[str, Any]) -> List[Dict[str, Any]]:
         if not self.split_by:
             return [document]
@@ -163,7 +212,8 @@ class ViPreProcessor(BasePreProcessor):
         return documents
 
     def _word_segment(self, text: str) -> str:
-        """Uses VnCoreNLP-based tokenizer for word segmentation.
+        """Uses VnCoreNLP-based tokenizer, or its in-process port, for word
+        segmentation.
         """
         sentences = self.rdrsegmenter.tokenize(text)
 
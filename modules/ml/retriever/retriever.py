@@ -1,7 +1,11 @@
+import os
 from typing import Any, Dict, List, Tuple
 
+import numpy as np
+from scipy.sparse import issparse
 from tqdm import tqdm
 
+from modules.ml.document_store.embedding_store import EmbeddingStore
 from modules.ml.document_store.faiss import FAISSDocumentStore
 from modules.ml.preprocessor.vi_preprocessor import ViPreProcessor
 from modules.ml.schema import Document
@@ -10,6 +14,10 @@ from modules.ml.vectorizer.base import DocVectorizerBase
 
 logger = get_logger()
 
+# Upper bound on the number of (query, candidate) embedding rows gathered at once
+# while reranking a batch, keeps memory bounded for large candidate matrices
+RERANK_BUFFER_SIZE = 5000
+
 
 class Retriever:
     def __init__(
@@ -17,6 +25,7 @@ class Retriever:
         document_store: FAISSDocumentStore = None,
         candidate_vectorizer: DocVectorizerBase = None,
         retriever_vectorizer: DocVectorizerBase = None,
+        embedding_store: EmbeddingStore = None,
     ):
         """Inits an instance of a Retriever.
 
@@ -27,11 +36,15 @@ class Retriever:
                 to convert QUERY documents (in database) to embedding. Defaults to None.
             retriever_vectorizer (DocVectorizerBase, optional): An instance of vectorizer
                 to convert CANDIDATE documents to embeddings. Defaults to None.
+            embedding_store (EmbeddingStore, optional): Persistent store of embeddings
+                computed by retriever vectorizer, reused when reranking candidates
+                instead of vectorizing their text again. Defaults to None.
         """
 
         self.document_store: FAISSDocumentStore = document_store
         self.candidate_vectorizer: DocVectorizerBase = candidate_vectorizer
         self.retriever_vectorizer: DocVectorizerBase = retriever_vectorizer
+        self.embedding_store: EmbeddingStore = embedding_store
 
         if not self.document_store:
             raise ValueError(
@@ -113,6 +126,7 @@ class Retriever:
 
         if not retrain:
             self.retriever_vectorizer = DocVectorizerBase.load(save_path)
+            self._use_embedding_store()
             return
 
         if not self.retriever_vectorizer:
@@ -137,14 +151,60 @@ class Retriever:
         self.sparse_documnet_embedding = self.retriever_vectorizer.fit_transform(
             self.training_documents
         )
+        # Embeddings computed by the previous model are invalidated here
+        self._use_embedding_store()
 
         if save_path:
             self.retriever_vectorizer.save(save_path)
 
+    def _use_embedding_store(self) -> bool:
+        """Points `embedding_store` to the version of current retriever vectorizer.
+
+        Returns:
+            bool: Whether the embedding store can be used
+        """
+        if self.embedding_store is None:
+            return False
+
+        version = self.retriever_vectorizer.version
+        if version is None:
+            return False
+
+        self.embedding_store.use_version(version)
+        return True
+
+    def _update_embedding_store(self, documents: List[Document]):
+        """Writes retriever embeddings of documents which are not stored yet
+        """
+        documents = [doc for doc in documents if doc.id not in self.embedding_store]
+        batch_size = self.document_store.batch_size
+        for i in range(0, len(documents), batch_size):
+            batch = documents[i : i + batch_size]
+            self.embedding_store.write_embeddings(
+                [doc.id for doc in batch],
+                self.retriever_vectorizer.transform([doc.text for doc in batch]),
+            )
+
     def update_embeddings(
-        self, retrain: bool = True, save_path: str = None, sql_url: str = None
+        self,
+        retrain: bool = True,
+        save_path: str = None,
+        sql_url: str = None,
+        update_existing_embeddings: bool = True,
     ):
         """Updates embeddings of documents with candidate vectorizer to `document_store`.
+
+        Args:
+            retrain (bool, optional): Whether to (re)compute the embeddings or load
+                the saved index from `save_path`. Defaults to True.
+            save_path (str, optional): Path of the FAISS index file, published with
+                a single file replacement once all documents are embedded. The
+                update is checkpointed to `save_path` + ".checkpoint", which is
+                removed once published. Defaults to None.
+            sql_url (str, optional): SQL database of the saved index. Defaults to None.
+            update_existing_embeddings (bool, optional): Whether to re-embed all
+                documents, or only append the new ones to the existing index.
+                Defaults to True.
         """
         if retrain:
             if not self.candidate_vectorizer.is_trained:
@@ -153,9 +213,16 @@ class Retriever:
                     " Try to call train_candidate_vectorizer first."
                 )
 
-            self.document_store.update_embeddings(self.candidate_vectorizer)
+            checkpoint_path = f"{save_path}.checkpoint" if save_path else None
+            self.document_store.update_embeddings(
+                self.candidate_vectorizer,
+                update_existing_embeddings=update_existing_embeddings,
+                checkpoint_path=checkpoint_path,
+            )
             if save_path:
                 self.document_store.save(file_path=save_path)
+                if os.path.isfile(checkpoint_path):
+                    os.remove(checkpoint_path)
         else:
             self.document_store = FAISSDocumentStore.load(
                 faiss_file_path=save_path, sql_url=sql_url
@@ -215,6 +282,8 @@ class Retriever:
         candidate_embs = self.retriever_vectorizer.transform(candidate_docs_text)
 
         scores = candidate_embs.dot(query_emb.T)
+        if issparse(scores):
+            scores = scores.toarray()
         idx_scores = [(idx, score) for idx, score in enumerate(scores)]
 
         # 0 location is the query_text itself, so pick the next ones
@@ -222,7 +291,181 @@ class Retriever:
             1 : top_k_results + 1
         ]
 
-        return [[candidate_docs_id[score[0]], score[1]] for score in highest_scores]
+        return [
+            [candidate_docs_id[score[0]], score[1][0]] for score in highest_scores
+        ]
+
+    def _batch_calc_scores_for_candidates(
+        self,
+        query_texts: List[str],
+        candidate_id_matrix,
+        top_k_results: int = 10,
+        query_ids: List[str] = None,
+        skip_first: bool = True,
+    ) -> List[List[List[Any]]]:
+        """Caculates scores for candidates of a whole batch of queries in 2nd phase.
+        Each distinct candidate is fetched and vectorized only once for the batch.
+
+        Args:
+            query_texts (List[str]): The documents to query.
+            candidate_id_matrix (np.ndarray): Vector ids of candidates per query,
+                as returned by `get_candidates`. Negative ids are ignored.
+            top_k_results (int, optional): Number of results per query. Defaults to 10.
+            query_ids (List[str], optional): Document ids of the queries. When given,
+                query embeddings are read from and written to `embedding_store`.
+                Defaults to None.
+            skip_first (bool, optional): Drop the best candidate of each query, which
+                is the query itself when it is indexed. Defaults to True.
+
+        Returns:
+            List[List[List[Any]]]: [document_id, score] pairs of each query,
+                sorted by descending score
+        """
+        if not self.retriever_vectorizer.is_trained:
+            raise ValueError(
+                "Retriever vectorizer is not trained yet."
+                " Try to call train_retriever_vectorizer first."
+            )
+
+        candidate_id_matrix = np.asarray(candidate_id_matrix)
+        unique_ids = [
+            str(vector_id)
+            for vector_id in np.unique(candidate_id_matrix[candidate_id_matrix >= 0])
+        ]
+
+        if self._use_embedding_store():
+            vector_id_map = self.document_store.get_document_ids_by_vector_ids(
+                unique_ids
+            )
+            candidate_vector_ids = list(vector_id_map.keys())
+            candidate_docs_id = list(vector_id_map.values())
+
+            missing_ids = self.embedding_store.get_missing_ids(candidate_docs_id)
+            for i in range(0, len(missing_ids), self.document_store.batch_size):
+                self._update_embedding_store(
+                    self.document_store.get_documents_by_id(
+                        missing_ids[i : i + self.document_store.batch_size]
+                    )
+                )
+
+            candidate_embs = self.embedding_store.embeddings
+            candidate_emb_rows = self.embedding_store.get_rows(candidate_docs_id)
+
+            if query_ids is not None:
+                self._update_embedding_store(
+                    [
+                        Document(id=query_id, text=query_text)
+                        for query_id, query_text in zip(query_ids, query_texts)
+                    ]
+                )
+                query_embs = self.embedding_store.embeddings[
+                    self.embedding_store.get_rows(query_ids)
+                ]
+            else:
+                query_embs = self.retriever_vectorizer.transform(query_texts)
+        else:
+            candidate_docs = self.document_store.get_documents_by_vector_ids(
+                unique_ids
+            )
+            candidate_vector_ids = [doc.vector_id for doc in candidate_docs]
+            candidate_docs_id = [doc.id for doc in candidate_docs]
+
+            candidate_embs = self.retriever_vectorizer.transform(
+                [doc.text for doc in candidate_docs]
+            )
+            candidate_emb_rows = np.arange(len(candidate_docs))
+            query_embs = self.retriever_vectorizer.transform(query_texts)
+
+        if not candidate_docs_id:
+            return [[] for _ in query_texts]
+
+        candidate_rows = self._map_vector_ids_to_rows(
+            candidate_id_matrix, [int(vector_id) for vector_id in candidate_vector_ids]
+        )
+        scores = _score_candidate_rows(
+            query_embs,
+            candidate_embs,
+            np.where(candidate_rows >= 0, candidate_emb_rows[candidate_rows], -1),
+        )
+
+        # 0 location is the query_text itself, so pick the next ones
+        n_skipped = 1 if skip_first else 0
+        n_selected = min(top_k_results + n_skipped, scores.shape[1])
+        top_idx = np.argpartition(-scores, n_selected - 1, axis=1)[:, :n_selected]
+        top_scores = np.take_along_axis(scores, top_idx, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top_idx = np.take_along_axis(top_idx, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        results = []
+        for rows, idx, row_scores in zip(candidate_rows, top_idx, top_scores):
+            results.append(
+                [
+                    [candidate_docs_id[rows[i]], score]
+                    for i, score in zip(idx[n_skipped:], row_scores[n_skipped:])
+                    if np.isfinite(score)
+                ]
+            )
+        return results
+
+    @staticmethod
+    def _map_vector_ids_to_rows(candidate_id_matrix, vector_ids: List[int]):
+        """Maps vector ids of `candidate_id_matrix` to positions in `vector_ids`,
+        ids that are negative or not found are mapped to -1
+        """
+        if not vector_ids:
+            return np.full(candidate_id_matrix.shape, -1, dtype=np.int64)
+
+        order = np.argsort(vector_ids)
+        sorted_ids = np.asarray(vector_ids, dtype=np.int64)[order]
+        loc = np.searchsorted(sorted_ids, candidate_id_matrix)
+        loc = np.minimum(loc, len(sorted_ids) - 1)
+        found = (candidate_id_matrix >= 0) & (sorted_ids[loc] == candidate_id_matrix)
+        return np.where(found, order[loc], -1)
+
+    def retrieve(
+        self,
+        query_texts: List[str],
+        top_k_results: int = 10,
+        query_ids: List[str] = None,
+        index: str = None,
+    ) -> List[List[List[Any]]]:
+        """Retrieves most k similar docs of arbitrary texts, which unlike in
+        `batch_retrieve` do not need to be indexed.
+
+        Args:
+            query_texts (List[str]): Processed texts to query.
+            top_k_results (int, optional): Number of results per query. Defaults to 10.
+            query_ids (List[str], optional): Document ids of the queries, which are
+                excluded from their own results. Defaults to None.
+            index (str, optional): Index of the documents. Defaults to None.
+
+        Returns:
+            List[List[List[Any]]]: [document_id, score] pairs of each query,
+                sorted by descending score
+        """
+        _, _, candidate_id_matrix = self.get_candidates(
+            query_texts=query_texts, top_k=10 * top_k_results, index=index
+        )
+        reranked_candidates_list = self._batch_calc_scores_for_candidates(
+            query_texts=query_texts,
+            candidate_id_matrix=candidate_id_matrix,
+            top_k_results=top_k_results + 1,
+            skip_first=False,
+        )
+
+        if query_ids is None:
+            query_ids = [None] * len(query_texts)
+        return [
+            [
+                candidate
+                for candidate in reranked_candidates
+                if candidate[0] != query_id
+            ][:top_k_results]
+            for query_id, reranked_candidates in zip(
+                query_ids, reranked_candidates_list
+            )
+        ]
 
     def batch_retrieve(
         self,
@@ -231,6 +474,7 @@ class Retriever:
         process_query_texts: bool = False,
         index: str = None,
         filters=None,
+        batch_rerank: bool = True,
     ) -> List[Dict[str, Any]]:
         """Retrieves batch of most k similar docs of given batch of documents
 
@@ -240,6 +484,9 @@ class Retriever:
             process_query_texts (bool, optional): [description]. Defaults to False.
             index ([type], optional): [description]. Defaults to None.
             filters ([type], optional): [description]. Defaults to None.
+            batch_rerank (bool, optional): Rerank candidates of all query docs at once,
+                fetching and vectorizing each distinct candidate only once.
+                Set to False to rerank query docs one by one. Defaults to True.
 
         Returns:
             List[Dict[str, Any]]: Retrieved results
@@ -255,8 +502,10 @@ class Retriever:
         if process_query_texts:
             processor = ViPreProcessor()
             query_texts = [
-                processor.clean({"text": query_text})["text"]
-                for query_text in query_texts
+                document["text"]
+                for document in processor.clean_many(
+                    [{"text": query_text} for query_text in query_texts]
+                )
             ]
 
         _, _, candidate_id_matrix = self.get_candidates(
@@ -266,21 +515,39 @@ class Retriever:
             filters=filters,
         )  # create large candidates search space 10*top_k_results
 
-        retrieve_results = []
-
-        for idx, query_text in enumerate(tqdm(query_texts, desc="Retrieving.....  ")):
-            candidate_ids = [
-                candidate_id
-                for candidate_id in candidate_id_matrix[idx]
-                if candidate_id >= 0
-            ]
-
-            reranked_candidates = self._calc_scores_for_candidates(
-                query_text=query_text,
-                candidate_ids=candidate_ids,
+        if batch_rerank:
+            logger.info(f"Reranking candidates of {len(query_texts)} docs...")
+            reranked_candidates_list = self._batch_calc_scores_for_candidates(
+                query_texts=query_texts,
+                candidate_id_matrix=candidate_id_matrix,
                 top_k_results=top_k_results,
+                # Embeddings of processed texts must not be stored for the documents
+                query_ids=None
+                if process_query_texts
+                else [doc.id for doc in query_docs],
             )
+        else:
+            reranked_candidates_list = []
+            for idx, query_text in enumerate(
+                tqdm(query_texts, desc="Retrieving.....  ")
+            ):
+                candidate_ids = [
+                    candidate_id
+                    for candidate_id in candidate_id_matrix[idx]
+                    if candidate_id >= 0
+                ]
+
+                reranked_candidates_list.append(
+                    self._calc_scores_for_candidates(
+                        query_text=query_text,
+                        candidate_ids=candidate_ids,
+                        top_k_results=top_k_results,
+                    )
+                )
+
+        retrieve_results = []
 
+        for idx, reranked_candidates in enumerate(reranked_candidates_list):
             for rank, reranked_candidate in enumerate(reranked_candidates):
                 retrieve_results.append(
                     {
@@ -289,9 +556,48 @@ class Retriever:
                             0
                         ],
                         f"sim_score_rank_{str(rank).zfill(2)}": round(
-                            reranked_candidate[1][0], 5
+                            reranked_candidate[1], 5
                         ),
                     }
                 )
 
         return retrieve_results
+
+
+def _score_candidate_rows(query_embs, candidate_embs, candidate_rows):
+    """Computes dot product scores between each query and its own candidates.
+    Sparse embeddings are densified chunk by chunk, bounded by `RERANK_BUFFER_SIZE` rows.
+
+    Args:
+        query_embs (np.ndarray or scipy sparse matrix): Embeddings of queries,
+            shape (n_queries, dim).
+        candidate_embs (np.ndarray or scipy sparse matrix): Embeddings of distinct
+            candidates, shape (n_candidates, dim).
+        candidate_rows (np.ndarray): Row in `candidate_embs` of each candidate per query,
+            shape (n_queries, top_k). -1 marks an empty slot.
+
+    Returns:
+        np.ndarray: Scores of shape (n_queries, top_k), -inf for empty slots
+    """
+    n_queries, top_k = candidate_rows.shape
+    scores = np.full((n_queries, top_k), -np.inf, dtype=np.float64)
+    if top_k == 0:
+        return scores
+
+    step = max(1, RERANK_BUFFER_SIZE // top_k)
+    for i in range(0, n_queries, step):
+        rows = candidate_rows[i : i + step]
+        chunk_query_embs = query_embs[i : i + step]
+        if issparse(chunk_query_embs):
+            chunk_query_embs = chunk_query_embs.toarray()
+        if issparse(candidate_embs):
+            embs = (
+                candidate_embs[np.maximum(rows, 0).ravel()]
+                .toarray()
+                .reshape(rows.shape + (-1,))
+            )
+        else:
+            embs = candidate_embs[np.maximum(rows, 0)]
+        chunk_scores = np.einsum("qkd,qd->qk", embs, chunk_query_embs)
+        scores[i : i + step] = np.where(rows >= 0, chunk_scores, -np.inf)
+    return scores
@@ -0,0 +1,44 @@
+import numpy as np
+
+from modules.ml.document_store.embedding_store import EmbeddingStore
+
+
+def test_write_and_read_embeddings(tmp_path):
+    store = EmbeddingStore(tmp_path, vector_dim=3)
+    store.use_version("v1")
+    store.write_embeddings(["a", "b"], np.array([[1.0, 0, 0], [0, 1.0, 0]]))
+    store.write_embeddings(["b", "c"], np.array([[9.0, 9, 9], [0, 0, 1.0]]))
+
+    assert len(store) == 3
+    assert store.get_missing_ids(["a", "d", "c", "d"]) == ["d"]
+    np.testing.assert_array_equal(store.get_rows(["c", "x", "a"]), [2, -1, 0])
+    np.testing.assert_array_equal(store.embeddings[1], [0, 1.0, 0])
+
+    # Embeddings are persisted across instances
+    store = EmbeddingStore(tmp_path, vector_dim=3)
+    store.use_version("v1")
+    assert len(store) == 3
+    np.testing.assert_array_equal(store.embeddings[2], [0, 0, 1.0])
+
+
+def test_new_version_invalidates_embeddings(tmp_path):
+    store = EmbeddingStore(tmp_path, vector_dim=2)
+    store.use_version("v1")
+    store.write_embeddings(["a"], np.array([[1.0, 2.0]]))
+
+    store.use_version("v2")
+    assert len(store) == 0
+    assert not (tmp_path / "v1.f32").exists()
+
+
+def test_interrupted_write_is_dropped(tmp_path):
+    store = EmbeddingStore(tmp_path, vector_dim=2)
+    store.use_version("v1")
+    store.write_embeddings(["a"], np.array([[1.0, 2.0]]))
+    with open(tmp_path / "v1.f32", "ab") as f:
+        f.write(np.array([[3.0, 4.0]], dtype=np.float32).tobytes())
+
+    store = EmbeddingStore(tmp_path, vector_dim=2)
+    store.use_version("v1")
+    store.write_embeddings(["b"], np.array([[5.0, 6.0]]))
+    np.testing.assert_array_equal(store.embeddings[store.get_rows(["b"])[0]], [5, 6])
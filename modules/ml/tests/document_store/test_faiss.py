@@ -0,0 +1,177 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from modules.ml.document_store.faiss import FAISSDocumentStore
+
+
+class CountingVectorizer:
+    """Deterministic vectorizer which records how many documents it embedded"""
+
+    def __init__(self, vector_dim, sparse=False):
+        self.vector_dim = vector_dim
+        self.sparse = sparse
+        self.n_transformed = 0
+
+    def transform_document_objects(self, documents):
+        self.n_transformed += len(documents)
+        embeddings = np.array(
+            [np.full(self.vector_dim, int(doc.text)) for doc in documents]
+        )
+        return csr_matrix(embeddings) if self.sparse else embeddings
+
+
+def _docs(start, end):
+    return [{"id": str(i), "text": str(i)} for i in range(start, end)]
+
+
+def test_update_embeddings_incremental(tmp_path):
+    sql_url = f"sqlite:///{tmp_path / 'test.db'}"
+    index_path = tmp_path / "index.bin"
+    vectorizer = CountingVectorizer(vector_dim=4)
+
+    document_store = FAISSDocumentStore(sql_url=sql_url, vector_dim=4)
+    document_store.write_documents(_docs(0, 5))
+    document_store.update_embeddings(vectorizer)
+    document_store.save(index_path)
+    assert vectorizer.n_transformed == 5
+
+    document_store = FAISSDocumentStore.load(
+        faiss_file_path=index_path, sql_url=sql_url
+    )
+    document_store.write_documents(_docs(5, 8))
+    document_store.update_embeddings(vectorizer, update_existing_embeddings=False)
+
+    # Only the new documents are embedded and appended after the existing vectors
+    assert vectorizer.n_transformed == 8
+    assert document_store.faiss_index.ntotal == 8
+    for doc in document_store.get_all_documents():
+        vector_id = doc.meta["vector_id"]
+        assert vector_id == doc.id
+        np.testing.assert_array_equal(
+            document_store.faiss_index.reconstruct(int(vector_id)),
+            np.full(4, int(doc.text)),
+        )
+
+
+def test_update_embeddings_rebuilds_out_of_sync_index(tmp_path):
+    sql_url = f"sqlite:///{tmp_path / 'test.db'}"
+    vectorizer = CountingVectorizer(vector_dim=4)
+
+    document_store = FAISSDocumentStore(sql_url=sql_url, vector_dim=4)
+    document_store.write_documents(_docs(0, 5))
+    document_store.update_embeddings(vectorizer)
+
+    # A fresh index does not contain the vectors referenced in SQL
+    document_store = FAISSDocumentStore(sql_url=sql_url, vector_dim=4)
+    document_store.write_documents(_docs(5, 6))
+    document_store.update_embeddings(vectorizer, update_existing_embeddings=False)
+
+    assert vectorizer.n_transformed == 11
+    assert document_store.faiss_index.ntotal == 6
+
+
+def test_update_embeddings_sparse(tmp_path):
+    sql_url = f"sqlite:///{tmp_path / 'test.db'}"
+    vectorizer = CountingVectorizer(vector_dim=4, sparse=True)
+
+    document_store = FAISSDocumentStore(
+        sql_url=sql_url, vector_dim=4, index_buffer_size=2
+    )
+    document_store.write_documents(_docs(0, 5))
+    document_store.update_embeddings(vectorizer)
+
+    assert document_store.faiss_index.ntotal == 5
+    np.testing.assert_array_equal(
+        document_store.faiss_index.reconstruct(3), np.full(4, 3.0)
+    )
+
+    scores, vector_ids = document_store.query_ids_by_embedding(
+        csr_matrix(np.eye(4)[:3]), top_k=1
+    )
+    assert scores.shape == vector_ids.shape == (3, 1)
+    assert (vector_ids == 4).all()
+
+
+def test_update_embeddings_resumes_from_checkpoint(tmp_path):
+    sql_url = f"sqlite:///{tmp_path / 'test.db'}"
+    checkpoint_path = tmp_path / "index.bin"
+
+    class FailingVectorizer(CountingVectorizer):
+        def transform_document_objects(self, documents):
+            if self.n_transformed >= 4:
+                raise RuntimeError("interrupted")
+            return super().transform_document_objects(documents)
+
+    document_store = FAISSDocumentStore(
+        sql_url=sql_url, vector_dim=4, index_buffer_size=2
+    )
+    document_store.write_documents(_docs(0, 7))
+    with pytest.raises(RuntimeError):
+        document_store.update_embeddings(
+            FailingVectorizer(vector_dim=4), checkpoint_path=checkpoint_path
+        )
+
+    document_store = FAISSDocumentStore.load(
+        faiss_file_path=checkpoint_path, sql_url=sql_url
+    )
+    assert document_store.faiss_index.ntotal == 4
+
+    vectorizer = CountingVectorizer(vector_dim=4)
+    document_store.update_embeddings(
+        vectorizer,
+        update_existing_embeddings=False,
+        checkpoint_path=checkpoint_path,
+    )
+    assert vectorizer.n_transformed == 3
+    assert document_store.faiss_index.ntotal == 7
+    for doc in document_store.get_all_documents():
+        np.testing.assert_array_equal(
+            document_store.faiss_index.reconstruct(int(doc.meta["vector_id"])),
+            np.full(4, int(doc.text)),
+        )
+
+
+def test_update_embeddings_keeps_vector_ids(tmp_path):
+    sql_url = f"sqlite:///{tmp_path / 'test.db'}"
+    vectorizer = CountingVectorizer(vector_dim=4)
+
+    document_store = FAISSDocumentStore(
+        sql_url=sql_url, vector_dim=4, index_buffer_size=2
+    )
+    document_store.write_documents(_docs(1, 5))
+    # Vector ids of an index published earlier, with positions of deleted documents
+    document_store.update_vector_ids({"1": "1", "2": "3", "3": "4"})
+    document_store.update_embeddings(vectorizer)
+
+    # Existing documents keep their position, new ones are appended after them
+    vector_ids = {
+        doc.id: doc.meta["vector_id"] for doc in document_store.get_all_documents()
+    }
+    assert vector_ids == {"1": "1", "2": "3", "3": "4", "4": "5"}
+    assert document_store.faiss_index.ntotal == 6
+    for position, value in enumerate([0, 1, 0, 2, 3, 4]):
+        np.testing.assert_array_equal(
+            document_store.faiss_index.reconstruct(position), np.full(4, value)
+        )
+
+
+def test_is_synchronized_with_vector_id_gaps(tmp_path):
+    sql_url = f"sqlite:///{tmp_path / 'test.db'}"
+    vectorizer = CountingVectorizer(vector_dim=4)
+
+    document_store = FAISSDocumentStore(sql_url=sql_url, vector_dim=4)
+    document_store.write_documents(_docs(1, 4))
+    document_store.update_vector_ids({"1": "0", "2": "2", "3": "5"})
+    document_store.update_embeddings(vectorizer)
+
+    # Positions 1, 3 and 4 are padding, but every document is indexed
+    assert document_store.faiss_index.ntotal == 6
+    assert document_store.get_document_count() == 3
+    assert document_store.is_synchronized()
+
+    document_store.write_documents(_docs(4, 5))
+    assert not document_store.is_synchronized()
+
+    document_store.update_embeddings(vectorizer, update_existing_embeddings=False)
+    assert document_store.is_synchronized()
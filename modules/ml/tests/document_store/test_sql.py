@@ -0,0 +1,145 @@
+import pytest
+
+from modules.ml.document_store.migrate_meta import migrate_meta
+from modules.ml.document_store.sql import DocumentMetaORM, SQLDocumentStore
+
+DOCS = [
+    {
+        "id": "a",
+        "text": "a",
+        "meta": {"newspaper": "vnexpress", "href": "url_a", "title": "title_a"},
+    },
+    {
+        "id": "b",
+        "text": "b",
+        "meta": {"newspaper": "tuoitre", "href": "url_b", "title": "title_b"},
+    },
+    {
+        "id": "c",
+        "text": "c",
+        "meta": {"newspaper": "vnexpress", "href": "url_c", "title": "title_c"},
+    },
+]
+
+
+def test_wide_meta(tmp_path):
+    document_store = SQLDocumentStore(
+        f"sqlite:///{tmp_path / 'test.db'}", wide_meta=True
+    )
+    document_store.write_documents(DOCS)
+    document_store.update_document_meta("a", {"publish_date": "2021-03-01"})
+
+    row = document_store.session.query(DocumentMetaORM).get("a")
+    assert (row.domain, row.url, row.title) == ("vnexpress", "url_a", "title_a")
+    assert row.meta["publish_date"] == "2021-03-01"
+
+    documents = document_store.get_all_documents(filters={"domain": ["vnexpress"]})
+    assert sorted(doc.id for doc in documents) == ["a", "c"]
+    assert document_store.get_document_count(filters={"domain": ["tuoitre"]}) == 1
+
+
+def test_migrate_meta(tmp_path):
+    sql_url = f"sqlite:///{tmp_path / 'test.db'}"
+    SQLDocumentStore(sql_url).write_documents(DOCS)
+
+    migrate_meta(sql_url)
+
+    document_store = SQLDocumentStore(sql_url, wide_meta=True)
+    assert document_store.session.query(DocumentMetaORM).count() == 3
+    assert document_store.session.query(DocumentMetaORM).get("b").domain == "tuoitre"
+
+
+@pytest.mark.parametrize("wide_meta", [False, True])
+def test_similar_document_pairs(tmp_path, wide_meta):
+    document_store = SQLDocumentStore(
+        f"sqlite:///{tmp_path / 'test.db'}", wide_meta=wide_meta
+    )
+    document_store.write_documents(DOCS)
+    document_store.write_similarity_edges([("b", "a", 0.7), ("a", "c", 0.95)], "v1")
+    document_store.write_similarity_edges([("a", "b", 0.9)], "v1")
+
+    # Documents of the same domain are not paired
+    pairs = document_store.get_similar_document_pairs(threshold=0.8)
+    assert pairs == [
+        {
+            "document_id_A": "a",
+            "document_id_B": "b",
+            "domain_A": "vnexpress",
+            "domain_B": "tuoitre",
+            "url_A": "url_a",
+            "url_B": "url_b",
+            "publish_date_A": None,
+            "publish_date_B": None,
+            "title_A": "title_a",
+            "title_B": "title_b",
+            "sim_score": "0.9",
+        }
+    ]
+
+
+def test_wide_meta_of_documents_written_without_store(tmp_path):
+    document_store = SQLDocumentStore(
+        f"sqlite:///{tmp_path / 'test.db'}", wide_meta=True
+    )
+    document_store.write_documents(DOCS[:1])
+    # Rows inserted with raw SQL, as done by the crawler pipeline
+    with document_store.engine.begin() as conn:
+        conn.execute(
+            "INSERT INTO document (id, text, \"index\") VALUES ('d', 'd', 'document')"
+        )
+        conn.execute(
+            "INSERT INTO meta (id, name, value, document_id) VALUES "
+            "('1', 'newspaper', 'tuoitre', 'd'), ('2', 'href', 'url_d', 'd')"
+        )
+
+    documents = document_store.get_all_documents(filters={"domain": ["tuoitre"]})
+    assert [doc.id for doc in documents] == ["d"]
+    assert document_store.get_document_count(filters={"domain": ["vnexpress"]}) == 1
+
+    document_store.write_similarity_edges([("a", "d", 0.9)], "v1")
+    pairs = document_store.get_similar_document_pairs(threshold=0.8)
+    assert [
+        (pair["document_id_B"], pair["domain_B"], pair["url_B"]) for pair in pairs
+    ] == [("d", "tuoitre", "url_d")]
+
+
+@pytest.mark.parametrize("legacy_duplicates", [False, True])
+def test_write_similar_document_pairs(tmp_path, monkeypatch, legacy_duplicates):
+    document_store = SQLDocumentStore(f"sqlite:///{tmp_path / 'test.db'}")
+    if legacy_duplicates:
+        # Tables of older versions have no primary key, and may hold duplicates
+        with document_store.engine.begin() as conn:
+            conn.execute('CREATE TABLE similar_docs ("sim_id" TEXT, "sim_score" TEXT)')
+            conn.execute("INSERT INTO similar_docs VALUES ('ab', '0.9'), ('ab', '0.9')")
+
+    make_sim_id_unique = document_store._make_sim_id_unique
+    n_checks = []
+
+    def count_checks():
+        n_checks.append(1)
+        return make_sim_id_unique()
+
+    monkeypatch.setattr(document_store, "_make_sim_id_unique", count_checks)
+
+    pairs = [{"sim_id": "ab", "sim_score": "0.9"}, {"sim_id": "ac", "sim_score": "0.8"}]
+    n_new = 1 if legacy_duplicates else 2
+    assert document_store.write_similar_document_pairs(pairs) == n_new
+    assert document_store.write_similar_document_pairs(pairs) == 0
+    # The unique index is not created again on each write
+    assert len(n_checks) == 1
+
+
+def test_update_vector_ids(tmp_path):
+    document_store = SQLDocumentStore(f"sqlite:///{tmp_path / 'test.db'}")
+    ids = [str(i) for i in range(300)]
+    document_store.write_documents([{"id": id, "text": id} for id in ids])
+    document_store.write_documents([{"id": "other", "text": "other"}], index="other")
+
+    vector_id_map = {id: str(299 - i) for i, id in enumerate(ids)}
+    # Ids which are not in the index are ignored
+    document_store.update_vector_ids({**vector_id_map, "missing": "300", "other": "0"})
+
+    documents = document_store.get_documents_by_id(ids + ["missing"])
+    assert {doc.id: doc.vector_id for doc in documents} == vector_id_map
+    (other,) = document_store.get_documents_by_id(["other"], index="other")
+    assert other.vector_id is None
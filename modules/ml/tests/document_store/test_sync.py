@@ -0,0 +1,38 @@
+import time
+from datetime import datetime, timedelta
+
+from modules.ml.document_store.sql import SQLDocumentStore
+from modules.ml.document_store.sync import DocumentSync
+
+
+def _docs(start, end):
+    return [{"id": str(i), "text": str(i)} for i in range(start, end)]
+
+
+def test_sync_new_ids(tmp_path):
+    source = SQLDocumentStore(f"sqlite:///{tmp_path / 'source.db'}")
+    target = SQLDocumentStore(f"sqlite:///{tmp_path / 'target.db'}")
+    state_path = tmp_path / "sync_state.json"
+    from_time = datetime.now() - timedelta(days=1)
+
+    source.write_documents(_docs(0, 5))
+    target.write_documents(_docs(0, 2))
+
+    # Full reconciliation without a high-water mark
+    document_sync = DocumentSync(source, target, state_path)
+    assert document_sync.get_new_ids(from_time) == ["2", "3", "4"]
+    target.write_documents(source.get_documents_by_id(["2", "3", "4"]))
+    document_sync.commit()
+    assert state_path.exists()
+
+    # Only rows updated since the persisted mark are checked,
+    # SQLite timestamps have a resolution of one second
+    time.sleep(1)
+    source.write_documents(_docs(5, 7))
+    document_sync = DocumentSync(source, target, state_path)
+    assert document_sync.high_water_mark is not None
+    assert document_sync.get_new_ids(from_time) == ["5", "6"]
+
+    # The mark is not advanced until commit
+    document_sync = DocumentSync(source, target, state_path)
+    assert document_sync.get_new_ids(from_time) == ["5", "6"]
@@ -0,0 +1,46 @@
+import os
+
+from modules.ml.plugins.vncorenlp.rdrsegmenter import MODEL_DIR, RDRSegmenter
+from modules.ml.preprocessor.cleaning import normalize_text
+from modules.ml.preprocessor.vi_preprocessor import _clean_vncore_result
+
+
+def test_tokenize(tmp_path):
+    """Test if words are segmented as by VnCoreNLP"""
+    segmenter = RDRSegmenter.load(cache_path=str(tmp_path / "wordsegmenter.pkl"))
+    text = normalize_text(
+        "Cho đến thời điểm này, có thể nói, "
+        + "Klopp là một trong những đối thủ lớn nhất của Mourinho."
+    )
+
+    sentences = segmenter.tokenize(text)
+    assert len(sentences) == 1
+    assert (
+        _clean_vncore_result(" ".join(sentences[0]))
+        == "cho đến thời_điểm này, có_thể nói, "
+        + "klopp là một trong những đối_thủ lớn nhất của mourinho."
+    )
+
+
+def test_rules(tmp_path):
+    """Test if the rules correct the segmentation of the dictionary"""
+    segmenter = RDRSegmenter.load(cache_path=str(tmp_path / "wordsegmenter.pkl"))
+
+    assert segmenter.segment_many(["chủ tịch quận huyện", "sinh viên. ông ta"]) == [
+        ["chủ_tịch", "quận_huyện"],
+        ["sinh_viên", ".", "ông", "ta"],
+    ]
+
+
+def test_cache(tmp_path):
+    """Test if the segmenter is cached, and loaded again from the cache"""
+    cache_path = str(tmp_path / "wordsegmenter.pkl")
+    segmenter = RDRSegmenter.load(cache_path=cache_path)
+    assert os.path.isfile(cache_path)
+
+    cached = RDRSegmenter.load(model_dir=MODEL_DIR, cache_path=cache_path)
+    assert cached.prefixes == segmenter.prefixes
+    assert cached.rules == segmenter.rules
+    assert cached.segment_many(["xử lý ngôn ngữ tự nhiên"]) == [
+        ["xử_lý", "ngôn_ngữ_tự_nhiên"]
+    ]
@@ -2,14 +2,16 @@ import os
 from pathlib import Path
 from shutil import copyfile
 
+import numpy as np
 import pytest
 from qcore.asserts import assert_raises
+from scipy.sparse import csr_matrix
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from modules.ml.document_store.faiss import FAISSDocumentStore
 from modules.ml.document_store.sql import DocumentORM, ORMBase
-from modules.ml.retriever.retriever import Retriever
+from modules.ml.retriever.retriever import Retriever, _score_candidate_rows
 from modules.ml.vectorizer.base import DocVectorizerBase
 from modules.ml.vectorizer.tf_idf import TfidfDocVectorizer
 
@@ -351,3 +353,61 @@ temp_test_db_path = os.path.join(parent_cwd, "temp_topdup.test_db")
 
 #     # Remove temp test database
 #     os.remove(temp_test_db_path)
+
+
+def test_map_vector_ids_to_rows():
+    candidate_id_matrix = np.array([[3, 7, -1], [7, 5, 9]])
+    rows = Retriever._map_vector_ids_to_rows(candidate_id_matrix, [7, 3, 9])
+
+    np.testing.assert_array_equal(rows, [[1, 0, -1], [0, -1, 2]])
+
+
+def test_score_candidate_rows():
+    query_embs = np.array([[1.0, 0.0], [0.0, 1.0]])
+    candidate_embs = np.array([[1.0, 0.0], [0.5, 0.5], [0.0, 2.0]])
+    candidate_rows = np.array([[0, 1, -1], [2, 1, 0]])
+
+    scores = _score_candidate_rows(query_embs, candidate_embs, candidate_rows)
+
+    np.testing.assert_allclose(scores, [[1.0, 0.5, -np.inf], [2.0, 0.5, 0.0]])
+
+
+def test_score_candidate_rows_sparse():
+    query_embs = csr_matrix([[1.0, 0.0], [0.0, 1.0]])
+    candidate_embs = csr_matrix([[1.0, 0.0], [0.5, 0.5], [0.0, 2.0]])
+    candidate_rows = np.array([[0, 1, -1], [2, 1, 0]])
+
+    scores = _score_candidate_rows(query_embs, candidate_embs, candidate_rows)
+
+    np.testing.assert_allclose(scores, [[1.0, 0.5, -np.inf], [2.0, 0.5, 0.0]])
+
+
+def test_retrieve(tmp_path):
+    document_store = FAISSDocumentStore(
+        sql_url=f"sqlite:///{tmp_path / 'test.db'}", vector_dim=8
+    )
+    document_store.write_documents(
+        [
+            {"id": "a", "text": "giá vàng hôm nay tăng mạnh"},
+            {"id": "b", "text": "giá vàng hôm nay giảm nhẹ"},
+            {"id": "c", "text": "đội tuyển bóng đá thắng lớn"},
+        ]
+    )
+    retriever = Retriever(
+        document_store=document_store,
+        candidate_vectorizer=TfidfDocVectorizer(8),
+        retriever_vectorizer=TfidfDocVectorizer(16),
+    )
+    retriever.train_candidate_vectorizer()
+    retriever.train_retriever_vectorizer()
+    retriever.update_embeddings()
+
+    # The best match of an arbitrary text is kept
+    results = retriever.retrieve(["giá vàng tăng mạnh"], top_k_results=2)
+    assert [doc_id for doc_id, _ in results[0]] == ["a", "b"]
+
+    # The queried document is excluded from its own results
+    results = retriever.retrieve(
+        ["giá vàng hôm nay tăng mạnh"], top_k_results=1, query_ids=["a"]
+    )
+    assert [doc_id for doc_id, _ in results[0]] == ["b"]
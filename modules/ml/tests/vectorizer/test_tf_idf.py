@@ -0,0 +1,28 @@
+import numpy as np
+
+from modules.ml.vectorizer.base import DocVectorizerBase
+from modules.ml.vectorizer.tf_idf import TfidfDocVectorizer
+
+DOCS = [
+    "giá vàng hôm nay tăng mạnh",
+    "giá vàng hôm nay giảm nhẹ",
+    "đội tuyển bóng đá thắng lớn",
+]
+
+
+def test_save_arrays(tmp_path):
+    vectorizer = TfidfDocVectorizer(8, sparse=True)
+    vectorizer.fit(DOCS)
+    model_dir = str(tmp_path / "cand")
+
+    # Saving again replaces the previous files
+    vectorizer.save_arrays(model_dir)
+    vectorizer.save_arrays(model_dir)
+
+    loaded = DocVectorizerBase.load(model_dir)
+    assert isinstance(loaded, TfidfDocVectorizer)
+    assert loaded.sparse
+    assert loaded.version == vectorizer.version
+    np.testing.assert_allclose(
+        loaded.transform(DOCS).toarray(), vectorizer.transform(DOCS).toarray()
+    )
@@ -1,8 +1,18 @@
+import json
+import os
 import pickle
 from abc import ABC, abstractmethod
+from typing import Optional
 
 
 class DocVectorizerBase(ABC):
+    @property
+    def version(self) -> Optional[str]:
+        """Identifier of the fitted model, which changes whenever the model is refitted.
+        None if the vectorizer does not support versioning.
+        """
+        return None
+
     @abstractmethod
     def fit(self, train_documents):
         pass
@@ -21,6 +31,17 @@ class DocVectorizerBase(ABC):
 
     @classmethod
     def load(cls, model_path):
+        """Loads a pickled vectorizer, or a directory saved by `save_arrays`
+        of the vectorizer class named in its `vectorizer.json`.
+        """
+        if os.path.isdir(model_path):
+            with open(os.path.join(model_path, "vectorizer.json")) as f:
+                class_name = json.load(f)["class"]
+            subclasses = {sub.__name__: sub for sub in cls.__subclasses__()}
+            if class_name not in subclasses:
+                raise ValueError(f"Unknown vectorizer class {class_name}")
+            return subclasses[class_name].load_arrays(model_path)
+
         vectorizer = pickle.load(open(model_path, "rb"))
         print(type(vectorizer))
 
@@ -1,7 +1,12 @@
+import hashlib
+import json
+import os
 import pickle
-from typing import List
+import shutil
+from typing import List, Optional, Union
 
 import numpy as np
+from scipy.sparse import csr_matrix
 from sklearn.feature_extraction.text import TfidfVectorizer
 
 from modules.ml.schema import Document
@@ -9,7 +14,7 @@ from modules.ml.vectorizer.base import DocVectorizerBase
 
 
 class TfidfDocVectorizer(DocVectorizerBase):
-    def __init__(self, vector_dim: int = 128, **kwargs):
+    def __init__(self, vector_dim: int = 128, sparse: bool = False, **kwargs):
         """
         Vectorize the documents and return a vector that has been embedding
         for indexer or comparison.
@@ -17,6 +22,8 @@ class TfidfDocVectorizer(DocVectorizerBase):
         Args:
             vector_dim (int): Number dimentions of embedding vectors for 1st phase.
                 Defaults to 128.
+            sparse (bool): Return embeddings as scipy CSR matrices instead of
+                dense arrays. Defaults to False.
             **kwargs: Arbitrary keyword arguments.
         """
 
@@ -25,6 +32,8 @@ class TfidfDocVectorizer(DocVectorizerBase):
         # Set is_trained = True if vectorizer is trained, is_trained = False
         self.is_trained = False
         self.vector_dim = vector_dim
+        self.sparse = sparse
+        self._version: Optional[str] = None
 
     def fit(self, train_documents: list = None) -> TfidfVectorizer:
         """Fit `train_documents` into the tf-idf and return tfidf vectorizer.
@@ -39,6 +48,7 @@ class TfidfDocVectorizer(DocVectorizerBase):
 
         vectorizer = self.vectorizer.fit(train_documents)
         self.is_trained = True
+        self._version = None
 
         return vectorizer
 
@@ -51,33 +61,52 @@ class TfidfDocVectorizer(DocVectorizerBase):
             train_documents (list): List of training documents for vectorizer. Defaults to None.
 
         Returns:
-            np.array: Embedding matrix of training documents.
+            np.array or csr_matrix: Embedding matrix of training documents.
         """
 
-        transform_vector = np.array(
-            self.vectorizer.fit_transform(train_documents).todense()
-        )
+        transform_vector = self._format(self.vectorizer.fit_transform(train_documents))
         self.is_trained = True
+        self._version = None
 
         return transform_vector
 
+    @property
+    def version(self) -> Optional[str]:
+        """Fingerprint of the fitted vocabulary and idf weights.
+
+        Returns:
+            str: Hex digest, or None if the vectorizer is not trained yet.
+        """
+        if not self.is_trained:
+            return None
+
+        if getattr(self, "_version", None) is None:
+            digest = hashlib.sha1()
+            for term, idx in sorted(self.vectorizer.vocabulary_.items()):
+                digest.update(f"{term}:{idx};".encode("utf-8"))
+            digest.update(np.ascontiguousarray(self.vectorizer.idf_).tobytes())
+            self._version = digest.hexdigest()[:16]
+
+        return self._version
+
     def transform(self, documents: list = None):
         """Transform `documents` into the tf-idf vectorizer and return
-        a list of vector and convert to dense.
+        a list of vector, converted to dense unless `sparse` is set.
 
         Args:
             documents (list): List of documents to vectorize.
 
         Returns:
-            np.array: Embedding matrix of input documents.
+            np.array or csr_matrix: Embedding matrix of input documents.
         """
 
-        # Transform `documents` into the tf-idf vectorizer and return a list of vector and convert to dense.
-        transform_vectors = np.array(self.vectorizer.transform(documents).todense())
+        transform_vectors = self._format(self.vectorizer.transform(documents))
 
         return transform_vectors
 
-    def transform_document_objects(self, documents: List[Document]) -> np.ndarray:
+    def transform_document_objects(
+        self, documents: List[Document]
+    ) -> Union[np.ndarray, csr_matrix]:
         """
         Transform given list of Document object
 
@@ -85,13 +114,19 @@ class TfidfDocVectorizer(DocVectorizerBase):
             documents (List[Document])
 
         Returns:
-            np.ndarray: Embeddings
+            np.ndarray or csr_matrix: Embeddings
         """
 
         document_text = [document.text for document in documents]
 
         return self.transform(document_text)
 
+    def _format(self, embeddings: csr_matrix) -> Union[np.ndarray, csr_matrix]:
+        # Vectorizers pickled before `sparse` was introduced have no such attribute
+        if getattr(self, "sparse", False):
+            return embeddings.tocsr()
+        return np.array(embeddings.todense())
+
     def save(self, tfidf_vectorizer_path):
         """Save tf_idf model to the pickle file.
 
@@ -103,7 +138,8 @@ class TfidfDocVectorizer(DocVectorizerBase):
 
     @classmethod
     def load(cls, model_path):
-        """Load vectorizer object from a pickle file.
+        """Load vectorizer object from a pickle file,
+        or from a directory saved by `save_arrays`.
 
         Args:
             model_path (str): Path to tf_idf model.
@@ -112,8 +148,88 @@ class TfidfDocVectorizer(DocVectorizerBase):
             TfidfDocVectorizer: A vectorizer which is loaded.
         """
 
+        if os.path.isdir(model_path):
+            return cls.load_arrays(model_path)
+
         # with open(model_path, "rb") as f:
         #     tfidf_vectorizer = pickle.load(f)
         tfidf_vectorizer = pickle.load(open(model_path, "rb"))
 
         return tfidf_vectorizer
+
+    def save_arrays(self, model_dir: str):
+        """Saves the fitted model as plain files in `model_dir`: the parameters in
+        `vectorizer.json`, the terms in `vocabulary.json` ordered by column and the
+        idf weights in `idf.npy`, which `load_arrays` memory-maps.
+        The directory is replaced as a whole once all files are written.
+
+        Args:
+            model_dir (str): Directory to save to.
+        """
+        if not self.is_trained:
+            raise ValueError("Vectorizer is not trained yet, there is nothing to save.")
+
+        params = {}
+        for name, value in self.vectorizer.get_params().items():
+            if name == "dtype":
+                value = np.dtype(value).name
+            elif name == "max_features":
+                continue
+            elif value is not None and not isinstance(value, (str, int, float, tuple)):
+                raise ValueError(f"Parameter {name} cannot be saved as array files")
+            params[name] = value
+        vocabulary_ = self.vectorizer.vocabulary_
+        vocabulary = sorted(vocabulary_, key=vocabulary_.get)
+
+        tmp_dir = f"{model_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        with open(os.path.join(tmp_dir, "vectorizer.json"), "w") as f:
+            json.dump(
+                {
+                    "class": type(self).__name__,
+                    "vector_dim": self.vector_dim,
+                    "sparse": getattr(self, "sparse", False),
+                    "params": params,
+                },
+                f,
+            )
+        with open(os.path.join(tmp_dir, "vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump(vocabulary, f, ensure_ascii=False)
+        np.save(os.path.join(tmp_dir, "idf.npy"), self.vectorizer.idf_)
+
+        old_dir = f"{model_dir}.old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(model_dir):
+            os.rename(model_dir, old_dir)
+        os.rename(tmp_dir, model_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    @classmethod
+    def load_arrays(cls, model_dir: str):
+        """Loads a vectorizer saved by `save_arrays`, without unpickling.
+
+        Args:
+            model_dir (str): Directory of the saved model.
+
+        Returns:
+            TfidfDocVectorizer: A vectorizer which is loaded.
+        """
+        with open(os.path.join(model_dir, "vectorizer.json")) as f:
+            config = json.load(f)
+        with open(os.path.join(model_dir, "vocabulary.json"), encoding="utf-8") as f:
+            vocabulary = json.load(f)
+
+        params = config["params"]
+        params["dtype"] = np.dtype(params["dtype"]).type
+        params["ngram_range"] = tuple(params["ngram_range"])
+        tfidf_vectorizer = cls(config["vector_dim"], sparse=config["sparse"], **params)
+        tfidf_vectorizer.vectorizer.vocabulary_ = {
+            term: idx for idx, term in enumerate(vocabulary)
+        }
+        tfidf_vectorizer.vectorizer.idf_ = np.load(
+            os.path.join(model_dir, "idf.npy"), mmap_mode="r"
+        )
+        tfidf_vectorizer.is_trained = True
+
+        return tfidf_vectorizer
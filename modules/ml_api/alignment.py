@@ -0,0 +1,148 @@
+from typing import List, Tuple
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix, issparse
+from scipy.sparse.csgraph import connected_components
+from sklearn.preprocessing import normalize
+
+# Number of rows of the similarity matrix computed at once
+SIMILARITY_BUFFER_SIZE = 1000
+
+
+def align_segments(
+    embeddings_A,
+    embeddings_B,
+    top_k: int = 10,
+    min_score: float = 0.0,
+    max_component_size: int = 300,
+) -> List[Tuple[int, int, float]]:
+    """Pairs segments of A and B, maximizing the sum of their cosine similarities.
+
+    Instead of solving the assignment on the full similarity matrix, which is
+    cubic in the number of segments, only the `top_k` most similar segments of each
+    segment are kept as candidates. The assignment is then solved separately on
+    each connected component of the remaining bipartite graph. Components with
+    more than `max_component_size` segments on one side are matched greedily, by
+    descending similarity, which bounds the latency for the longest inputs.
+
+    Args:
+        embeddings_A (np.ndarray or scipy sparse matrix): Embeddings of segments of A.
+        embeddings_B (np.ndarray or scipy sparse matrix): Embeddings of segments of B.
+        top_k (int, optional): Number of candidates kept per segment. Defaults to 10.
+        min_score (float, optional): Candidates with a similarity not above it are
+            dropped. Defaults to 0.0.
+        max_component_size (int, optional): Size of the largest component solved
+            exactly. Defaults to 300.
+
+    Returns:
+        List[Tuple[int, int, float]]: (row in A, row in B, similarity) of each pair,
+            sorted by row in A
+    """
+    n_A, n_B = embeddings_A.shape[0], embeddings_B.shape[0]
+    if n_A == 0 or n_B == 0:
+        return []
+    rows, cols, scores = _prune_candidates(embeddings_A, embeddings_B, top_k, min_score)
+    if len(scores) == 0:
+        return []
+
+    # Segments of B are numbered after the ones of A in the bipartite graph
+    graph = coo_matrix((scores, (rows, cols + n_A)), shape=(n_A + n_B, n_A + n_B))
+    _, labels = connected_components(graph, directed=False)
+    edge_labels = labels[rows]
+
+    pairs = []
+    order = np.argsort(edge_labels, kind="stable")
+    bounds = np.flatnonzero(np.diff(edge_labels[order])) + 1
+    for edges in np.split(order, bounds):
+        component = (rows[edges], cols[edges], scores[edges])
+        pairs.extend(_align_component(*component, max_component_size))
+    return sorted(pairs)
+
+
+def _prune_candidates(
+    embeddings_A, embeddings_B, top_k: int, min_score: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns rows, columns and scores of the similarities which are among the
+    `top_k` of their row or of their column and above `min_score`.
+    The similarity matrix is computed by chunks of `SIMILARITY_BUFFER_SIZE` rows.
+    """
+    embeddings_A = normalize(embeddings_A)
+    embeddings_B = normalize(embeddings_B)
+    n_B = embeddings_B.shape[0]
+    k_A = min(top_k, n_B)
+
+    candidates = []
+    # Best rows of each column over the chunks seen so far
+    best_rows = np.empty((0, n_B), dtype=np.int64)
+    best_scores = np.empty((0, n_B))
+    for start in range(0, embeddings_A.shape[0], SIMILARITY_BUFFER_SIZE):
+        block = embeddings_A[start : start + SIMILARITY_BUFFER_SIZE].dot(
+            embeddings_B.T
+        )
+        block = block.toarray() if issparse(block) else np.asarray(block)
+        block_rows = np.arange(start, start + block.shape[0])
+
+        # Top k columns of each row
+        top_cols = np.argpartition(-block, k_A - 1, axis=1)[:, :k_A]
+        candidates.append(
+            (
+                np.repeat(block_rows, k_A),
+                top_cols.ravel(),
+                np.take_along_axis(block, top_cols, axis=1).ravel(),
+            )
+        )
+
+        # Top k rows of each column
+        merged_rows = np.vstack([best_rows, np.tile(block_rows[:, None], n_B)])
+        merged_scores = np.vstack([best_scores, block])
+        k_B = min(top_k, merged_scores.shape[0])
+        top_rows = np.argpartition(-merged_scores, k_B - 1, axis=0)[:k_B]
+        best_rows = np.take_along_axis(merged_rows, top_rows, axis=0)
+        best_scores = np.take_along_axis(merged_scores, top_rows, axis=0)
+
+    candidates.append(
+        (
+            best_rows.ravel(),
+            np.tile(np.arange(n_B), best_rows.shape[0]),
+            best_scores.ravel(),
+        )
+    )
+    rows, cols, scores = (np.concatenate(values) for values in zip(*candidates))
+
+    keep = scores > min_score
+    rows, cols, scores = rows[keep], cols[keep], scores[keep]
+    # Pairs selected from both sides are kept once
+    _, unique = np.unique(rows * n_B + cols, return_index=True)
+    return rows[unique], cols[unique], scores[unique]
+
+
+def _align_component(
+    rows: np.ndarray, cols: np.ndarray, scores: np.ndarray, max_component_size: int
+) -> List[Tuple[int, int, float]]:
+    unique_rows, row_idx = np.unique(rows, return_inverse=True)
+    unique_cols, col_idx = np.unique(cols, return_inverse=True)
+
+    if max(len(unique_rows), len(unique_cols)) > max_component_size:
+        # Greedy matching by descending similarity
+        used_rows, used_cols = set(), set()
+        pairs = []
+        for i in np.argsort(-scores, kind="stable"):
+            if rows[i] not in used_rows and cols[i] not in used_cols:
+                used_rows.add(rows[i])
+                used_cols.add(cols[i])
+                pairs.append((int(rows[i]), int(cols[i]), float(scores[i])))
+        return pairs
+
+    # Pairs which are not candidates can be assigned, but are not returned
+    sim_matrix = np.zeros((len(unique_rows), len(unique_cols)))
+    is_candidate = np.zeros(sim_matrix.shape, dtype=bool)
+    sim_matrix[row_idx, col_idx] = scores
+    is_candidate[row_idx, col_idx] = True
+
+    row_ind, col_ind = linear_sum_assignment(sim_matrix, maximize=True)
+    return [
+        (int(unique_rows[a]), int(unique_cols[b]), float(sim_matrix[a, b]))
+        for a, b in zip(row_ind, col_ind)
+        if is_candidate[a, b]
+    ]
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from modules.ml.utils import get_logger
+
+logger = get_logger()
+
+
+def text_hash(text: str) -> str:
+    """Returns a short hex digest identifying `text`"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache holding up to `max_size` entries"""
+
+    def __init__(self, max_size: int = 512):
+        """
+        Attributes:
+            max_size (int, optional): Maximum number of entries, 0 disables the cache.
+                Defaults to 512.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the entry of `key` and marks it as recently used, None if missing"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any):
+        """Adds an entry, evicting the least recently used ones beyond `max_size`"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def json_hash(value: Any) -> str:
+    """Returns a hex digest identifying a JSON-serializable `value`"""
+    return text_hash(json.dumps(value, sort_keys=True, ensure_ascii=False))
+
+
+class ResponseCache:
+    """Cache of JSON-serializable responses expiring after `ttl` seconds.
+
+    Entries are kept in a bounded in-memory LRU and, if `disk_dir` is given, in one
+    JSON file per key, so that they survive restarts and are shared by the workers
+    of a server. Expired files are removed in a background thread, started every
+    `cleanup_interval` writes.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: float = 86400,
+        disk_dir: Optional[str] = None,
+        cleanup_interval: int = 1000,
+    ):
+        """
+        Attributes:
+            max_size (int, optional): Maximum number of entries in memory.
+                Defaults to 1024.
+            ttl (float, optional): Seconds after which entries expire.
+                Defaults to 86400.
+            disk_dir (str, optional): Directory of the on-disk tier, disabled if None.
+                Defaults to None.
+            cleanup_interval (int, optional): Number of writes between removals of
+                expired files. Defaults to 1000.
+        """
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.cleanup_interval = cleanup_interval
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # key -> (expiry time, value)
+        self._memory = LRUCache(max_size=max_size)
+        self._n_writes = 0
+        self._cleanup_lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the unexpired value of `key`, None if missing"""
+        entry = self._memory.get(key)
+        if entry is None and self.disk_dir:
+            entry = self._read(key)
+            if entry is not None and entry[0] > time.time():
+                self.disk_hits += 1
+                self._memory.put(key, entry)
+
+        if entry is None or entry[0] <= time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, value: Any):
+        entry = (time.time() + self.ttl, value)
+        self._memory.put(key, entry)
+        if self.disk_dir:
+            self._write(key, entry)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "diskHits": self.disk_hits,
+            "misses": self.misses,
+            "size": len(self._memory),
+        }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read(self, key: str) -> Optional[Tuple[float, Any]]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                content = json.load(f)
+            return content["expires_at"], content["value"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write(self, key: str, entry: Tuple[float, Any]):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": entry[0], "value": entry[1]}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Writing response cache entry failed: {e}")
+
+        self._n_writes += 1
+        if self._n_writes % self.cleanup_interval == 0:
+            self._remove_expired_in_background()
+
+    def _remove_expired_in_background(self):
+        # Listing a large directory must not block the requests being served
+        if not self._cleanup_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._remove_expired()
+            except OSError as e:
+                logger.warning(f"Removing expired response cache entries failed: {e}")
+            finally:
+                self._cleanup_lock.release()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _remove_expired(self):
+        now = time.time()
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json"):
+                continue
+            entry = self._read(name[: -len(".json")])
+            if entry is not None and entry[0] <= now:
+                try:
+                    os.remove(os.path.join(self.disk_dir, name))
+                except OSError:
+                    pass
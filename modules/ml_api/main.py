@@ -1,19 +1,37 @@
+import asyncio
+import json
 import os
+import threading
 from copy import deepcopy
+from typing import Dict, List, Optional, Set, Tuple
 
+import numpy as np
 import pandas as pd
 from fastapi import FastAPI, Response, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
-from scipy.optimize import linear_sum_assignment
-from sklearn.metrics.pairwise import cosine_similarity
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from modules.ml.document_store.faiss import FAISSDocumentStore
 from modules.ml.preprocessor.vi_preprocessor import ViPreProcessor
-from modules.ml.retriever.retriever import Retriever
-from modules.ml.vectorizer.tf_idf import TfidfDocVectorizer
-from modules.ml_api.models import CompareEntry, QueryResult
+from modules.ml.utils import get_logger
+from modules.ml.vectorizer.base import DocVectorizerBase
+from modules.ml_api.alignment import align_segments
+from modules.ml_api.cache import LRUCache, ResponseCache, json_hash, text_hash
+from modules.ml_api.models import (
+    CompareEntry,
+    CompareManyEntry,
+    CompareSingleEntry,
+    QueryResult,
+    SimilarEntry,
+)
+from modules.ml_api.similar import SimilarityIndex
+from modules.ml_api.startup import Startup
+from modules.ml_api.url_resolver import UrlResolver
+from modules.ml_api.worker_pool import BoundedProcessPool, PoolBusyError, Slot
 
 # Environment variables
 POSTGRES_URI = os.getenv(
@@ -23,37 +41,131 @@ CAND_DIM = 768
 RTRV_DIM = 1024
 EDIT_DISTANCE_THRESHOLD = 0.25
 CAND_PATH = os.getenv("CAND_PATH", "cand.bin")
-URL_QUERY = """
-    SELECT text_original
-    FROM (
-        SELECT value AS url
-            ,document_id
-        FROM meta m
-        WHERE lower(name) IN (
-                'href'
-                ,'url'
-                )
-        ) AS url_table
-    INNER JOIN "document" d ON url_table.document_id = d.id
-    WHERE CAST(levenshtein('{0}', url) AS DECIMAL) / CAST(length(url) AS DECIMAL) < {1}
-    ORDER BY levenshtein('{0}', url) LIMIT 1
+RTRV_PATH = os.getenv("RTRV_PATH", "rtrv.bin")
+# FAISS index of the remote database, published by the cronjobs
+REMOTE_IDX_PATH = os.getenv("REMOTE_IDX_PATH", "remote_index.bin")
+# Seconds between checks for a newly published index and vectorizers
+SIMILAR_RELOAD_INTERVAL = float(os.getenv("SIMILAR_RELOAD_INTERVAL", 60))
+SIMILAR_MAX_TOP_K = 100
+# "vncorenlp" to segment words on VnCoreNLP servers, "rdr" to segment in process
+WORD_SEGMENTER = os.getenv("WORD_SEGMENTER", "vncorenlp")
+# Number of articles whose segments and embeddings are kept in memory
+SEGMENT_CACHE_SIZE = int(os.getenv("SEGMENT_CACHE_SIZE", 512))
+# Number of recently paired articles to load into the cache at startup
+SEGMENT_CACHE_PRELOAD = int(os.getenv("SEGMENT_CACHE_PRELOAD", 0))
+# Number of compare responses kept in memory
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1024))
+# Seconds after which cached compare responses expire
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 86400))
+# Directory of compare responses cached on disk, disabled if empty
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR") or None
+# Seconds after which the in-process index of urls for fuzzy matching is rebuilt
+URL_INDEX_REFRESH_INTERVAL = float(os.getenv("URL_INDEX_REFRESH_INTERVAL", 600))
+# Number of processes splitting, embedding and aligning texts
+COMPARE_WORKERS = int(os.getenv("COMPARE_WORKERS", 2))
+# Number of most similar segments of the other text kept as alignment candidates
+ALIGN_TOP_K = int(os.getenv("ALIGN_TOP_K", 10))
+# Number of segments above which a group of candidates is aligned greedily
+ALIGN_MAX_COMPONENT_SIZE = int(os.getenv("ALIGN_MAX_COMPONENT_SIZE", 300))
+# Number of compare requests processed at once, further requests are rejected
+COMPARE_MAX_PENDING = int(os.getenv("COMPARE_MAX_PENDING", 8))
+# Seconds after which a compare request is aborted
+COMPARE_TIMEOUT = float(os.getenv("COMPARE_TIMEOUT", 30))
+# Maximum number of comparisons in a /compare_many request
+COMPARE_MANY_MAX_SIZE = int(os.getenv("COMPARE_MANY_MAX_SIZE", 200))
+# Number of comparisons aligned per task of the worker pool in /compare_many
+COMPARE_MANY_CHUNK_SIZE = int(os.getenv("COMPARE_MANY_CHUNK_SIZE", 16))
+TEXT_QUERY = text('SELECT text_original FROM "document" WHERE id = :document_id')
+PRELOAD_QUERY = """
+    SELECT d.id
+        ,text_original
+    FROM "document" d
+    INNER JOIN (
+        SELECT document_id
+            ,MAX(computed_at) AS computed_at
+        FROM (
+            SELECT doc_a AS document_id, computed_at FROM similarity_edge
+            UNION ALL
+            SELECT doc_b AS document_id, computed_at FROM similarity_edge
+            ) AS edges
+        GROUP BY document_id
+        ) AS recent ON recent.document_id = d.id
+    ORDER BY recent.computed_at DESC LIMIT {0}
 """
 
-# Default methods
-preprocessor = ViPreProcessor(split_by="sentence")
+logger = get_logger()
+
+startup = Startup()
+
+
+def load_candidate_vectorizer_() -> DocVectorizerBase:
+    vectorizer = DocVectorizerBase.load(CAND_PATH)
+    if vectorizer.vector_dim != CAND_DIM:
+        raise ValueError(
+            f"Candidate vectorizer has {vectorizer.vector_dim} dimensions"
+            f" instead of {CAND_DIM}"
+        )
+    return vectorizer
+
+
+def load_url_resolver_() -> UrlResolver:
+    resolver = UrlResolver(
+        remote_doc_store.get().engine,
+        max_edit_ratio=EDIT_DISTANCE_THRESHOLD,
+        refresh_interval=URL_INDEX_REFRESH_INTERVAL,
+    )
+    # The fuzzy index is built here rather than by the first request
+    resolver.refresh()
+    return resolver
+
+
+# Components are initialized in the background once the server has started,
+# see `/ready`. Spawning the VnCoreNLP server takes the longest, unless words
+# are segmented in process.
+preprocessor = startup.register(
+    "preprocessor",
+    lambda: ViPreProcessor(split_by="sentence", word_segmenter=WORD_SEGMENTER),
+)
+candidate_vectorizer = startup.register(
+    "candidate_vectorizer", load_candidate_vectorizer_
+)
+remote_doc_store = startup.register(
+    "remote_doc_store",
+    lambda: FAISSDocumentStore(sql_url=POSTGRES_URI, vector_dim=CAND_DIM),
+)
+url_resolver = startup.register("url_resolver", load_url_resolver_)
+# Components needed to serve requests
+REQUIRED_COMPONENTS = [
+    "preprocessor",
+    "candidate_vectorizer",
+    "remote_doc_store",
+    "url_resolver",
+]
 
-document_store = FAISSDocumentStore(
-    sql_url=POSTGRES_URI, vector_dim=CAND_DIM, index_buffer_size=5000
+similarity_index = SimilarityIndex(
+    sql_url=POSTGRES_URI,
+    index_path=REMOTE_IDX_PATH,
+    cand_path=CAND_PATH,
+    rtrv_path=RTRV_PATH,
+    reload_interval=SIMILAR_RELOAD_INTERVAL,
 )
+# The index may not be published yet, which does not prevent serving compare requests
+startup.register("similarity_index", similarity_index.load)
 
-retriever = Retriever(
-    document_store=document_store,
-    candidate_vectorizer=TfidfDocVectorizer(CAND_DIM),
-    retriever_vectorizer=TfidfDocVectorizer(RTRV_DIM),
+# (document id, text hash, vectorizer version) -> (segments, embeddings)
+segment_cache = LRUCache(max_size=SEGMENT_CACHE_SIZE)
+
+# Compare responses, see `compare_cache_key_`
+response_cache = ResponseCache(
+    max_size=RESPONSE_CACHE_SIZE,
+    ttl=RESPONSE_CACHE_TTL,
+    disk_dir=RESPONSE_CACHE_DIR,
 )
-retriever.train_candidate_vectorizer(retrain=False, save_path=CAND_PATH)
 
-remote_doc_store = FAISSDocumentStore(sql_url=POSTGRES_URI, vector_dim=CAND_DIM)
+# Processes are forked on first use and inherit the preprocessor and vectorizers
+worker_pool = BoundedProcessPool(
+    max_workers=COMPARE_WORKERS, max_pending=COMPARE_MAX_PENDING
+)
 
 tags_metadata = [
     {"name": "get", "description": "Properly do nothing now"},
@@ -61,6 +173,10 @@ tags_metadata = [
         "name": "compare",
         "description": "Compare and show the similar sentences between two documents",
     },
+    {
+        "name": "similar",
+        "description": "Find the indexed documents most similar to a document",
+    },
 ]
 app = FastAPI(
     title="TopDup-ML",
@@ -75,36 +191,100 @@ def get_query():
     return Response()
 
 
-def compare_(text_A: str, text_B: str):
+@app.get("/ready", response_model=QueryResult, tags=["get"])
+def ready(response: Response):
+    """Reports whether the components are initialized and requests can be served"""
+    results = startup.status()
+    if not startup.is_ready(REQUIRED_COMPONENTS):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"message": "TopDup-ML is starting", "results": results}
+    return {"message": "TopDup-ML is ready", "results": results}
+
+
+@app.get("/metrics", response_model=QueryResult, tags=["get"])
+def metrics():
+    """Reports counters of the caches for monitoring"""
+    results = {
+        "responseCache": response_cache.stats(),
+        "segmentCache": {
+            "hits": segment_cache.hits,
+            "misses": segment_cache.misses,
+            "size": len(segment_cache),
+        },
+    }
+    return {"message": "TopDup-ML metrics", "results": results}
+
+
+@app.on_event("startup")
+def start_components():
+    startup.start()
+
+
+def resolve_url_(url: str) -> Optional[Tuple[str, str]]:
+    """Returns the id and original text of the article stored with `url`"""
+    document_id = url_resolver.get().resolve(url)
+    if document_id is None:
+        return None
+    with remote_doc_store.get().engine.connect() as conn:
+        row = conn.execute(TEXT_QUERY, document_id=document_id).fetchone()
+    return (document_id, row[0]) if row else None
+
+
+def split_and_embed_(text: str) -> Tuple[List, np.ndarray]:
+    """Splits `text` into segments and calculates their embedding vectors"""
     # Split texts before cleaning
-    s_text_A = preprocessor.split({"text": text_A})
-    s_text_B = preprocessor.split({"text": text_B})
+    s_text = preprocessor.get().split({"text": text})
 
     # Clean texts
-    sc_text_A = deepcopy(s_text_A)
-    sc_text_B = deepcopy(s_text_B)
-    sc_text_A = [preprocessor.clean(s_text) for s_text in sc_text_A]
-    sc_text_B = [preprocessor.clean(s_text) for s_text in sc_text_B]
+    sc_text = deepcopy(s_text)
+    sc_text = preprocessor.get().clean_many(sc_text)
 
     # Calculate embedding vectors
-    embedding_vectors_A = retriever.candidate_vectorizer.transform(
-        [t["text"] for t in sc_text_A]
-    )
-    embedding_vectors_B = retriever.candidate_vectorizer.transform(
-        [t["text"] for t in sc_text_B]
+    embedding_vectors = candidate_vectorizer.get().transform(
+        [t["text"] for t in sc_text]
     )
+    return s_text, embedding_vectors
 
+
+def segment_key_(text: str, document_id: Optional[str] = None) -> Tuple:
+    return (document_id, text_hash(text), candidate_vectorizer.get().version)
+
+
+def segment_(text: str, document_id: Optional[str] = None) -> Tuple[List, np.ndarray]:
+    """Splits `text` into segments and calculates their embedding vectors.
+    Results are cached per document id and text.
+    """
+    key = segment_key_(text, document_id)
+    cached = segment_cache.get(key)
+    if cached is not None:
+        return cached
+
+    s_text, embedding_vectors = split_and_embed_(text)
+    segment_cache.put(key, (s_text, embedding_vectors))
+    return s_text, embedding_vectors
+
+
+def align_(
+    s_text_A: List,
+    embedding_vectors_A: np.ndarray,
+    s_text_B: List,
+    embedding_vectors_B: np.ndarray,
+) -> Dict:
     # Maximize the sum of similiraties
-    sim_matrix = cosine_similarity(embedding_vectors_A, embedding_vectors_B)
-    row_idx, col_idx = linear_sum_assignment(sim_matrix, maximize=True)
+    aligned = align_segments(
+        embedding_vectors_A,
+        embedding_vectors_B,
+        top_k=ALIGN_TOP_K,
+        max_component_size=ALIGN_MAX_COMPONENT_SIZE,
+    )
 
     pairs = list()
-    for a, b in zip(row_idx, col_idx):
+    for a, b, score in aligned:
         pairs.append(
             {
                 "segmentIdxA": s_text_A[a]["meta"]["_split_id"],
                 "segmentIdxB": s_text_B[b]["meta"]["_split_id"],
-                "similarityScore": sim_matrix[a, b],
+                "similarityScore": score,
             }
         )
 
@@ -115,47 +295,383 @@ def compare_(text_A: str, text_B: str):
     }
 
 
+def compare_(
+    text_A: str,
+    text_B: str,
+    document_id_A: Optional[str] = None,
+    document_id_B: Optional[str] = None,
+):
+    s_text_A, embedding_vectors_A = segment_(text_A, document_id_A)
+    s_text_B, embedding_vectors_B = segment_(text_B, document_id_B)
+    return align_(s_text_A, embedding_vectors_A, s_text_B, embedding_vectors_B)
+
+
+def align_many_(
+    segments: List[Tuple[List, np.ndarray]], index_pairs: List[Tuple[int, int]]
+) -> List[Dict]:
+    """Aligns the segments of each pair of `index_pairs` of `segments`"""
+    return [align_(*segments[a], *segments[b]) for a, b in index_pairs]
+
+
+async def segment_async_(
+    text: str, document_id: Optional[str] = None, slot: Optional[Slot] = None
+) -> Tuple[List, np.ndarray]:
+    """Same as `segment_`, computing cache misses in the worker pool with `slot`"""
+    key = segment_key_(text, document_id)
+    cached = segment_cache.get(key)
+    if cached is not None:
+        return cached
+
+    s_text, embedding_vectors = await worker_pool.run(
+        split_and_embed_, text, slot=slot
+    )
+    segment_cache.put(key, (s_text, embedding_vectors))
+    return s_text, embedding_vectors
+
+
+async def compare_async_(
+    text_A: str,
+    text_B: str,
+    document_id_A: Optional[str] = None,
+    document_id_B: Optional[str] = None,
+    slot: Optional[Slot] = None,
+):
+    (s_text_A, embedding_vectors_A), (s_text_B, embedding_vectors_B) = (
+        await asyncio.gather(
+            segment_async_(text_A, document_id_A, slot),
+            segment_async_(text_B, document_id_B, slot),
+        )
+    )
+    return await worker_pool.run(
+        align_,
+        s_text_A,
+        embedding_vectors_A,
+        s_text_B,
+        embedding_vectors_B,
+        slot=slot,
+    )
+
+
+def compare_cache_key_(
+    text_A: str,
+    text_B: str,
+    document_id_A: Optional[str] = None,
+    document_id_B: Optional[str] = None,
+) -> str:
+    """Key of a compare response, which changes with the texts of the documents,
+    the vectorizer and the alignment settings
+    """
+    return json_hash(
+        [
+            [document_id_A, text_hash(text_A.strip())],
+            [document_id_B, text_hash(text_B.strip())],
+            candidate_vectorizer.get().version,
+            ALIGN_TOP_K,
+            ALIGN_MAX_COMPONENT_SIZE,
+        ]
+    )
+
+
+async def get_compare_input_(pair: CompareSingleEntry) -> Tuple[str, Optional[str]]:
+    """Returns the text of a compare input and the id of its document if any.
+
+    Raises:
+        ValueError: If the input mode is invalid or no document has the url.
+    """
+    if pair.mode == "url":
+        document = await run_in_threadpool(resolve_url_, pair.content)
+        if document is None:
+            raise ValueError("We cannot find your URLs")
+        document_id, text = document
+        return text, document_id
+    elif pair.mode == "text":
+        return pair.content, None
+    else:
+        raise ValueError("Invalid input mode, either url or text")
+
+
 @app.post(
     "/compare",
     response_model=QueryResult,
     status_code=status.HTTP_200_OK,
     tags=["compare"],
 )
-def compare(entry: CompareEntry, response: Response):
-    if entry.pairs[0].mode == "url":
-        text_A = pd.read_sql(
-            URL_QUERY.format(entry.pairs[0].content, EDIT_DISTANCE_THRESHOLD),
-            con=remote_doc_store.engine,
-        )
-        if text_A.empty:
-            response.status_code = status.HTTP_400_BAD_REQUEST
-            return {"message": "We cannot find your URLs"}
-        else:
-            text_A = text_A.values[0][0]
-    elif entry.pairs[0].mode == "text":
-        text_A = entry.pairs[0].content
-    else:
+async def compare(entry: CompareEntry, response: Response):
+    if not startup.is_ready(REQUIRED_COMPONENTS):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"message": "TopDup-ML is starting, please try again later"}
+
+    try:
+        text_A, document_id_A = await get_compare_input_(entry.pairs[0])
+        text_B, document_id_B = await get_compare_input_(entry.pairs[1])
+    except ValueError as e:
         response.status_code = status.HTTP_400_BAD_REQUEST
-        return {"message": "Invalid input mode, either url or text"}
+        return {"message": str(e)}
 
-    if entry.pairs[1].mode == "url":
-        text_B = pd.read_sql(
-            URL_QUERY.format(entry.pairs[1].content, EDIT_DISTANCE_THRESHOLD),
-            con=remote_doc_store.engine,
-        )
-        if text_B.empty:
+    key = compare_cache_key_(text_A, text_B, document_id_A, document_id_B)
+    results = response_cache.get(key)
+    if results is None:
+        try:
+            slot = worker_pool.acquire()
+        except PoolBusyError as e:
+            logger.warning(f"Rejected compare request: {e}")
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            return {"message": "Too many requests, please try again later"}
+
+        try:
+            results = await asyncio.wait_for(
+                compare_async_(text_A, text_B, document_id_A, document_id_B, slot),
+                timeout=COMPARE_TIMEOUT,
+            )
+        except ValueError as e:
             response.status_code = status.HTTP_400_BAD_REQUEST
-            return {"message": "We cannot find your URLs"}
+            return {"message": str(e)}
+        except asyncio.TimeoutError:
+            response.status_code = status.HTTP_504_GATEWAY_TIMEOUT
+            return {"message": "Comparing took too long, please try shorter texts"}
+        finally:
+            # The slot stays taken until the tasks still running have finished
+            slot.release()
+
+        results = jsonable_encoder(results)
+        response_cache.put(key, results)
+
+    return {"message": "Successfully requested TopDup-ML [compare]", "results": results}
+
+
+def preload_segment_cache(n_documents: int):
+    """Loads segments and embeddings of the most recently paired articles into the cache"""
+    try:
+        documents = pd.read_sql(
+            PRELOAD_QUERY.format(n_documents), con=remote_doc_store.get().engine
+        )
+        for document_id, text in documents.values:
+            segment_(text, document_id)
+        logger.info(f"Preloaded {len(documents)} articles into segment cache")
+    except Exception as e:
+        logger.error(f"Preloading segment cache failed: {e}")
+
+
+@app.on_event("startup")
+def start_preloading():
+    n_documents = min(SEGMENT_CACHE_PRELOAD, SEGMENT_CACHE_SIZE)
+    if n_documents > 0:
+        threading.Thread(
+            target=preload_segment_cache, args=(n_documents,), daemon=True
+        ).start()
+
+
+async def stream_compare_many_(comparisons: List[CompareEntry]):
+    """Yields the results of `comparisons` as NDJSON lines tagged with their index.
+    Distinct inputs are resolved, segmented and embedded once for the whole batch.
+
+    The slot of the worker pool is taken here rather than by the endpoint, so that
+    it is not leaked when the response is never streamed.
+    """
+    emitted: Set[int] = set()
+
+    def line(index: int, message: str, results: Optional[Dict] = None) -> str:
+        emitted.add(index)
+        content = {"index": index, "message": message, "results": results}
+        return json.dumps(jsonable_encoder(content)) + "\n"
+
+    try:
+        slot = worker_pool.acquire()
+    except PoolBusyError as e:
+        logger.warning(f"Rejected compare_many request: {e}")
+        for i in range(len(comparisons)):
+            yield line(i, "Too many requests, please try again later")
+        return
+
+    # At most one segmenting task per process of the pool at a time, so that the
+    # tasks of other requests are not queued behind the whole batch
+    in_flight = asyncio.Semaphore(worker_pool.max_workers)
+
+    async def segment_bounded_(text: str, document_id: Optional[str]):
+        async with in_flight:
+            return await segment_async_(text, document_id, slot)
+
+    try:
+        # Inputs resolved to their text and document id, or to the ValueError raised
+        inputs = {
+            (pair.mode, pair.content): pair
+            for comparison in comparisons
+            for pair in comparison.pairs
+        }
+        resolved = await asyncio.gather(
+            *(get_compare_input_(pair) for pair in inputs.values()),
+            return_exceptions=True,
+        )
+        for result in resolved:
+            if isinstance(result, Exception) and not isinstance(result, ValueError):
+                raise result
+        resolved_inputs = dict(zip(inputs, resolved))
+
+        # Comparisons whose response is not cached yet
+        pending = []
+        for i, comparison in enumerate(comparisons):
+            keys = [(pair.mode, pair.content) for pair in comparison.pairs]
+            errors = [
+                resolved_inputs[key]
+                for key in keys
+                if isinstance(resolved_inputs[key], ValueError)
+            ]
+            if errors:
+                yield line(i, str(errors[0]))
+                continue
+
+            (text_A, document_id_A), (text_B, document_id_B) = (
+                resolved_inputs[key] for key in keys
+            )
+            cache_key = compare_cache_key_(text_A, text_B, document_id_A, document_id_B)
+            results = response_cache.get(cache_key)
+            if results is not None:
+                yield line(i, "Successfully requested TopDup-ML [compare]", results)
+            else:
+                pending.append((i, cache_key, keys))
+
+        # Position of each input in the list of distinct segmented texts
+        segment_keys: Dict[Tuple, int] = {}
+        input_positions: Dict[Tuple, int] = {}
+        texts = []
+        for _, _, keys in pending:
+            for input_key in keys:
+                key = segment_key_(*resolved_inputs[input_key])
+                if key not in segment_keys:
+                    segment_keys[key] = len(texts)
+                    texts.append(resolved_inputs[input_key])
+                input_positions[input_key] = segment_keys[key]
+        segments = await asyncio.wait_for(
+            asyncio.gather(*(segment_bounded_(*text) for text in texts)),
+            timeout=COMPARE_TIMEOUT,
+        )
+
+        index_pairs = [
+            (i, cache_key, input_positions[key_A], input_positions[key_B])
+            for i, cache_key, (key_A, key_B) in pending
+        ]
+        for start in range(0, len(index_pairs), COMPARE_MANY_CHUNK_SIZE):
+            chunk = index_pairs[start : start + COMPARE_MANY_CHUNK_SIZE]
+            # Only the segments used by the chunk are sent to the worker
+            used = sorted({position for _, _, a, b in chunk for position in (a, b)})
+            positions = {position: j for j, position in enumerate(used)}
+            chunk_segments = [segments[position] for position in used]
+            chunk_pairs = [(positions[a], positions[b]) for _, _, a, b in chunk]
+            results = await asyncio.wait_for(
+                worker_pool.run(align_many_, chunk_segments, chunk_pairs, slot=slot),
+                timeout=COMPARE_TIMEOUT,
+            )
+            for (i, cache_key, _, _), result in zip(chunk, results):
+                result = jsonable_encoder(result)
+                response_cache.put(cache_key, result)
+                yield line(i, "Successfully requested TopDup-ML [compare]", result)
+    except asyncio.TimeoutError:
+        # Comparisons already streamed are not reported again
+        for i in range(len(comparisons)):
+            if i not in emitted:
+                yield line(i, "Comparing took too long, please try shorter texts")
+    finally:
+        # The slot stays taken until the tasks still running have finished
+        slot.release()
+
+
+@app.post("/compare_many", status_code=status.HTTP_200_OK, tags=["compare"])
+async def compare_many(entry: CompareManyEntry):
+    """Compares many pairs of texts or urls at once.
+    Results are streamed as NDJSON lines with the index of their comparison.
+    """
+    if not startup.is_ready(REQUIRED_COMPONENTS):
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"message": "TopDup-ML is starting, please try again later"},
+        )
+
+    if len(entry.comparisons) > COMPARE_MANY_MAX_SIZE:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "message": f"At most {COMPARE_MANY_MAX_SIZE} comparisons are allowed"
+            },
+        )
+
+    if worker_pool.is_busy:
+        logger.warning("Rejected compare_many request: worker pool is busy")
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"message": "Too many requests, please try again later"},
+        )
+
+    return StreamingResponse(
+        stream_compare_many_(entry.comparisons), media_type="application/x-ndjson"
+    )
+
+
+def similar_(entry: SimilarEntry) -> List[List]:
+    """Returns [document_id, score] pairs of the documents most similar to `entry`.
+
+    Raises:
+        ValueError: If the input is invalid or its document is not found.
+    """
+    if not 0 < entry.top_k <= SIMILAR_MAX_TOP_K:
+        raise ValueError(f"top_k must be between 1 and {SIMILAR_MAX_TOP_K}")
+
+    document_id = None
+    if entry.mode == "text":
+        text = preprocessor.get().clean({"text": entry.content})["text"]
+    elif entry.mode in ("url", "id"):
+        if entry.mode == "url":
+            document_id = url_resolver.get().resolve(entry.content)
         else:
-            text_B = text_B.values[0][0]
-    elif entry.pairs[1].mode == "text":
-        text_B = entry.pairs[1].content
+            document_id = entry.content
+        text = None
+        if document_id is not None:
+            text = similarity_index.get_document_text(document_id)
+        if text is None:
+            raise ValueError("We cannot find your document")
     else:
+        raise ValueError("Invalid input mode, either text, url or id")
+
+    return similarity_index.query(text, top_k=entry.top_k, document_id=document_id)
+
+
+@app.post(
+    "/similar",
+    response_model=QueryResult,
+    status_code=status.HTTP_200_OK,
+    tags=["similar"],
+)
+async def similar(entry: SimilarEntry, response: Response):
+    if not startup.is_ready(REQUIRED_COMPONENTS):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"message": "TopDup-ML is starting, please try again later"}
+
+    if not similarity_index.is_loaded:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"message": "Similarity index is not available yet"}
+
+    try:
+        similar_documents = await asyncio.wait_for(
+            run_in_threadpool(similar_, entry), timeout=COMPARE_TIMEOUT
+        )
+    except ValueError as e:
         response.status_code = status.HTTP_400_BAD_REQUEST
-        return {"message": "Invalid input mode, either url or text"}
+        return {"message": str(e)}
+    except asyncio.TimeoutError:
+        response.status_code = status.HTTP_504_GATEWAY_TIMEOUT
+        return {"message": "Searching took too long, please try again later"}
 
-    results = compare_(text_A, text_B)
-    return {"message": "Successfully requested TopDup-ML [compare]", "results": results}
+    results = {
+        "similarDocuments": [
+            {"documentId": document_id, "similarityScore": float(score)}
+            for document_id, score in similar_documents
+        ]
+    }
+    return {"message": "Successfully requested TopDup-ML [similar]", "results": results}
+
+
+@app.on_event("shutdown")
+def stop_worker_pool():
+    worker_pool.shutdown()
 
 
 @app.exception_handler(RequestValidationError)
@@ -1,6 +1,6 @@
 from typing import Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, conlist
 
 
 class CompareSingleEntry(BaseModel):
@@ -9,7 +9,18 @@ class CompareSingleEntry(BaseModel):
 
 
 class CompareEntry(BaseModel):
-    pairs: List[CompareSingleEntry]
+    # The two texts or urls to compare
+    pairs: conlist(CompareSingleEntry, min_items=2, max_items=2)  # type: ignore
+
+
+class CompareManyEntry(BaseModel):
+    comparisons: List[CompareEntry]
+
+
+class SimilarEntry(BaseModel):
+    mode: str
+    content: str
+    top_k: int = 10
 
 
 class QueryResult(BaseModel):
@@ -29,6 +29,12 @@ job "ml-api" {
         "traefik.http.routers.ml-api.rule=Headers(`function`: `api`)",
         "traefik.http.routers.ml-api.service=ml-api",
       ]
+      check {
+        type     = "http"
+        path     = "/ready"
+        interval = "10s"
+        timeout  = "2s"
+      }
       meta {
         name = "prod-ml-api"
       }
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+from modules.ml.document_store.faiss import FAISSDocumentStore
+from modules.ml.retriever.retriever import Retriever
+from modules.ml.utils import get_logger
+from modules.ml.vectorizer.base import DocVectorizerBase
+
+logger = get_logger()
+
+
+class SimilarityIndex:
+    """Serves the documents most similar to a text, from the FAISS index and
+    vectorizers published by the cronjobs.
+
+    The index and vectorizers are loaded once into an immutable `Retriever`.
+    When the cronjobs publish new files, a new `Retriever` is loaded in the
+    background and swapped in with a single assignment, so concurrent queries
+    always use a consistent index and keep running during the reload.
+    """
+
+    def __init__(
+        self,
+        sql_url: str,
+        index_path: str,
+        cand_path: str,
+        rtrv_path: str,
+        reload_interval: float = 60,
+    ):
+        """
+        Attributes:
+            sql_url (str): URL of the SQL database of the indexed documents.
+            index_path (str): Path of the FAISS index file.
+            cand_path (str): Path of the candidate vectorizer file.
+            rtrv_path (str): Path of the retriever vectorizer file.
+            reload_interval (float, optional): Seconds between checks for newly
+                published files. Defaults to 60.
+        """
+        self.sql_url = sql_url
+        self.paths = (index_path, cand_path, rtrv_path)
+        self.reload_interval = reload_interval
+
+        self._retriever: Optional[Retriever] = None
+        self._mtimes: Optional[Tuple[float, ...]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._retriever is not None
+
+    def query(
+        self, text: str, top_k: int = 10, document_id: Optional[str] = None
+    ) -> List[List[Any]]:
+        """Returns [document_id, score] pairs of the `top_k` documents most similar
+        to `text`, sorted by descending score.
+
+        Args:
+            text (str): Processed text to query.
+            top_k (int, optional): Number of results. Defaults to 10.
+            document_id (str, optional): Id of the queried document, which is
+                excluded from the results. Defaults to None.
+
+        Raises:
+            ValueError: If no index has been published yet.
+        """
+        self._reload_if_stale()
+        retriever = self._retriever
+        if retriever is None:
+            raise ValueError("Similarity index is not available yet")
+
+        return retriever.retrieve(
+            [text],
+            top_k_results=top_k,
+            query_ids=None if document_id is None else [document_id],
+        )[0]
+
+    def get_document_text(self, document_id: str) -> Optional[str]:
+        """Returns the processed text of an indexed document, None if not found"""
+        retriever = self._retriever
+        if retriever is None:
+            raise ValueError("Similarity index is not available yet")
+        documents = retriever.document_store.get_documents_by_id([document_id])
+        return documents[0].text if documents else None
+
+    def load(self):
+        """Loads the published files, if they changed, and swaps them in"""
+        mtimes = self._get_mtimes()
+        if mtimes is None or mtimes == self._mtimes:
+            return
+
+        index_path, cand_path, rtrv_path = self.paths
+        document_store = FAISSDocumentStore.load(
+            faiss_file_path=index_path, sql_url=self.sql_url
+        )
+        retriever = Retriever(
+            document_store=document_store,
+            candidate_vectorizer=DocVectorizerBase.load(cand_path),
+            retriever_vectorizer=DocVectorizerBase.load(rtrv_path),
+        )
+
+        self._retriever, self._mtimes = retriever, mtimes
+        logger.info(
+            f"Similarity index loaded with {document_store.faiss_index.ntotal} vectors"
+        )
+
+    def _get_mtimes(self) -> Optional[Tuple[float, ...]]:
+        try:
+            return tuple(os.path.getmtime(path) for path in self.paths)
+        except OSError:
+            return None
+
+    def _reload_if_stale(self):
+        if time.time() - self._checked_at < self.reload_interval:
+            return
+        # Only one query triggers the reload, the others keep the current index
+        if not self._lock.acquire(blocking=False):
+            return
+        self._checked_at = time.time()
+
+        def run():
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"Loading similarity index failed: {e}")
+            finally:
+                self._lock.release()
+
+        threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,98 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from modules.ml.utils import get_logger
+
+logger = get_logger()
+
+
+class Component:
+    """Value which is initialized once, in the background or on first use"""
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        """
+        Attributes:
+            name (str): Name reported by the readiness endpoint.
+            factory (Callable[[], Any]): Creates the value.
+        """
+        self.name = name
+        self.factory = factory
+
+        self._value: Any = None
+        self._error: Optional[Exception] = None
+        self._done = threading.Event()
+        self._started = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._done.is_set() and self._error is None
+
+    @property
+    def status(self) -> str:
+        if not self._done.is_set():
+            return "loading" if self._started else "pending"
+        return "ready" if self._error is None else f"failed: {self._error}"
+
+    def start(self):
+        """Initializes the value in a background thread, if not started yet"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._initialize, daemon=True).start()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """Returns the value, initializing it in the calling thread if not started.
+
+        Raises:
+            ValueError: If the initialization failed or did not finish in `timeout`.
+        """
+        with self._lock:
+            initialize = not self._started
+            self._started = True
+        if initialize:
+            self._initialize()
+
+        if not self._done.wait(timeout):
+            raise ValueError(f"{self.name} is not ready yet")
+        if self._error is not None:
+            raise ValueError(f"{self.name} failed to initialize: {self._error}")
+        return self._value
+
+    def _initialize(self):
+        try:
+            self._value = self.factory()
+            logger.info(f"{self.name} initialized")
+        except Exception as e:
+            self._error = e
+            logger.error(f"Initializing {self.name} failed: {e}")
+        finally:
+            self._done.set()
+
+
+class Startup:
+    """Registry of the components of the API, started in the background so that
+    the server accepts requests immediately and reports its readiness.
+    """
+
+    def __init__(self):
+        self.components: Dict[str, Component] = dict()
+
+    def register(self, name: str, factory: Callable[[], Any]) -> Component:
+        component = Component(name, factory)
+        self.components[name] = component
+        return component
+
+    def start(self):
+        for component in self.components.values():
+            component.start()
+
+    def is_ready(self, names: Optional[List[str]] = None) -> bool:
+        """Whether the components of `names`, all by default, are initialized"""
+        return all(
+            self.components[name].is_ready for name in names or self.components
+        )
+
+    def status(self) -> Dict[str, str]:
+        return {name: component.status for name, component in self.components.items()}
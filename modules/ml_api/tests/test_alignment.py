@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+from modules.ml_api.alignment import align_segments
+
+
+def _similarities(embeddings_A, embeddings_B):
+    return normalize(embeddings_A).dot(normalize(embeddings_B).T)
+
+
+def _dense_greedy(embeddings_A, embeddings_B):
+    sim_matrix = _similarities(embeddings_A, embeddings_B)
+    used_rows, used_cols = set(), set()
+    pairs = []
+    for index in np.argsort(-sim_matrix, axis=None, kind="stable"):
+        row, col = np.unravel_index(index, sim_matrix.shape)
+        if row not in used_rows and col not in used_cols and sim_matrix[row, col] > 0:
+            used_rows.add(row)
+            used_cols.add(col)
+            pairs.append((int(row), int(col)))
+    return sorted(pairs)
+
+
+def _dense_assignment(embeddings_A, embeddings_B):
+    sim_matrix = _similarities(embeddings_A, embeddings_B)
+    row_ind, col_ind = linear_sum_assignment(sim_matrix, maximize=True)
+    return sorted(
+        (int(row), int(col))
+        for row, col in zip(row_ind, col_ind)
+        if sim_matrix[row, col] > 0
+    )
+
+
+@pytest.fixture
+def embeddings():
+    rand = np.random.RandomState(0)
+    embeddings_A = rand.rand(12, 8)
+    # B holds noisy copies of segments of A in another order, and other segments
+    embeddings_B = np.vstack(
+        [embeddings_A[::-2] + 0.05 * rand.rand(6, 8), rand.rand(4, 8)]
+    )
+    return embeddings_A, embeddings_B
+
+
+def test_greedy_alignment_matches_dense(embeddings):
+    pairs = align_segments(*embeddings, max_component_size=0)
+    assert [(row, col) for row, col, _ in pairs] == _dense_greedy(*embeddings)
+
+
+def test_alignment_matches_dense(embeddings):
+    pairs = align_segments(*embeddings, top_k=10)
+    assert [(row, col) for row, col, _ in pairs] == _dense_assignment(*embeddings)
+
+    sim_matrix = _similarities(*embeddings)
+    for row, col, score in pairs:
+        assert score == pytest.approx(sim_matrix[row, col])
+
+
+def test_pruned_alignment_keeps_copies(embeddings):
+    # Each copy is the most similar segment of its original
+    pairs = align_segments(*embeddings, top_k=1)
+    copies = {(11 - 2 * i, i) for i in range(6)}
+    assert copies <= {(row, col) for row, col, _ in pairs}
+
+
+def test_sparse_embeddings(embeddings):
+    embeddings_A, embeddings_B = embeddings
+    sparse_pairs = align_segments(csr_matrix(embeddings_A), csr_matrix(embeddings_B))
+    pairs = align_segments(embeddings_A, embeddings_B)
+    assert [pair[:2] for pair in sparse_pairs] == [pair[:2] for pair in pairs]
+    scores = [score for _, _, score in pairs]
+    assert [score for _, _, score in sparse_pairs] == pytest.approx(scores)
+    assert align_segments(embeddings_A[:0], embeddings_B) == []
@@ -0,0 +1,49 @@
+import time
+
+from modules.ml_api.cache import LRUCache, ResponseCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_lru_cache_disabled():
+    cache = LRUCache(max_size=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+
+
+def test_response_cache_expires(monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    cache = ResponseCache(ttl=10)
+    cache.put("key", {"value": 1})
+    assert cache.get("key") == {"value": 1}
+
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get("key") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_response_cache_on_disk(tmp_path, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    ResponseCache(ttl=10, disk_dir=str(tmp_path)).put("key", [1, 2])
+
+    # Another worker reads the entry from disk
+    cache = ResponseCache(ttl=10, disk_dir=str(tmp_path))
+    assert cache.get("key") == [1, 2]
+    assert cache.stats()["diskHits"] == 1
+
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    cache._remove_expired()
+    assert list(tmp_path.iterdir()) == []
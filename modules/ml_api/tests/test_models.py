@@ -0,0 +1,18 @@
+import pytest
+from pydantic import ValidationError
+
+from modules.ml_api.models import CompareEntry, CompareManyEntry
+
+PAIR = {"mode": "text", "content": "a"}
+
+
+def test_compare_entry_has_two_pairs():
+    assert len(CompareEntry(pairs=[PAIR, PAIR]).pairs) == 2
+    for pairs in ([], [PAIR], [PAIR] * 3):
+        with pytest.raises(ValidationError):
+            CompareEntry(pairs=pairs)
+
+
+def test_compare_many_entry_rejects_invalid_comparison():
+    with pytest.raises(ValidationError):
+        CompareManyEntry(comparisons=[{"pairs": [PAIR, PAIR]}, {"pairs": [PAIR]}])
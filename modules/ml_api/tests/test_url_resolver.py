@@ -0,0 +1,47 @@
+from modules.ml.document_store.sql import SQLDocumentStore
+from modules.ml_api.url_resolver import UrlResolver, normalize_url
+
+
+def _resolver(tmp_path):
+    document_store = SQLDocumentStore(f"sqlite:///{tmp_path / 'test.db'}")
+    document_store.write_documents(
+        [
+            {"id": "a", "text": "a", "meta": {"href": "https://vnexpress.net/bai-a"}},
+            {"id": "b", "text": "b", "meta": {"url": "http://www.tuoitre.vn/bai-b/"}},
+            {"id": "c", "text": "c", "meta": {"href": ""}},
+        ]
+    )
+    return UrlResolver(document_store.engine)
+
+
+def test_normalize_url():
+    assert normalize_url("HTTPS://www.VnExpress.net/bai-a/?utm_source=fb#top") == (
+        "vnexpress.net/bai-a"
+    )
+    assert normalize_url(" ") == ""
+
+
+def test_resolve_exact(tmp_path):
+    resolver = _resolver(tmp_path)
+    assert resolver.resolve("https://vnexpress.net/bai-a") == "a"
+    # Stored with another scheme, host prefix and trailing slash
+    assert resolver.resolve("https://tuoitre.vn/bai-b") == "b"
+    assert resolver.resolve("vnexpress.net/bai-a?utm_source=fb") == "a"
+    # The fuzzy index is only built when exact lookups fail
+    assert resolver._built_at is None
+
+
+def test_resolve_fuzzy(tmp_path):
+    resolver = _resolver(tmp_path)
+    assert resolver.resolve("https://vnexpress.net/bai-aa") == "a"
+    assert resolver.resolve("tuoitre.vn/bai-c") == "b"
+    assert resolver.resolve("https://dantri.com.vn/bai-c") is None
+
+
+def test_resolve_blank_url(tmp_path):
+    resolver = _resolver(tmp_path)
+    resolver.refresh()
+    # Blank stored urls are not indexed
+    assert resolver._document_ids == ["b", "a"]
+    assert resolver.resolve("") is None
+    assert resolver.resolve(" ") is None
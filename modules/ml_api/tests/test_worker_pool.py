@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from modules.ml_api.worker_pool import BoundedProcessPool, PoolBusyError
+
+
+def _fail():
+    raise RuntimeError("task failed")
+
+
+def _square(x):
+    return x * x
+
+
+@pytest.fixture
+def pool():
+    pool = BoundedProcessPool(max_workers=1, max_pending=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_slot_released_when_task_fails(pool):
+    with pytest.raises(RuntimeError):
+        asyncio.run(pool.run(_fail))
+    assert not pool.is_busy
+    assert asyncio.run(pool.run(_square, 3)) == 9
+
+
+def test_request_slot_released_when_task_fails(pool):
+    async def request():
+        slot = pool.acquire()
+        try:
+            return await pool.run(_fail, slot=slot)
+        finally:
+            slot.release()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(request())
+    assert not pool.is_busy
+
+
+def test_busy_pool_rejects_requests(pool):
+    slot = pool.acquire()
+    with pytest.raises(PoolBusyError):
+        pool.acquire()
+    slot.release()
+    slot.release()
+    assert pool._pending == 0
@@ -0,0 +1,182 @@
+import bisect
+import threading
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from sqlalchemy import bindparam, text
+
+from modules.ml.constants import META_MAPPING
+from modules.ml.utils import get_logger
+
+logger = get_logger()
+
+# Number of neighbours in the sorted url index compared for fuzzy matching
+FUZZY_CANDIDATES = 10
+
+
+def normalize_url(url: str) -> str:
+    """Normalizes an article url for lookup: drops scheme, "www.", fragment,
+    tracking parameters and trailing slashes, and lowercases the host.
+    """
+    parts = urlsplit(url.strip() if "//" in url else "//" + url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[len("www.") :]
+    query = urlencode(
+        [
+            (k, v)
+            for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if not k.lower().startswith("utm_")
+        ]
+    )
+    normalized = host + parts.path.rstrip("/")
+    return f"{normalized}?{query}" if query else normalized
+
+
+def url_variants(url: str) -> List[str]:
+    """Returns the spellings of `url` an article could be stored with"""
+    normalized = normalize_url(url)
+    variants = {url.strip()}
+    for scheme in ("https://", "http://"):
+        for host_prefix in ("", "www."):
+            for suffix in ("", "/"):
+                variants.add(scheme + host_prefix + normalized + suffix)
+    return sorted(variants)
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Levenshtein distance of `a` and `b`, or `max_distance` + 1 if it is larger"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class UrlResolver:
+    """Resolves article urls to document ids.
+
+    Urls are first looked up exactly, through the index on `meta.value`, in all the
+    spellings they could be stored with. Otherwise the closest stored url is searched
+    among the neighbours of the normalized url in a sorted in-process index, which
+    is rebuilt from the document store every `refresh_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        engine,
+        max_edit_ratio: float = 0.25,
+        refresh_interval: float = 600,
+    ):
+        """
+        Attributes:
+            engine (sqlalchemy.engine.Engine): Engine of the document store.
+            max_edit_ratio (float, optional): Maximum edit distance of a fuzzy match,
+                relative to the length of the stored url. Defaults to 0.25.
+            refresh_interval (float, optional): Seconds after which the fuzzy index
+                is rebuilt. Defaults to 600.
+        """
+        self.engine = engine
+        self.max_edit_ratio = max_edit_ratio
+        self.refresh_interval = refresh_interval
+
+        self._urls: List[str] = []
+        self._document_ids: List[str] = []
+        self._built_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def resolve(self, url: str) -> Optional[str]:
+        """Returns the id of the document stored with `url`, or None if not found"""
+        # Blank urls would match documents stored with a blank url
+        if not normalize_url(url):
+            return None
+        return self._resolve_exact(url) or self._resolve_fuzzy(url)
+
+    def _resolve_exact(self, url: str) -> Optional[str]:
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text(
+                    "SELECT document_id FROM meta "
+                    "WHERE name IN :names AND value IN :urls LIMIT 1"
+                ).bindparams(
+                    bindparam("names", expanding=True),
+                    bindparam("urls", expanding=True),
+                ),
+                names=META_MAPPING["url"],
+                urls=url_variants(url),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _resolve_fuzzy(self, url: str) -> Optional[str]:
+        if self._built_at is None:
+            self.refresh()
+        elif time.time() - self._built_at > self.refresh_interval:
+            self._refresh_in_background()
+
+        urls, document_ids = self._urls, self._document_ids
+        normalized = normalize_url(url)
+        position = bisect.bisect_left(urls, normalized)
+
+        best: Tuple[float, Optional[str]] = (float("inf"), None)
+        for i in range(
+            max(0, position - FUZZY_CANDIDATES),
+            min(len(urls), position + FUZZY_CANDIDATES),
+        ):
+            max_distance = int(len(urls[i]) * self.max_edit_ratio)
+            distance = edit_distance(normalized, urls[i], max_distance)
+            if distance <= max_distance and distance / len(urls[i]) < best[0]:
+                best = (distance / len(urls[i]), document_ids[i])
+        return best[1] if best[0] < self.max_edit_ratio else None
+
+    def refresh(self):
+        """Rebuilds the sorted index of normalized urls from the document store"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT document_id, value FROM meta WHERE name IN :names"
+                ).bindparams(bindparam("names", expanding=True)),
+                names=META_MAPPING["url"],
+            ).fetchall()
+
+        index = []
+        for document_id, value in rows:
+            url = normalize_url(value or "")
+            # Blank urls normalize to "", which can't be matched
+            if url:
+                index.append((url, document_id))
+        index.sort()
+        with self._lock:
+            self._urls = [url for url, _ in index]
+            self._document_ids = [document_id for _, document_id in index]
+            self._built_at = time.time()
+        logger.info(f"Url index rebuilt with {len(index)} urls")
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Rebuilding url index failed: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
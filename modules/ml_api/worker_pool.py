@@ -0,0 +1,119 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class PoolBusyError(Exception):
+    """Raised when a pool has no free slot for another task"""
+
+
+class Slot:
+    """Slot of a `BoundedProcessPool`, taken until the request owning it releases it
+    and every task it ran in the pool has finished.
+    """
+
+    def __init__(self, pool: "BoundedProcessPool"):
+        self.pool = pool
+        self._holders = 1
+        self._released = False
+        self._lock = threading.Lock()
+
+    def hold(self):
+        """Keeps the slot taken until `unhold` is called"""
+        with self._lock:
+            self._holders += 1
+
+    def unhold(self):
+        with self._lock:
+            self._holders -= 1
+            free = self._holders == 0
+        if free:
+            self.pool._free_slot()
+
+    def release(self):
+        """Releases the slot on behalf of its owner, only the first call counts"""
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.unhold()
+
+
+class BoundedProcessPool:
+    """Process pool accepting at most `max_pending` requests at a time.
+
+    Requests beyond that are rejected with `PoolBusyError` instead of being queued,
+    so that a burst of long articles cannot stall every other request. A request
+    keeps its slot until the tasks it ran have finished in the processes, even if
+    it stopped waiting for them. The processes are started lazily, i.e. after the
+    server has forked its workers.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 8):
+        """
+        Attributes:
+            max_workers (int, optional): Number of processes. Defaults to 2.
+            max_pending (int, optional): Maximum number of requests whose tasks are
+                running or waiting for a process. Defaults to 8.
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    @property
+    def is_busy(self) -> bool:
+        return self._pending >= self.max_pending
+
+    def acquire(self) -> Slot:
+        """Reserves a slot, raises `PoolBusyError` if all slots are taken"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PoolBusyError(f"{self._pending} requests are already pending")
+            self._pending += 1
+        return Slot(self)
+
+    def _free_slot(self):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable, *args, slot: Optional[Slot] = None) -> Any:
+        """Runs `fn(*args)` in a process of the pool without blocking the event loop.
+
+        Args:
+            slot (Slot, optional): Slot of the request running the task, which stays
+                taken until the task has finished. Defaults to a slot of its own,
+                released when the task has finished.
+
+        Raises:
+            PoolBusyError: If no slot is given and all slots are taken.
+        """
+        own_slot = slot is None
+        if own_slot:
+            slot = self.acquire()
+        slot.hold()
+        if own_slot:
+            slot.release()
+        try:
+            future: Future = self.executor.submit(fn, *args)
+        except BaseException:
+            slot.unhold()
+            raise
+        # Called when the task has finished in its process, or was cancelled before
+        # it started, not when the caller stops waiting
+        future.add_done_callback(lambda _: slot.unhold())
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None